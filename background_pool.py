@@ -0,0 +1,107 @@
+import os
+import random
+import numpy as np
+
+from PIL import Image
+
+class BackgroundPool(object):
+    """
+        Keep a few large gaussian noise and quasicrystal textures in memory and hand out random
+        crops of them, instead of creating a new background for every sample. Plain white
+        backgrounds are cheap and are not pooled.
+    """
+
+    def __init__(self, size=4, height=128, width=2048, refresh_rate=0, cache_dir=None, seed=None):
+        """
+            size         : number of textures kept per background type
+            height/width : size of the textures, crops larger than that get a fresh background
+            refresh_rate : replace one texture every refresh_rate crops (0 never refreshes)
+            cache_dir    : when set, textures are loaded from / saved to this directory
+            seed         : when set, every process builds the same textures. It cannot be used with
+                           refresh_rate, the refreshed textures depend on the crops made before
+        """
+
+        if seed is not None and refresh_rate > 0:
+            raise ValueError('A seeded background pool cannot be refreshed')
+
+        self.size = size
+        self.height = height
+        self.width = width
+        self.refresh_rate = refresh_rate
+        self.cache_dir = cache_dir
+        self.crop_count = 0
+        self.seed = seed
+        self.rng = random.Random(seed) if seed is not None else random
+        self.textures = {
+            background_type: [self._load_texture(background_type, i) for i in range(size)]
+            for background_type in (0, 2)
+        }
+
+    def _create_texture(self, background_type, rng=None):
+        # Imported here, generator.py imports this module
+        from generator import create_gaussian_noise_background, create_quasicrystal_background
+
+        if background_type == 0:
+            background = create_gaussian_noise_background(self.height, self.width, rng)
+        else:
+            background = create_quasicrystal_background(self.height, self.width, rng)
+        return np.asarray(background, dtype=np.uint8)
+
+    def _load_texture(self, background_type, i):
+        from generator import sample_seed
+
+        rng = random.Random(sample_seed(self.seed, i, 'background_{}'.format(background_type))) if self.seed is not None else None
+
+        if self.cache_dir is None:
+            return self._create_texture(background_type, rng)
+
+        path = os.path.join(
+            self.cache_dir, 'background_{}_{}_{}x{}.npy'.format(background_type, i, self.height, self.width)
+        )
+        if os.path.exists(path):
+            return np.load(path)
+
+        texture = self._create_texture(background_type, rng)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write then rename so that concurrent workers never read a partial file
+        tmp_path = '{}.{}.tmp.npy'.format(path[:-4], os.getpid())
+        np.save(tmp_path, texture)
+        os.replace(tmp_path, path)
+        return texture
+
+    def get(self, background_type, height, width, rng=None):
+        """
+            Return a randomly cropped and flipped 'L' background of the requested size,
+            or None when the pool cannot provide it. The crop is drawn from rng when given.
+        """
+
+        crop = self.get_array(background_type, height, width, rng)
+        return Image.fromarray(crop, 'L') if crop is not None else None
+
+    def get_array(self, background_type, height, width, rng=None):
+        """
+            Same as get, as a new uint8 array of shape (height, width)
+        """
+
+        if background_type not in self.textures or height > self.height or width > self.width:
+            return None
+
+        rand = rng if rng is not None else random
+        textures = self.textures[background_type]
+
+        self.crop_count += 1
+        if self.refresh_rate > 0 and self.crop_count % self.refresh_rate == 0:
+            textures[self.rng.randrange(len(textures))] = self._create_texture(background_type, self.rng)
+
+        texture = textures[rand.randrange(len(textures))]
+        top = rand.randint(0, self.height - height)
+        left = rand.randint(0, self.width - width)
+        crop = texture[top:top + height, left:left + width]
+
+        if rand.random() < 0.5:
+            crop = crop[:, ::-1]
+        if rand.random() < 0.5:
+            crop = crop[::-1, :]
+
+        # Copy the crop, the sample is pasted onto the background afterwards
+        return np.array(crop)
@@ -0,0 +1,617 @@
+import argparse
+import math
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+import requests
+
+import cv2
+import numpy as np
+
+from bs4 import BeautifulSoup
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+from generator import quasicrystal, create_sample, create_sample_array, encode_sample
+from noise_batch import NoiseBatch
+from encoders import Encoder
+from online_dataset import OnlineDataset
+from run import load_dict, iter_strings_from_dict, iter_strings_from_wikipedia
+from generator import sample_seed
+from wikipedia_source import extract_sentences
+
+def parse_arguments():
+    """
+        Parse the command line arguments of the program.
+    """
+
+    parser = argparse.ArgumentParser(description='Benchmark parts of the generation pipeline.')
+    subparsers = parser.add_subparsers(dest='command')
+
+    quasicrystal_parser = subparsers.add_parser(
+        'quasicrystal',
+        help='Compare the numpy quasicrystal background with the original per pixel loop',
+    )
+    quasicrystal_parser.add_argument(
+        "-s",
+        "--sizes",
+        type=str,
+        nargs="+",
+        help="The background sizes to benchmark, as HEIGHTxWIDTH",
+        default=['42x400', '74x800'],
+    )
+    quasicrystal_parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        nargs="?",
+        help="The number of backgrounds to create per size",
+        default=3,
+    )
+
+    noise_parser = subparsers.add_parser(
+        'noise',
+        help='Compare the batched uint8 Gaussian noise with the original float64 background',
+    )
+    noise_parser.add_argument(
+        "-s",
+        "--sizes",
+        type=str,
+        nargs="+",
+        help="The background sizes to benchmark, as HEIGHTxWIDTH",
+        default=['52x410', '84x800'],
+    )
+    noise_parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        nargs="?",
+        help="The number of backgrounds to create per size",
+        default=1000,
+    )
+
+    parity_parser = subparsers.add_parser(
+        'parity',
+        help='Compare the numpy rendering engine with the PIL one on the same seeded samples',
+    )
+    parity_parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of samples to render per setting",
+        default=20,
+    )
+    parity_parser.add_argument(
+        "-b",
+        "--backgrounds",
+        type=int,
+        nargs="+",
+        help="The background types to compare",
+        default=[1, 0, 2],
+    )
+    parity_parser.add_argument(
+        "-e",
+        "--extension",
+        type=str,
+        nargs="?",
+        help="The image format the samples are encoded to",
+        default='jpg',
+    )
+    parity_parser.add_argument(
+        "-t",
+        "--text",
+        type=str,
+        nargs="?",
+        help="The text rendered, the sample index is appended to it",
+        default='Lorem ipsum 0123',
+    )
+
+    encode_parser = subparsers.add_parser(
+        'encode',
+        help='Compare the encode time and size per sample of the encoder choices',
+    )
+    encode_parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of samples encoded per choice",
+        default=200,
+    )
+    encode_parser.add_argument(
+        "-b",
+        "--background",
+        type=int,
+        nargs="?",
+        help="The background of the samples (the noise ones compress the worst)",
+        default=0,
+    )
+
+    online_parser = subparsers.add_parser(
+        'online',
+        help='Measure the producer and consumer rates of the online dataset, to size its workers',
+    )
+    online_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        nargs="?",
+        help="The number of worker processes",
+        default=2,
+    )
+    online_parser.add_argument(
+        "-q",
+        "--queue_depth",
+        type=int,
+        nargs="?",
+        help="The number of samples rendered ahead of the consumer",
+        default=256,
+    )
+    online_parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of samples to consume",
+        default=1000,
+    )
+    online_parser.add_argument(
+        "-d",
+        "--consumer_delay",
+        type=float,
+        nargs="?",
+        help="The time in milliseconds the simulated training step takes per sample",
+        default=0.0,
+    )
+    online_parser.add_argument(
+        "-l",
+        "--language",
+        type=str,
+        nargs="?",
+        help="The language dictionary the strings are built from",
+        default="fr",
+    )
+    online_parser.add_argument(
+        "-en",
+        "--engine",
+        type=str,
+        nargs="?",
+        help="The rendering engine of the workers (pil or numpy)",
+        default="numpy",
+    )
+
+    strings_parser = subparsers.add_parser(
+        'strings',
+        help='Compare the chunked NumPy dictionary strings with the original per word loop',
+    )
+    strings_parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of strings to make",
+        default=200000,
+    )
+    strings_parser.add_argument(
+        "-w",
+        "--length",
+        type=int,
+        nargs="+",
+        help="The numbers of words per string to benchmark",
+        default=[1, 5, 10],
+    )
+    strings_parser.add_argument(
+        "-l",
+        "--language",
+        type=str,
+        nargs="?",
+        help="The language dictionary the strings are built from",
+        default="fr",
+    )
+
+    wikipedia_parser = subparsers.add_parser(
+        'wikipedia',
+        help='Compare the concurrent Wikipedia source with the original one against a local stand-in server',
+    )
+    wikipedia_parser.add_argument(
+        "-c",
+        "--count",
+        type=int,
+        nargs="?",
+        help="The number of sentences to get",
+        default=500,
+    )
+    wikipedia_parser.add_argument(
+        "-d",
+        "--latency",
+        type=float,
+        nargs="?",
+        help="The time in milliseconds the stand-in server takes to answer a page",
+        default=100.0,
+    )
+    wikipedia_parser.add_argument(
+        "-wc",
+        "--concurrency",
+        type=int,
+        nargs="?",
+        help="The number of pages fetched at the same time",
+        default=8,
+    )
+
+    return parser.parse_args()
+
+def quasicrystal_reference(height, width, frequency, phase, rotation_count):
+    """
+        The original pure Python quasicrystal loop, kept as a reference for the benchmark
+    """
+
+    image = Image.new("L", (width, height))
+    pixels = image.load()
+
+    for kw in range(width):
+        y = float(kw) / (width - 1) * 4 * math.pi - 2 * math.pi
+        for kh in range(height):
+            x = float(kh) / (height - 1) * 4 * math.pi - 2 * math.pi
+            z = 0.0
+            for i in range(rotation_count):
+                r = math.hypot(x, y)
+                a = math.atan2(y, x) + i * math.pi * 2.0 / rotation_count
+                z += math.cos(r * math.sin(a) * frequency + phase)
+            c = int(255 - round(255 * z / rotation_count))
+            pixels[kw, kh] = c # grayscale
+    return np.asarray(image)
+
+def benchmark_quasicrystal(sizes, repeat):
+    """
+        Time both quasicrystal implementations and check that they produce the same pixels
+    """
+
+    frequency, phase, rotation_count = 35.0, 1.5, 15
+
+    print('{:>10} {:>12} {:>12} {:>9} {:>10}'.format('size', 'loop (ms)', 'numpy (ms)', 'speedup', 'identical'))
+    for size in sizes:
+        height, width = [int(v) for v in size.lower().split('x')]
+
+        reference = quasicrystal_reference(height, width, frequency, phase, rotation_count)
+        vectorized = quasicrystal(height, width, frequency, phase, rotation_count)
+
+        loop_time = timeit.timeit(
+            lambda: quasicrystal_reference(height, width, frequency, phase, rotation_count), number=repeat
+        ) / repeat
+        numpy_time = timeit.timeit(
+            lambda: quasicrystal(height, width, frequency, phase, rotation_count), number=repeat
+        ) / repeat
+
+        print('{:>10} {:>12.2f} {:>12.2f} {:>8.1f}x {:>10}'.format(
+            size,
+            loop_time * 1000,
+            numpy_time * 1000,
+            loop_time / numpy_time,
+            str(np.array_equal(reference, vectorized))
+        ))
+
+def gaussian_noise_reference(height, width):
+    """
+        The original float64 Gaussian noise background, kept as a reference for the benchmark
+    """
+
+    image = np.ones((height, width)) * 255
+    cv2.randn(image, 235, 10)
+    return Image.fromarray(image).convert('L')
+
+def benchmark_noise(sizes, repeat):
+    """
+        Time the creation of Gaussian noise backgrounds, one float64 image per sample against
+        views of a batched uint8 buffer
+    """
+
+    noise_batch = NoiseBatch()
+
+    print('{:>10} {:>14} {:>14} {:>9}'.format('size', 'float64 (us)', 'batched (us)', 'speedup'))
+    for size in sizes:
+        height, width = [int(v) for v in size.lower().split('x')]
+
+        reference_time = timeit.timeit(lambda: gaussian_noise_reference(height, width), number=repeat) / repeat
+        batched_time = timeit.timeit(lambda: noise_batch.get(height, width), number=repeat) / repeat
+
+        print('{:>10} {:>14.1f} {:>14.1f} {:>8.1f}x'.format(
+            size,
+            reference_time * 1e6,
+            batched_time * 1e6,
+            reference_time / batched_time
+        ))
+
+def strings_from_dict_reference(length, allow_variable, count, lang_dict, seed=None):
+    """
+        The original per word loop of iter_strings_from_dict, kept as a reference for the benchmark
+    """
+
+    dict_len = len(lang_dict)
+    for i in range(0, count):
+        rand = random.Random(sample_seed(seed, i, 'text')) if seed is not None else random
+        current_string = ""
+        for _ in range(0, rand.randint(1, length) if allow_variable else length):
+            current_string += lang_dict[rand.randrange(dict_len)][:-1]
+            current_string += ' '
+        yield current_string[:-1]
+
+def benchmark_strings(count, lengths, language):
+    """
+        Time making count dictionary strings, seeded and unseeded, with the original loop and in chunks
+    """
+
+    lang_dict = load_dict(language)
+    # The original loop cuts the line break off every line itself
+    with open(os.path.join('dicts', language + '.txt'), 'r') as d:
+        lines = d.readlines()
+
+    print('{:>6} {:>7} {:>9} {:>15} {:>15} {:>9}'.format('words', 'seeded', 'variable', 'original (us)', 'chunked (us)', 'speedup'))
+    for length in lengths:
+        for seed in (None, 0):
+            for allow_variable in (False, True):
+                reference_time = timeit.timeit(
+                    lambda: list(strings_from_dict_reference(length, allow_variable, count, lines, seed)), number=1
+                ) / count
+                chunked_time = timeit.timeit(
+                    lambda: list(iter_strings_from_dict(length, allow_variable, count, lang_dict, 0, seed)), number=1
+                ) / count
+
+                print('{:>6} {:>7} {:>9} {:>15.2f} {:>15.2f} {:>8.1f}x'.format(
+                    length,
+                    'yes' if seed is not None else 'no',
+                    'yes' if allow_variable else 'no',
+                    reference_time * 1e6,
+                    chunked_time * 1e6,
+                    reference_time / chunked_time
+                ))
+
+# (extension, channels, backend, quality, png compression) of every encoder choice
+ENCODER_CHOICES = [
+    ('jpg', 3, 'pil', 75, None),
+    ('jpg', 1, 'pil', 75, None),
+    ('jpg', 3, 'cv2', 75, None),
+    ('jpg', 1, 'cv2', 75, None),
+    ('jpg', 1, 'cv2', 90, None),
+    ('png', 3, 'pil', None, None),
+    ('png', 1, 'pil', None, None),
+    ('png', 1, 'cv2', None, 1),
+    ('png', 1, 'cv2', None, 9),
+    ('webp', 1, 'pil', 80, None),
+    ('webp', 1, 'cv2', 80, None),
+    ('npy', 1, None, None, None),
+]
+
+def benchmark_encode(count, background):
+    """
+        Encode the same samples with every encoder choice, report the time and bytes per sample
+    """
+
+    fonts = sorted(os.listdir('fonts'))
+    images = [
+        create_sample('Lorem ipsum {}'.format(i), fonts[i % len(fonts)], 32, 5, True, 1, True, background, seed=i)
+        for i in range(count)
+    ]
+    arrays = [np.asarray(image) for image in images]
+
+    print('{:>6} {:>9} {:>8} {:>8} {:>6} {:>12} {:>13} {:>11}'.format(
+        'format', 'channels', 'backend', 'quality', 'level', 'encode (us)', 'bytes/sample', 'samples/s'
+    ))
+    for extension, channels, backend, quality, png_compression in ENCODER_CHOICES:
+        encoder = Encoder(channels, backend, quality, png_compression)
+        # Each backend gets the input it is fastest with
+        inputs = arrays if backend == 'cv2' else images
+        encoded = [encoder.encode(image, extension) for image in inputs]
+        seconds = timeit.timeit(lambda: [encoder.encode(image, extension) for image in inputs], number=1) / count
+
+        print('{:>6} {:>9} {:>8} {:>8} {:>6} {:>12.1f} {:>13.0f} {:>11.0f}'.format(
+            extension,
+            channels,
+            backend or '-',
+            quality if quality is not None else '-',
+            png_compression if png_compression is not None else '-',
+            seconds * 1e6,
+            sum(len(data) for data in encoded) / count,
+            1 / seconds
+        ))
+
+def benchmark_parity(count, backgrounds, extension, text):
+    """
+        Render the same seeded samples with both engines, report the time per encoded sample
+        and how far apart the pixels are (mean and maximum absolute difference, over 255)
+    """
+
+    fonts = sorted(os.listdir('fonts'))
+    settings = [(0, 0), (10, 0), (0, 2), (10, 2)]
+
+    print('{:>10} {:>6} {:>6} {:>10} {:>12} {:>9} {:>10} {:>9}'.format(
+        'background', 'skew', 'blur', 'pil (ms)', 'numpy (ms)', 'speedup', 'mean diff', 'max diff'
+    ))
+    for background in backgrounds:
+        for skew, blur in settings:
+            samples = [
+                ('{} {}'.format(text, i), fonts[i % len(fonts)], 32, skew, True, blur, True, background)
+                for i in range(count)
+            ]
+
+            # Load the fonts and atlases outside of the timings
+            create_sample(*samples[0], seed=0)
+            create_sample_array(*samples[0], seed=0)
+
+            pil_time = timeit.timeit(
+                lambda: [encode_sample(create_sample(*sample, seed=i), extension) for i, sample in enumerate(samples)],
+                number=1
+            ) / count
+            numpy_time = timeit.timeit(
+                lambda: [encode_sample(create_sample_array(*sample, seed=i), extension) for i, sample in enumerate(samples)],
+                number=1
+            ) / count
+
+            mean_diffs, max_diff = [], 0
+            for i, sample in enumerate(samples):
+                reference = np.asarray(create_sample(*sample, seed=i), dtype=np.int16)
+                diff = np.abs(reference - create_sample_array(*sample, seed=i))
+                mean_diffs.append(diff.mean())
+                max_diff = max(max_diff, int(diff.max()))
+
+            print('{:>10} {:>6} {:>6} {:>10.2f} {:>12.2f} {:>8.1f}x {:>10.2f} {:>9}'.format(
+                background,
+                skew,
+                blur,
+                pil_time * 1000,
+                numpy_time * 1000,
+                pil_time / numpy_time,
+                float(np.mean(mean_diffs)),
+                max_diff
+            ))
+
+def benchmark_online(workers, queue_depth, count, consumer_delay, language, engine):
+    """
+        Consume samples of an online dataset with a simulated training step and report the rates
+    """
+
+    dataset = OnlineDataset(lang_dict=load_dict(language), params={'engine': engine}, workers=workers,
+                            queue_depth=queue_depth, seed=0)
+    with dataset:
+        for i in range(count):
+            dataset.get()
+            if consumer_delay > 0:
+                time.sleep(consumer_delay / 1000.0)
+            if (i + 1) % max(count // 4, 1) == 0:
+                print(dataset.format_stats())
+
+class WikipediaStandIn(BaseHTTPRequestHandler):
+    """
+        Answer like Wikipedia: Special:Random redirects to a new article, articles are made up
+        pages with scripts, styles, entities and a contributing footer
+    """
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+    counter = 0
+    lock = threading.Lock()
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        if self.path.endswith('/Special:Random'):
+            with self.lock:
+                WikipediaStandIn.counter += 1
+                number = WikipediaStandIn.counter
+            self.send_response(302)
+            self.send_header('Location', '/wiki/Article_{}'.format(number))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        number = int(self.path.rsplit('_', 1)[1])
+        lines = ['<p>Article {} sentence {} is about the <a href="/wiki/X">caf&eacute; d\'&Eacute;t&eacute;</a> '
+                 'and its 3 neighbours, over and over again.</p>'.format(number, i) for i in range(30)]
+        page = '\n'.join(
+            ['<html><head><title>Article {} - Wikipedia</title>'.format(number),
+             '<style>p { margin: 0 }</style>', '<script>var words = "one two three four five";</script></head><body>']
+            + lines
+            + ['<!-- a comment with a few words in it -->', '<p>Text is available under a license, see the terms of use here</p>'] * 6
+            + ['</body></html>']
+        ).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(page)))
+        self.end_headers()
+        self.wfile.write(page)
+
+    def log_message(self, format, *args):
+        pass
+
+def wikipedia_reference(minimum_length, count, base_url):
+    """
+        The original create_strings_from_wikipedia: one page at a time, parsed with html.parser
+    """
+
+    sentences = []
+
+    while len(sentences) < count:
+        page = requests.get(base_url + '/wiki/Special:Random')
+
+        soup = BeautifulSoup(page.text, 'html.parser')
+
+        for script in soup(["script", "style"]):
+            script.extract()
+
+        lines = list(filter(
+            lambda s:
+                len(s.split(' ')) > minimum_length
+                and not "Wikipedia" in s
+                and not "wikipedia" in s,
+            [
+                ' '.join(re.findall(r"[\w']+", s.strip()))[0:200] for s in soup.get_text().splitlines()
+            ]
+        ))
+
+        sentences.extend(lines[0:max([1, len(lines) - 5])])
+
+    return sentences[0:count]
+
+def benchmark_wikipedia(count, latency, concurrency):
+    """
+        Get count sentences from a local stand-in of Wikipedia with the original source, then with
+        the concurrent one (filling an empty cache) and once more from that cache
+    """
+
+    WikipediaStandIn.latency = latency / 1000.0
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WikipediaStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = 'http://127.0.0.1:{}'.format(server.server_address[1])
+    cache_dir = tempfile.mkdtemp()
+
+    try:
+        page = requests.get(base_url + '/wiki/Special:Random').text
+        soup = BeautifulSoup(page, 'html.parser')
+        for script in soup(["script", "style"]):
+            script.extract()
+        reference_lines = [' '.join(re.findall(r"[\w']+", s.strip()))[0:200] for s in soup.get_text().splitlines()]
+        reference_lines = [s for s in reference_lines if len(s.split(' ')) > 1 and not 'Wikipedia' in s]
+        print('same sentences as html.parser:', reference_lines[0:max([1, len(reference_lines) - 5])] == extract_sentences(page, 1))
+
+        for name, run in (
+            ('original', lambda: wikipedia_reference(1, count, base_url)),
+            ('concurrent', lambda: list(iter_strings_from_wikipedia(1, count, 'en', concurrency, cache_dir, base_url))),
+            ('cached', lambda: list(iter_strings_from_wikipedia(1, count, 'en', concurrency, cache_dir, base_url))),
+        ):
+            start = time.time()
+            sentences = run()
+            seconds = time.time() - start
+            print('{:>10}: {} sentences in {:.2f}s ({:.0f} sentences/s)'.format(name, len(sentences), seconds, len(sentences) / seconds))
+    finally:
+        server.shutdown()
+        shutil.rmtree(cache_dir)
+
+def main():
+    """
+        Description: Main function
+    """
+
+    args = parse_arguments()
+
+    if args.command == 'quasicrystal':
+        benchmark_quasicrystal(args.sizes, args.repeat)
+    elif args.command == 'noise':
+        benchmark_noise(args.sizes, args.repeat)
+    elif args.command == 'encode':
+        benchmark_encode(args.count, args.background)
+    elif args.command == 'online':
+        benchmark_online(args.workers, args.queue_depth, args.count, args.consumer_delay, args.language, args.engine)
+    elif args.command == 'strings':
+        benchmark_strings(args.count, args.length, args.language)
+    elif args.command == 'wikipedia':
+        benchmark_wikipedia(args.count, args.latency, args.concurrency)
+    elif args.command == 'parity':
+        benchmark_parity(args.count, args.backgrounds, args.extension, args.text)
+    else:
+        print('Nothing to benchmark, see python benchmark.py -h')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+import os
+import time
+
+def load_checkpoint(path):
+    """
+        Return the set of keys recorded as finished in a checkpoint file (empty if it does not exist).
+        A last line cut short by a crash is ignored.
+    """
+
+    if not os.path.exists(path):
+        return set()
+    with open(path, 'r') as f:
+        lines = f.read().split('\n')
+    # Every complete line ends with a newline, so the last element is '' or a partial line
+    return set(line for line in lines[:-1] if line)
+
+def _cut_partial_line(path):
+    """
+        Truncate a checkpoint file after its last newline, so that the keys appended to it do
+        not continue a line cut short by a crash (a partial '1' followed by '2' would read '12')
+    """
+
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        data = f.read()
+        if data and not data.endswith(b'\n'):
+            f.truncate(data.rfind(b'\n') + 1)
+
+class Checkpoint(object):
+    """
+        Append the keys of the finished samples to a checkpoint file, one per line, as they
+        complete. The lines are flushed to disk every flush_count samples or flush_seconds,
+        so a run that dies loses at most that much progress when it is resumed.
+    """
+
+    def __init__(self, path, resume=False, flush_count=1000, flush_seconds=10.0):
+        """
+            path          : the checkpoint file
+            resume        : append to the existing file instead of starting a new one
+            flush_count   : flush after this many samples
+            flush_seconds : or after this many seconds
+        """
+
+        self.path = path
+        if resume:
+            _cut_partial_line(path)
+        self.file = open(path, 'a' if resume else 'w')
+        self.flush_count = flush_count
+        self.flush_seconds = flush_seconds
+        self.pending = 0
+        self.last_flush = time.time()
+
+    def done(self, key):
+        self.file.write('{}\n'.format(key))
+        self.pending += 1
+        if self.pending >= self.flush_count or time.time() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.pending = 0
+        self.last_flush = time.time()
+
+    def close(self):
+        self.flush()
+        self.file.close()
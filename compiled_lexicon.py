@@ -0,0 +1,231 @@
+import argparse
+import mmap
+import os
+import struct
+import numpy as np
+
+from collections.abc import Sequence
+
+MAGIC = b'TRDGLEX1'
+# magic, word count, blob size, source size, source mtime (ns), flags
+_HEADER = struct.Struct('<8sQQQqQ')
+_HAS_WEIGHTS = 1
+_WIDE_OFFSETS = 2
+
+def lexicon_path(source):
+    """
+        Path of the compiled lexicon of a text dictionary: dicts/fr.txt -> dicts/fr.lex
+    """
+
+    return os.path.splitext(source)[0] + '.lex'
+
+def _align(position):
+    return (position + 7) // 8 * 8
+
+def compile_lexicon(source, path=None, weighted=False):
+    """
+        Compile a text dictionary (one word per line) into a binary lexicon: a header, the offsets
+        of the words (uint32, or uint64 past 4 GiB of words), their float32 weights if any and the
+        UTF-8 words one after the other. With weighted, every line is a word and its frequency
+        separated by a tab.
+    """
+
+    path = path or lexicon_path(source)
+    # Split on line breaks only, like load_dict's readlines (splitlines also breaks on \x1c, \u2028...)
+    with open(source, 'r') as f:
+        lines = [line.rstrip('\n') for line in f]
+    stat = os.stat(source)
+
+    weights = None
+    if weighted:
+        pairs = [line.rsplit('\t', 1) for line in lines]
+        lines = [pair[0] for pair in pairs]
+        weights = np.array([float(pair[1]) if len(pair) == 2 else 1.0 for pair in pairs], dtype=np.float32)
+
+    encoded = [line.encode() for line in lines]
+    blob = b''.join(encoded)
+    flags = _WIDE_OFFSETS if len(blob) >= 2 ** 32 else 0
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64 if flags & _WIDE_OFFSETS else np.uint32)
+    np.cumsum([len(word) for word in encoded], out=offsets[1:])
+    if weights is not None:
+        flags |= _HAS_WEIGHTS
+
+    # Several processes may compile the same lexicon at once, each writes its own file
+    temp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, len(encoded), len(blob), stat.st_size, stat.st_mtime_ns, flags))
+        f.write(offsets.tobytes())
+        if weights is not None:
+            f.write(weights.tobytes())
+        f.write(b'\0' * (_align(f.tell()) - f.tell()))
+        f.write(blob)
+    os.replace(temp_path, path)
+    return path
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+    if len(header) < _HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return None
+    return _HEADER.unpack(header)
+
+def is_stale(source, path=None, weighted=None):
+    """
+        Whether the compiled lexicon of source is missing or was compiled from another version of
+        it (or, when weighted is given, with or without weights when it should not)
+    """
+
+    path = path or lexicon_path(source)
+    if not os.path.exists(path):
+        return True
+    header = _read_header(path)
+    if header is None:
+        return True
+    if weighted is not None and bool(header[5] & _HAS_WEIGHTS) != weighted:
+        return True
+    stat = os.stat(source)
+    return header[3] != stat.st_size or header[4] != stat.st_mtime_ns
+
+def load_lexicon(source, weighted=False):
+    """
+        Return the lexicon of a text dictionary, compiling it first when it is stale. When the
+        text file is missing, its compiled lexicon is used as is.
+    """
+
+    path = lexicon_path(source)
+    if os.path.exists(source) and is_stale(source, path, weighted):
+        compile_lexicon(source, path, weighted)
+    return Lexicon(path, source)
+
+class Lexicon(Sequence):
+    """
+        Read only list of the words of a compiled lexicon. The file is memory mapped, so opening
+        it takes no time whatever its size and the processes using it share its pages. Pickling
+        a lexicon (to send it to a worker) only sends its path.
+    """
+
+    def __init__(self, path, source=None):
+        """
+            path   : the compiled lexicon
+            source : (optional) its text dictionary, used when it is pickled
+        """
+
+        self.path = path
+        self.source = source
+        header = _read_header(path)
+        if header is None:
+            raise ValueError('{} is not a compiled lexicon'.format(path))
+        _, self.count, _, _, _, flags = header
+
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        offset_type = np.uint64 if flags & _WIDE_OFFSETS else np.uint32
+        self.offsets = np.frombuffer(self.data, dtype=offset_type, count=self.count + 1, offset=_HEADER.size)
+        position = _HEADER.size + self.offsets.nbytes
+        self.weights = None
+        if flags & _HAS_WEIGHTS:
+            self.weights = np.frombuffer(self.data, dtype=np.float32, count=self.count, offset=position)
+            position += self.weights.nbytes
+        self.blob_start = _align(position)
+        self.cumulative_weights = None
+
+    def __reduce__(self):
+        if self.source is not None:
+            return load_lexicon, (self.source, self.weights is not None)
+        return Lexicon, (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('word {} out of range'.format(i))
+        start = self.blob_start + int(self.offsets[i])
+        end = self.blob_start + int(self.offsets[i + 1])
+        return self.data[start:end].decode()
+
+    def join_rows(self, indices, counts=None):
+        """
+            Return one string per row of a 2D array of indices, made of the words of its first
+            counts[row] indices (all of them without counts) separated by spaces. The bytes of all
+            the words are gathered with NumPy and decoded at once.
+        """
+
+        indices = np.asarray(indices)
+        row_count, length = indices.shape
+        counts = np.full(row_count, length) if counts is None else np.asarray(counts)
+        keep = np.arange(length) < counts[:, None]
+        last = np.zeros(indices.shape, dtype=bool)
+        last[np.arange(row_count), counts - 1] = True
+
+        words = indices[keep]
+        separators = np.where(last[keep], ord('\n'), ord(' ')).astype(np.uint8)
+        starts = self.offsets[words].astype(np.int64)
+        lengths = self.offsets[words + 1].astype(np.int64) - starts
+
+        # Byte i of the concatenated words comes from the blob at the start of its word plus its
+        # position in it, and goes to the output after the separators of the words before it
+        word_starts = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum())
+        out = np.empty(len(positions) + len(words), dtype=np.uint8)
+        out[np.cumsum(lengths + 1) - 1] = separators
+        out[positions + np.repeat(np.arange(len(words)), lengths)] = self.blob()[positions + np.repeat(starts - word_starts, lengths)]
+        return out.tobytes().decode().split('\n')[:-1]
+
+    def blob(self):
+        return np.frombuffer(self.data, dtype=np.uint8, offset=self.blob_start)
+
+    def draw(self, rng, size):
+        """
+            Draw random word indices with a numpy Generator, following the weights when there are
+        """
+
+        if self.weights is None:
+            return rng.integers(0, self.count, size=size)
+        if self.cumulative_weights is None:
+            self.cumulative_weights = np.cumsum(self.weights, dtype=np.float64)
+        return np.searchsorted(self.cumulative_weights, rng.random(size) * self.cumulative_weights[-1], side='right')
+
+def main():
+    """
+        Description: Main function
+    """
+
+    parser = argparse.ArgumentParser(description='Compile text dictionaries into binary lexicons.')
+    parser.add_argument(
+        "sources",
+        type=str,
+        nargs="+",
+        help="The text dictionaries, one word per line",
+    )
+    parser.add_argument(
+        "-w",
+        "--weighted",
+        action="store_true",
+        help="When set, every line is a word and its frequency separated by a tab",
+        default=False,
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="When set, the lexicons are compiled even if they are up to date",
+        default=False,
+    )
+    args = parser.parse_args()
+
+    for source in args.sources:
+        if args.force or is_stale(source, weighted=args.weighted):
+            compile_lexicon(source, weighted=args.weighted)
+        lexicon = Lexicon(lexicon_path(source))
+        print('{}: {} words, {:.1f} MiB{}'.format(
+            lexicon_path(source), len(lexicon), os.path.getsize(lexicon_path(source)) / 1024 / 1024,
+            ', weighted' if lexicon.weights is not None else ''
+        ))
+
+if __name__ == '__main__':
+    main()
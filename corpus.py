@@ -0,0 +1,154 @@
+import mmap
+import os
+import numpy as np
+
+# Bytes scanned at once when looking for the line breaks
+_CHUNK_SIZE = 16 * 1024 * 1024
+
+def index_path(filename):
+    return filename + '.index.npy'
+
+def _line_breaks(data, size):
+    """
+        Yield the positions of the line breaks of data, one chunk at a time
+    """
+
+    for position in range(0, size, _CHUNK_SIZE):
+        chunk = np.frombuffer(data, dtype=np.uint8, count=min(_CHUNK_SIZE, size - position), offset=position)
+        breaks = np.flatnonzero(chunk == 10) + position
+        del chunk
+        yield breaks
+
+def has_text(data, size):
+    """
+        Return whether data holds anything but whitespace, one chunk at a time
+    """
+
+    whitespace = np.array([9, 10, 11, 12, 13, 32], dtype=np.uint8)
+    for position in range(0, size, _CHUNK_SIZE):
+        chunk = np.frombuffer(data, dtype=np.uint8, count=min(_CHUNK_SIZE, size - position), offset=position)
+        found = not np.isin(chunk, whitespace).all()
+        del chunk
+        if found:
+            return True
+    return False
+
+def build_line_index(data, size, path=None):
+    """
+        Return the int64 offsets of the starts of the lines of data followed by its size, so that
+        line i is data[offsets[i]:offsets[i + 1]]. With a path, the offsets are written there as
+        a .npy file (first counted, then filled chunk by chunk) and returned memory mapped.
+    """
+
+    count = sum(len(breaks) for breaks in _line_breaks(data, size))
+    # A last line without a line break still is a line
+    last_line = 1 if size > 0 and data[size - 1] != 10 else 0
+    length = count + last_line + 1
+
+    if path is None:
+        offsets = np.empty(length, dtype=np.int64)
+    else:
+        # Several processes may build the same index at once, each writes its own file
+        temp_path = '{}.{}.tmp'.format(path, os.getpid())
+        offsets = np.lib.format.open_memmap(temp_path, mode='w+', dtype=np.int64, shape=(length,))
+    offsets[0] = 0
+    filled = 1
+    for breaks in _line_breaks(data, size):
+        offsets[filled:filled + len(breaks)] = breaks + 1
+        filled += len(breaks)
+    offsets[-1] = size
+
+    if path is not None:
+        offsets.flush()
+        del offsets
+        os.replace(temp_path, path)
+        offsets = np.load(path, mmap_mode='r')
+    return offsets
+
+class Corpus(object):
+    """
+        Read the lines of a text file through a memory map, with an index of the offsets of its
+        lines cached next to it (file.txt.index.npy), so that any line is read in constant time and
+        the memory used does not depend on the size of the file. The index is rebuilt when the
+        file is newer than it or its size changed.
+    """
+
+    def __init__(self, filename, max_length=200):
+        """
+            filename   : the text file, one string per line
+            max_length : the lines are stripped and cut to this many characters
+        """
+
+        self.filename = filename
+        self.max_length = max_length
+        self.size = os.path.getsize(filename)
+        if self.size == 0:
+            raise Exception("No lines could be read in file")
+        with open(filename, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = self._load_index()
+        # Blank lines are kept, but a file of blank lines only has nothing to render
+        if len(self) == 0 or not has_text(self.data, self.size):
+            self.close()
+            raise Exception("No lines could be read in file")
+
+    def _load_index(self):
+        path = index_path(self.filename)
+        if os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(self.filename):
+            offsets = np.load(path, mmap_mode='r')
+            if len(offsets) > 1 and offsets[-1] == self.size:
+                return offsets
+        try:
+            return build_line_index(self.data, self.size, path)
+        except OSError:
+            # The directory of the file is read only, keep the index in memory
+            return build_line_index(self.data, self.size)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode(self, start, end):
+        return self.data[start:end].decode().strip()[0:self.max_length]
+
+    def line(self, i):
+        return self._decode(int(self.offsets[i]), int(self.offsets[i + 1]))
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('line {} out of range'.format(i))
+        return self.line(i)
+
+    def sample(self, rand):
+        """
+            Return a random line, picked with rand (a random.Random or the random module)
+        """
+
+        return self.line(rand.randrange(len(self)))
+
+    def iter_lines(self, count, start=0, block=4096):
+        """
+            Lazily yield the lines of indices start to count - 1, starting over at the end of the
+            file, reading the offsets block lines at a time
+        """
+
+        line_count = len(self)
+        index = start
+        while index < count:
+            first = index % line_count
+            last = min(first + block, line_count, first + count - index)
+            offsets = self.offsets[first:last + 1].tolist()
+            for i in range(last - first):
+                yield self._decode(offsets[i], offsets[i + 1])
+            index += last - first
+
+    def close(self):
+        self.offsets = None
+        self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,14 +1,68 @@
 import os
+import struct
+import time
 import lmdb # install lmdb by "pip install lmdb"
 import cv2
 import numpy as np
 
+from packed_store import PackedStoreWriter
 
-def checkImageIsValid(imageBin):
+
+def readImageSize(imageBin):
+    """
+    Read the (width, height) of a JPEG or PNG image from its header, without decoding it.
+    Returns None if the header cannot be parsed.
+    """
+    if imageBin[:8] == b'\x89PNG\r\n\x1a\n':
+        if len(imageBin) < 24 or imageBin[12:16] != b'IHDR':
+            return None
+        return struct.unpack('>II', imageBin[16:24])
+
+    if imageBin[:2] == b'\xff\xd8':
+        pos = 2
+        while pos + 4 <= len(imageBin):
+            if imageBin[pos] != 0xFF:
+                return None
+            marker = imageBin[pos + 1]
+            if marker == 0xFF:
+                # fill byte
+                pos += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                # markers without a payload
+                pos += 2
+                continue
+            length = struct.unpack('>H', imageBin[pos + 2:pos + 4])[0]
+            # SOF0-SOF15 hold the frame size, C4 (DHT), C8 (JPG) and CC (DAC) are not frames
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                if pos + 9 > len(imageBin):
+                    return None
+                height, width = struct.unpack('>HH', imageBin[pos + 5:pos + 9])
+                return width, height
+            if marker in (0xD9, 0xDA):
+                # end of image or start of scan before any frame header
+                return None
+            pos += 2 + length
+        return None
+
+    return None
+
+
+def checkImageIsValid(imageBin, fullDecode=False):
+    """
+    Check that an encoded image is not empty. JPEG and PNG images are checked from their
+    header only unless fullDecode is set, other formats are always decoded.
+    """
     if imageBin is None:
         return False
-    imageBuf = np.fromstring(imageBin, dtype=np.uint8)
+    if not fullDecode:
+        size = readImageSize(imageBin)
+        if size is not None:
+            return size[0] * size[1] > 0
+    imageBuf = np.frombuffer(imageBin, dtype=np.uint8)
     img = cv2.imdecode(imageBuf, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        return False
     imgH, imgW = img.shape[0], img.shape[1]
     if imgH * imgW == 0:
         return False
@@ -22,7 +76,100 @@ def writeCache(env, cache):
             txn.put(k.encode(), v)
 
 
-def createDataset(outputPath, imagePathList, labelList, lexiconList=None, checkValid=True):
+class LmdbWriter(object):
+    """
+    Write samples into a LMDB dataset for CRNN training as they come, using the
+    image-%09d / label-%09d / num-samples layout of createDataset. Samples are put into
+    the open transaction right away (LMDB copies them), so the caller may reuse the
+    buffer of an image as soon as add returns.
+
+    ARGS:
+        outputPath : LMDB output path
+        checkValid : if true, check the validity of every image before adding it
+        fullDecode : if true, validity is checked by decoding the image instead of reading its header
+        batchSize  : number of samples written per transaction
+        batchBytes : (optional) also commit once the pending samples reach this many bytes
+    """
+
+    def __init__(self, outputPath, checkValid=False, fullDecode=False, batchSize=1000, batchBytes=None,
+                 mapSize=1099511627776):
+        self.env = lmdb.open(outputPath, map_size=mapSize)
+        self.checkValid = checkValid
+        self.fullDecode = fullDecode
+        self.batchSize = batchSize
+        self.batchBytes = batchBytes
+        self.txn = None
+        self.cacheSamples = 0
+        self.cacheBytes = 0
+        self.cnt = 1
+        self.startTime = time.time()
+
+    def add(self, imageBin, label, lexicon=None):
+        """
+        Add one encoded image and its label, returns False if the image was rejected
+        """
+        if self.checkValid and not checkImageIsValid(imageBin, self.fullDecode):
+            return False
+
+        imageKey = 'image-%09d' % self.cnt
+        labelKey = 'label-%09d' % self.cnt
+        labelBin = label.encode()
+        self.put(imageKey, imageBin)
+        self.put(labelKey, labelBin)
+        self.cacheBytes += len(imageBin) + len(labelBin)
+        if lexicon:
+            lexiconKey = 'lexicon-%09d' % self.cnt
+            lexiconBin = ' '.join(lexicon).encode()
+            self.put(lexiconKey, lexiconBin)
+            self.cacheBytes += len(lexiconBin)
+        self.cacheSamples += 1
+        if self.cacheSamples >= self.batchSize or (self.batchBytes and self.cacheBytes >= self.batchBytes):
+            self.flush()
+        self.cnt += 1
+        return True
+
+    def put(self, key, value):
+        """
+        Put a key in the pending transaction, starting one if needed
+        """
+        if self.txn is None:
+            self.txn = self.env.begin(write=True)
+        self.txn.put(key.encode(), value)
+
+    def flush(self):
+        """
+        Commit the pending samples in one transaction
+        """
+        if self.txn is not None:
+            self.txn.commit()
+            self.txn = None
+        self.cacheSamples = 0
+        self.cacheBytes = 0
+
+    def count(self):
+        return self.cnt - 1
+
+    def rate(self):
+        """
+        Number of samples written per second since the writer was opened
+        """
+        return self.count() / max(time.time() - self.startTime, 1e-9)
+
+    def summary(self):
+        return '%d samples in %.1fs (%.1f samples/s)' % (self.count(), time.time() - self.startTime, self.rate())
+
+    def close(self):
+        """
+        Write the remaining samples and the sample count, then close the environment
+        """
+        self.put('num-samples', str(self.count()).encode())
+        self.flush()
+        self.env.close()
+        return self.count()
+
+
+def createDataset(outputPath, imagePathList, labelList, lexiconList=None, checkValid=True, fullDecode=False,
+                  batchSize=1000, batchBytes=None):
     """
     Create LMDB dataset for CRNN training.
 
@@ -32,12 +179,14 @@ def createDataset(outputPath, imagePathList, labelList, lexiconList=None, checkV
         labelList     : list of corresponding groundtruth texts
         lexiconList   : (optional) list of lexicon lists
         checkValid    : if true, check the validity of every image
+        fullDecode    : if true, decode every image to check it instead of reading its header
+        batchSize     : number of samples written per transaction
+        batchBytes    : (optional) also commit once the pending samples reach this many bytes
     """
     assert(len(imagePathList) == len(labelList))
     nSamples = len(imagePathList)
-    env = lmdb.open(outputPath, map_size=1099511627776)
-    cache = {}
-    cnt = 1
+    writer = LmdbWriter(outputPath, checkValid=checkValid, fullDecode=fullDecode, batchSize=batchSize,
+                        batchBytes=batchBytes)
     for i in range(nSamples):
         imagePath = imagePathList[i]
         label = labelList[i]
@@ -46,27 +195,77 @@ def createDataset(outputPath, imagePathList, labelList, lexiconList=None, checkV
             continue
         with open(imagePath, 'rb') as f:
             imageBin = f.read()
-        if checkValid:
-            if not checkImageIsValid(imageBin):
-                print('%s is not a valid image' % imagePath)
-                continue
+        if not writer.add(imageBin, label, lexiconList[i] if lexiconList else None):
+            print('%s is not a valid image' % imagePath)
+            continue
+        if writer.count() % 1000 == 0:
+            print('Written %d / %d (%.1f samples/s)' % (writer.count(), nSamples, writer.rate()))
+    writer.close()
+    print('Created dataset with %s' % writer.summary())
+
+
+def createDatasetFromSamples(outputPath, samples, checkValid=False, fullDecode=False, batchSize=1000, batchBytes=None):
+    """
+    Create LMDB dataset for CRNN training from samples already in memory,
+    without going through image files.
+
+    ARGS:
+        outputPath : LMDB output path
+        samples    : iterable of (encoded image, groundtruth text)
+        checkValid : if true, check the validity of every image
+        fullDecode : if true, decode every image to check it instead of reading its header
+        batchSize  : number of samples written per transaction
+        batchBytes : (optional) also commit once the pending samples reach this many bytes
+    """
+    writer = LmdbWriter(outputPath, checkValid=checkValid, fullDecode=fullDecode, batchSize=batchSize,
+                        batchBytes=batchBytes)
+    for imageBin, label in samples:
+        writer.add(imageBin, label)
+        if writer.count() % 1000 == 0:
+            print('Written %d (%.1f samples/s)' % (writer.count(), writer.rate()))
+    nSamples = writer.close()
+    print('Created dataset with %s' % writer.summary())
+    return nSamples
+
 
-        imageKey = 'image-%09d' % cnt
-        labelKey = 'label-%09d' % cnt
-        cache[imageKey] = imageBin
-        cache[labelKey] = label.encode()
-        if lexiconList:
-            lexiconKey = 'lexicon-%09d' % cnt
-            cache[lexiconKey] = ' '.join(lexiconList[i]).encode()
-        if cnt % 1000 == 0:
-            writeCache(env, cache)
-            cache = {}
-            print('Written %d / %d' % (cnt, nSamples))
-        cnt += 1
-    nSamples = cnt-1
-    cache['num-samples'] = str(nSamples).encode()
-    writeCache(env, cache)
-    print('Created dataset with %d samples' % nSamples)
+def createPackedDataset(outputPath, imagePathList, labelList, height=None):
+    """
+    Create a packed store (see packed_store.py) from image files, an alternative to the
+    LMDB dataset that needs no decoding at read time. Images are stored in grayscale.
+
+    ARGS:
+        outputPath    : packed store output directory
+        imagePathList : list of image path
+        labelList     : list of corresponding groundtruth texts
+        height        : (optional) height images are resized to, keeping their aspect ratio.
+                        By default the height of the first image, other heights are skipped.
+    """
+    assert(len(imagePathList) == len(labelList))
+    nSamples = len(imagePathList)
+    writer = None
+    for i in range(nSamples):
+        imagePath = imagePathList[i]
+        img = cv2.imread(imagePath, cv2.IMREAD_GRAYSCALE)
+        if img is None or img.size == 0:
+            print('%s is not a valid image' % imagePath)
+            continue
+        if writer is None:
+            writer = PackedStoreWriter(outputPath, height or img.shape[0])
+        if img.shape[0] != writer.height:
+            if height is None:
+                print('%s does not have the height of the dataset (%d)' % (imagePath, writer.height))
+                continue
+            width = max(1, int(round(img.shape[1] * float(height) / img.shape[0])))
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+        writer.add(img, labelList[i])
+        if writer.count() % 1000 == 0:
+            print('Written %d / %d (%.1f samples/s)' % (writer.count(), nSamples, writer.rate()))
+    if writer is None:
+        print('No valid image, nothing written')
+        return 0
+    nSamples = writer.close()
+    print('Created packed dataset with %s' % writer.summary())
+    return nSamples
 
 
 if __name__ == '__main__':
@@ -0,0 +1,89 @@
+import numpy as np
+
+from compiled_lexicon import Lexicon
+from generator import sample_seed
+
+# Number of strings drawn at once, a seeded string only depends on the seed and its index as
+# long as this does not change
+CHUNK_SIZE = 4096
+
+class DictStrings(object):
+    """
+        Make strings of random words of a dictionary, a chunk of strings at a time: the word
+        indices and word counts of the whole chunk are drawn at once with NumPy and every string
+        is a single join. With a seed, chunk k is drawn from its own generator seeded with
+        (seed, k), so any string can be made again from its index alone, by any shard or worker.
+
+        With a compiled lexicon, the strings of a chunk are gathered from its memory map and
+        decoded at once (see Lexicon.join_rows), the words follow its weights when it has some.
+    """
+
+    def __init__(self, lang_dict, length, allow_variable=False, seed=None, chunk_size=CHUNK_SIZE):
+        """
+            lang_dict      : a compiled Lexicon or the words (the lines of a dictionary, line breaks are removed)
+            length         : number of words per string
+            allow_variable : pick the number of words between 1 and length
+            seed           : (optional) seed of the strings
+            chunk_size     : number of strings drawn at once
+        """
+
+        if isinstance(lang_dict, Lexicon):
+            self.lexicon = lang_dict
+            self.words = None
+        else:
+            self.lexicon = None
+            self.words = np.array([word.rstrip('\r\n') for word in lang_dict], dtype=object)
+        if len(lang_dict) == 0:
+            raise Exception("No words could be read in dictionary")
+        if length < 1:
+            raise ValueError("The strings need at least one word, got a length of {}".format(length))
+        self.length = length
+        self.allow_variable = allow_variable
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.rng = np.random.default_rng() if seed is None else None
+        self.cached_index = None
+        self.cached_chunk = None
+
+    def chunk(self, k):
+        """
+            Return the list of the strings of indices k * chunk_size to (k + 1) * chunk_size - 1
+        """
+
+        rng = np.random.default_rng(sample_seed(self.seed, k, 'text')) if self.seed is not None else self.rng
+        # Both are drawn whole so that the words do not depend on the counts
+        counts = rng.integers(1, self.length, size=self.chunk_size, endpoint=True)
+        shape = (self.chunk_size, self.length)
+        if self.lexicon is not None:
+            return self.lexicon.join_rows(self.lexicon.draw(rng, shape), counts if self.allow_variable else None)
+        rows = self.words[rng.integers(0, len(self.words), size=shape)].tolist()
+        if not self.allow_variable:
+            return [' '.join(row) for row in rows]
+        return [' '.join(row[:count]) for row, count in zip(rows, counts.tolist())]
+
+    def get(self, index):
+        """
+            Return the string of an index, keeping the last chunk drawn. Unseeded strings are
+            only made again once their chunk is dropped.
+        """
+
+        k = index // self.chunk_size
+        if k != self.cached_index:
+            self.cached_chunk = self.chunk(k)
+            self.cached_index = k
+        return self.cached_chunk[index % self.chunk_size]
+
+    def iter_chunks(self, count, start=0):
+        """
+            Lazily yield the strings of indices start to count - 1 as lists of up to chunk_size strings
+        """
+
+        for k in range(start // self.chunk_size, (count + self.chunk_size - 1) // self.chunk_size):
+            first = k * self.chunk_size
+            strings = self.chunk(k)
+            yield strings[max(start - first, 0):count - first]
+
+    def iter_strings(self, count, start=0):
+        for strings in self.iter_chunks(count, start):
+            for string in strings:
+                yield string
@@ -0,0 +1,108 @@
+import io
+import cv2
+import numpy as np
+
+from PIL import Image
+from timing import stage
+
+BACKENDS = ['pil', 'cv2']
+
+class Encoder(object):
+    """
+        Turn a sample (an 'L' PIL image or an uint8 array) into the bytes of an image file. The
+        format is given by the extension of every call (jpg, png, webp, npy or raw for the bare
+        pixels), the encoder holds the options shared by all the samples of a run.
+    """
+
+    def __init__(self, channels=3, backend=None, quality=None, png_compression=None):
+        """
+            channels        : 3 writes RGB images like the original generator, 1 grayscale ones
+            backend         : 'pil' or 'cv2', None uses PIL for PIL images and OpenCV for arrays
+            quality         : JPEG / WebP quality, None keeps 75 for JPEG and the backend default for WebP
+            png_compression : PNG compression level (0-9), None keeps the backend default
+        """
+
+        if channels not in (1, 3):
+            raise ValueError('channels must be 1 or 3, not {}'.format(channels))
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError('Unknown encoder backend {}'.format(backend))
+        self.channels = channels
+        self.backend = backend
+        self.quality = quality
+        self.png_compression = png_compression
+
+    def encode(self, image, extension):
+        extension = extension.lower()
+        if extension == 'npy':
+            return self._encode_npy(image)
+        if extension == 'raw':
+            return self._encode_raw(image)
+
+        backend = self.backend
+        if backend is None:
+            backend = 'pil' if isinstance(image, Image.Image) else 'cv2'
+        if backend == 'pil':
+            return self._encode_pil(image, extension)
+        return self._encode_cv2(image, extension)
+
+    def _encode_pil(self, image, extension):
+        with stage('convert'):
+            if not isinstance(image, Image.Image):
+                image = Image.fromarray(image)
+            image = image.convert('RGB' if self.channels == 3 else 'L')
+        with stage('encode'):
+            image_format = Image.registered_extensions()['.' + extension]
+            params = {}
+            if image_format == 'JPEG':
+                params['quality'] = self.quality if self.quality is not None else 75
+            elif image_format == 'WEBP' and self.quality is not None:
+                params['quality'] = self.quality
+            elif image_format == 'PNG' and self.png_compression is not None:
+                params['compress_level'] = self.png_compression
+            buffer = io.BytesIO()
+            image.save(buffer, format=image_format, **params)
+            return buffer.getvalue()
+
+    def _encode_cv2(self, image, extension):
+        with stage('convert'):
+            array = np.asarray(image, dtype=np.uint8)
+            if self.channels == 3:
+                array = cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+        with stage('encode'):
+            params = []
+            if extension in ('jpg', 'jpeg'):
+                params = [cv2.IMWRITE_JPEG_QUALITY, self.quality if self.quality is not None else 75]
+            elif extension == 'webp' and self.quality is not None:
+                params = [cv2.IMWRITE_WEBP_QUALITY, self.quality]
+            elif extension == 'png' and self.png_compression is not None:
+                params = [cv2.IMWRITE_PNG_COMPRESSION, self.png_compression]
+            ok, buffer = cv2.imencode('.' + extension, array, params)
+            if not ok:
+                raise ValueError('Cannot encode a sample as {}'.format(extension))
+            return buffer.tobytes()
+
+    def _encode_raw(self, image):
+        """
+            The bare row major pixels, without any header (the packed store knows the height)
+        """
+
+        with stage('convert'):
+            array = np.asarray(image, dtype=np.uint8)
+            if self.channels == 3:
+                array = np.repeat(array[:, :, None], 3, axis=2)
+        with stage('encode'):
+            return array.tobytes()
+
+    def _encode_npy(self, image):
+        """
+            The raw pixels in the .npy format, (height, width) or (height, width, 3)
+        """
+
+        with stage('convert'):
+            array = np.asarray(image, dtype=np.uint8)
+            if self.channels == 3:
+                array = np.repeat(array[:, :, None], 3, axis=2)
+        with stage('encode'):
+            buffer = io.BytesIO()
+            np.save(buffer, array)
+            return buffer.getvalue()
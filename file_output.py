@@ -0,0 +1,114 @@
+import hashlib
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import util
+
+def fan_out_dir(index, fan_out, depth=2):
+    """
+        Return the relative directory ('3f/a0') of a sample in a tree of depth levels of fan_out
+        subdirectories each, picked from a hash of its index so that consecutive samples are
+        spread evenly and no directory holds more than about count / fan_out ** depth files
+    """
+
+    value = int.from_bytes(hashlib.blake2b(str(index).encode(), digest_size=8).digest(), 'little')
+    width = len('{:x}'.format(max(fan_out - 1, 1)))
+    parts = []
+    for _ in range(depth):
+        parts.append('{:0{}x}'.format(value % fan_out, width))
+        value //= fan_out
+    return '/'.join(parts)
+
+class FileWriter(object):
+    """
+        Write files from a few background threads, so that the caller can encode the next sample
+        while the previous ones are written. Parent directories are created as needed. With 0
+        threads files are written right away by the caller.
+    """
+
+    def __init__(self, threads=2, max_pending=None):
+        """
+            threads     : number of writer threads
+            max_pending : number of files waiting to be written before write blocks
+        """
+
+        self.executor = ThreadPoolExecutor(threads) if threads > 0 else None
+        self.max_pending = max_pending or max(threads, 1) * 4
+        self.pending = threading.BoundedSemaphore(self.max_pending)
+        self.directories = set()
+        self.error = None
+
+    def _write(self, path, data):
+        directory = os.path.dirname(path)
+        if directory not in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self.directories.add(directory)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def _done(self, future):
+        if future.exception() is not None and self.error is None:
+            self.error = future.exception()
+        self.pending.release()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def write(self, path, data):
+        """
+            Write data to path, in the background when the writer has threads. An error of a
+            previous background write is raised here.
+        """
+
+        self._raise()
+        if self.executor is None:
+            self._write(path, data)
+            return
+        self.pending.acquire()
+        self.executor.submit(self._write, path, data).add_done_callback(self._done)
+
+    def flush(self):
+        """
+            Wait until every file is written
+        """
+
+        for _ in range(self.max_pending):
+            self.pending.acquire()
+        for _ in range(self.max_pending):
+            self.pending.release()
+        self._raise()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        self._raise()
+
+# Writer of the current process, set with set_file_writer
+_writer = FileWriter(0)
+
+def set_file_writer(threads):
+    """
+        Write the files of the current process with this many background threads (can be called
+        from a Pool initializer, the pending files are written when the worker exits)
+    """
+
+    global _writer
+
+    _writer.close()
+    _writer = FileWriter(threads)
+    if threads > 0:
+        util.Finalize(None, close_file_writer, exitpriority=20)
+
+def write_file(path, data):
+    _writer.write(path, data)
+
+def close_file_writer():
+    """
+        Write the pending files of the current process and go back to synchronous writes
+    """
+
+    set_file_writer(0)
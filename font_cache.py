@@ -0,0 +1,79 @@
+import os
+
+from collections import OrderedDict
+from PIL import ImageFont
+
+# The cache lives in module globals, so it is local to the process using it:
+# every worker of a multiprocessing.Pool fills and uses its own copy.
+_fonts = OrderedDict()
+_maxsize = 64
+_hits = 0
+_misses = 0
+
+def get_font(path, size=32, index=0):
+    """
+        Return the FreeType font for (path, size, index), only opening and parsing the file
+        when it is not in the cache yet. The least recently used font is dropped once the
+        cache holds more than the maximum number of fonts.
+    """
+
+    global _hits, _misses
+
+    key = (path, size, index)
+    font = _fonts.get(key)
+    if font is not None:
+        _hits += 1
+        _fonts.move_to_end(key)
+        return font
+
+    _misses += 1
+    font = ImageFont.truetype(font=path, size=size, index=index)
+    _fonts[key] = font
+    while len(_fonts) > _maxsize:
+        _fonts.popitem(last=False)
+    return font
+
+def set_font_cache_size(maxsize):
+    """
+        Set the maximum number of fonts kept in the cache (can be used as a Pool initializer)
+    """
+
+    global _maxsize
+
+    _maxsize = max(1, maxsize)
+    while len(_fonts) > _maxsize:
+        _fonts.popitem(last=False)
+
+def clear_font_cache():
+    """
+        Empty the cache and reset the counters
+    """
+
+    global _hits, _misses
+
+    _fonts.clear()
+    _hits = 0
+    _misses = 0
+
+def font_cache_info():
+    """
+        Return the cache counters of the current process
+    """
+
+    return {
+        'pid': os.getpid(),
+        'hits': _hits,
+        'misses': _misses,
+        'size': len(_fonts),
+        'maxsize': _maxsize,
+    }
+
+def print_font_cache_info():
+    """
+        Print the cache counters of the current process
+    """
+
+    info = font_cache_info()
+    print('font cache (pid {}): {} hits, {} misses, {}/{} fonts'.format(
+        info['pid'], info['hits'], info['misses'], info['size'], info['maxsize']
+    ))
@@ -1,69 +1,413 @@
 import cv2
+import hashlib
 import math
 import os
 import random
 import numpy as np
 
 from PIL import Image, ImageFont, ImageDraw, ImageFilter
+from font_cache import get_font
+from file_output import write_file
+from glyph_atlas import get_glyph_atlas
+from background_pool import BackgroundPool
+from noise_batch import NoiseBatch
+from encoders import Encoder
+from timing import stage, end_sample
 
-def create_and_save_sample(index, text, font, out_dir, height, extension, skewing_angle, random_skew, blur, random_blur, background_type):
-    image_font = ImageFont.truetype(font=os.path.join('fonts', font), size=32)
-    text_width, text_height = image_font.getsize(text)
+# Pool of pre-generated background textures, set per process with set_background_pool
+_background_pool = None
 
-    txt_img = Image.new('L', (text_width, text_height), 255)
+# Buffer the Gaussian noise backgrounds are drawn into, created on first use
+_noise_batch = None
 
-    txt_draw = ImageDraw.Draw(txt_img)
+# Encoder of the samples, set per process with set_encoder
+_encoder = Encoder()
 
-    txt_draw.text((0, 0), text, fill=random.randint(1, 80), font=image_font)
+# Flat buffer the batches of render_batch are returned in, grown as needed and reused across calls
+_batch_buffer = np.empty(0, np.uint8)
 
-    random_angle = random.randint(0-skewing_angle, skewing_angle)
+# Default parameters of render_batch
+BATCH_PARAMS = {
+    'skewing_angle': 0,
+    'random_skew': False,
+    'blur': 0,
+    'random_blur': False,
+    'background_type': 0,
+    'font_dir': 'fonts',
+    'glyph_atlas': False,
+    'engine': 'numpy',
+    'seed': None,
+    'start': 0,
+    'pad_value': 0,
+}
 
-    rotated_img = txt_img.rotate(skewing_angle if not random_skew else random_angle, expand=1)
+# Rendering engines: 'pil' composites PIL images, 'numpy' keeps the sample as one uint8 array
+ENGINES = ['pil', 'numpy']
+
+def create_and_save_sample(index, text, font, out_dir, height, extension, skewing_angle, random_skew, blur, random_blur, background_type,
+                           file_name=None, font_dir='fonts', glyph_atlas=False, seed=None, engine='pil'):
+    image_bin = _create_encoded_sample(text, font, height, extension, skewing_angle, random_skew, blur, random_blur, background_type,
+                                       font_dir, glyph_atlas, seed, engine)
+
+    # Create the name for our image
+    image_name = file_name if file_name else '{}_{}.{}'.format(text, str(index), extension)
+
+    # Save the image (the name may contain subdirectories, they are created as needed)
+    with stage('write'):
+        write_file(os.path.join(out_dir, image_name), image_bin)
+
+    end_sample(background=background_type, font=font, length=_length_bucket(text))
+
+def create_and_encode_sample(index, text, font, height, extension, skewing_angle, random_skew, blur, random_blur, background_type,
+                             font_dir='fonts', glyph_atlas=False, seed=None, engine='pil'):
+    """
+        Same as create_and_save_sample but returns (index, encoded image, label) instead of writing a file
+    """
+
+    image_bin = _create_encoded_sample(text, font, height, extension, skewing_angle, random_skew, blur, random_blur, background_type,
+                                       font_dir, glyph_atlas, seed, engine)
+
+    end_sample(background=background_type, font=font, length=_length_bucket(text))
+
+    return index, image_bin, text
+
+def render_batch(texts, fonts, height, params=None):
+    """
+        Render a batch of samples in memory, without encoding or writing anything.
+
+        texts  : the strings to render
+        fonts  : one font file name per text, or a single one for the whole batch
+        height : the height of the samples
+        params : overrides of BATCH_PARAMS, with the arguments of create_sample plus
+                 engine    : 'numpy' (default) or 'pil'
+                 seed      : when set, sample i is seeded with sample_seed(seed, start + i)
+                 pad_value : the gray level the samples are padded with on the right
+
+        Returns (images, widths, labels): an uint8 array of shape (N, height, max_width), the
+        width of every sample in it and the texts. The array is a view of a buffer reused by
+        the next call, copy it to keep it.
+    """
+
+    global _batch_buffer
+
+    params = dict(BATCH_PARAMS, **(params or {}))
+    if isinstance(fonts, str):
+        fonts = [fonts] * len(texts)
+    render = create_sample_array if params['engine'] == 'numpy' else create_sample
+
+    samples = []
+    for i, (text, font) in enumerate(zip(texts, fonts)):
+        seed = sample_seed(params['seed'], params['start'] + i) if params['seed'] is not None else None
+        sample = render(text, font, height, params['skewing_angle'], params['random_skew'], params['blur'],
+                        params['random_blur'], params['background_type'], font_dir=params['font_dir'],
+                        glyph_atlas=params['glyph_atlas'], seed=seed)
+        samples.append(np.asarray(sample, dtype=np.uint8))
+        end_sample(background=params['background_type'], font=font, length=_length_bucket(text))
+
+    widths = np.array([sample.shape[1] for sample in samples], dtype=np.int32)
+    max_width = int(widths.max()) if len(samples) > 0 else 0
+
+    # All the samples are closed, the padding is not part of any of them
+    with stage('batch', in_sample=False):
+        size = len(samples) * height * max_width
+        if size > len(_batch_buffer):
+            # Grow by at least half so that slowly increasing widths do not reallocate every call
+            _batch_buffer = np.empty(max(size, len(_batch_buffer) * 3 // 2), np.uint8)
+        images = _batch_buffer[:size].reshape(len(samples), height, max_width)
+        for image, sample in zip(images, samples):
+            image[:, :sample.shape[1]] = sample
+            image[:, sample.shape[1]:] = params['pad_value']
+
+    return images, widths, list(texts)
+
+def _create_encoded_sample(text, font, height, extension, skewing_angle, random_skew, blur, random_blur, background_type,
+                           font_dir, glyph_atlas, seed, engine):
+    if engine == 'numpy':
+        array = create_sample_array(text, font, height, skewing_angle, random_skew, blur, random_blur, background_type,
+                                    font_dir=font_dir, glyph_atlas=glyph_atlas, seed=seed)
+        return encode_sample(array, extension)
+
+    final_image = create_sample(text, font, height, skewing_angle, random_skew, blur, random_blur, background_type,
+                                font_dir=font_dir, glyph_atlas=glyph_atlas, seed=seed)
+    return encode_sample(final_image, extension)
+
+def encode_sample(image, extension):
+    """
+        Encode a sample (PIL image or uint8 array) in memory with the encoder of the process,
+        the same way saving it as a file with this extension would
+    """
+
+    return _encoder.encode(image, extension)
+
+def set_encoder(channels=3, backend=None, quality=None, png_compression=None):
+    """
+        Set how the samples of the current process are encoded, see Encoder
+    """
+
+    global _encoder
+
+    _encoder = Encoder(channels, backend, quality, png_compression)
+
+def _length_bucket(text):
+    """
+        Group text lengths by powers of two for the timings (1, 2-3, 4-7, ...)
+    """
+
+    low = 1 << (max(len(text), 1).bit_length() - 1)
+    return '{}-{}'.format(low, 2 * low - 1)
+
+def create_sample(text, font, height, skewing_angle, random_skew, blur, random_blur, background_type,
+                  font_dir='fonts', glyph_atlas=False, seed=None):
+    """
+        Create the image of a sample, without saving it. When a seed is given, every random
+        choice of the sample comes from it, otherwise from the global random state.
+    """
+
+    rng = random.Random(seed) if seed is not None else None
+    rand = rng if rng is not None else random
+
+    if glyph_atlas:
+        # Copy cached glyph bitmaps instead of rasterizing the whole string
+        with stage('font_load'):
+            atlas = get_glyph_atlas(os.path.join(font_dir, font), size=32)
+        with stage('text_draw'):
+            txt_img = atlas.render(text, rand.randint(1, 80))
+            text_width, text_height = txt_img.size
+    else:
+        with stage('font_load'):
+            image_font = get_font(os.path.join(font_dir, font), size=32)
+
+        with stage('text_draw'):
+            text_width, text_height = image_font.getsize(text)
+
+            txt_img = Image.new('L', (text_width, text_height), 255)
+
+            txt_draw = ImageDraw.Draw(txt_img)
+
+            txt_draw.text((0, 0), text, fill=rand.randint(1, 80), font=image_font)
+
+    random_angle = rand.randint(0-skewing_angle, skewing_angle)
+
+    with stage('rotate'):
+        rotated_img = txt_img.rotate(skewing_angle if not random_skew else random_angle, expand=1)
 
     new_text_width, new_text_height = rotated_img.size
 
     # We create our background a bit bigger than the text
     background = None
 
-    if background_type == 0:
-        background = create_gaussian_noise_background(new_text_height + 10, new_text_width + 10)
-    elif background_type == 1:
-        background = create_plain_white_background(new_text_height + 10, new_text_width + 10)
-    else:
-        background = create_quasicrystal_background(new_text_height + 10, new_text_width + 10)
+    with stage('background'):
+        if _background_pool is not None:
+            # Crop a pre-generated texture, None when the pool cannot provide this background
+            background = _background_pool.get(background_type, new_text_height + 10, new_text_width + 10, rng)
 
-    mask = rotated_img.point(lambda x: 0 if x == 255 or x == 0 else 255, '1')
+        if background is None:
+            if background_type == 0:
+                background = create_gaussian_noise_background(new_text_height + 10, new_text_width + 10, rng)
+            elif background_type == 1:
+                background = create_plain_white_background(new_text_height + 10, new_text_width + 10)
+            else:
+                background = create_quasicrystal_background(new_text_height + 10, new_text_width + 10, rng)
 
-    background.paste(rotated_img, (5, 5), mask=mask)
+    with stage('mask_paste'):
+        mask = rotated_img.point(lambda x: 0 if x == 255 or x == 0 else 255, '1')
 
-    # Create the name for our image
-    image_name = '{}_{}.{}'.format(text, str(index), extension)
+        background.paste(rotated_img, (5, 5), mask=mask)
 
     # Resizing the image to desired format
-    new_width = float(text_width + 10) * (float(height) / float(text_height + 10))
-    image_on_background = background.resize((int(new_width), height), Image.ANTIALIAS)
+    with stage('resize'):
+        new_width = float(text_width + 10) * (float(height) / float(text_height + 10))
+        image_on_background = background.resize((int(new_width), height), Image.ANTIALIAS)
 
-    final_image = image_on_background.filter(
-        ImageFilter.GaussianBlur(
-            radius=(blur if not random_blur else random.randint(0, blur))
+    with stage('blur'):
+        final_image = image_on_background.filter(
+            ImageFilter.GaussianBlur(
+                radius=(blur if not random_blur else rand.randint(0, blur))
+            )
         )
-    )
 
-    # Save the image
-    final_image.convert('RGB').save(os.path.join(out_dir, image_name))
+    return final_image
 
-def create_gaussian_noise_background(height, width):
+def create_sample_array(text, font, height, skewing_angle, random_skew, blur, random_blur, background_type,
+                        font_dir='fonts', glyph_atlas=False, seed=None):
     """
-        Create a background with Gaussian noise (to mimic paper)
+        Same as create_sample, but the sample stays one uint8 array of shape (height, width)
+        from the text raster to the blur: NumPy does the rotation and the compositing, the
+        resizing and the blur run PIL's filters on the array (see resize_array). The random
+        choices are drawn in the same order as create_sample, so that a seed gives the same
+        pixels as create_sample.
+    """
+
+    rng = random.Random(seed) if seed is not None else None
+    rand = rng if rng is not None else random
+
+    if glyph_atlas:
+        with stage('font_load'):
+            atlas = get_glyph_atlas(os.path.join(font_dir, font), size=32)
+        with stage('text_draw'):
+            txt_img = atlas.render_array(text, rand.randint(1, 80))
+            text_height, text_width = txt_img.shape
+    else:
+        with stage('font_load'):
+            image_font = get_font(os.path.join(font_dir, font), size=32)
+
+        with stage('text_draw'):
+            text_width, text_height = image_font.getsize(text)
+            txt_img = draw_text_array(text, image_font, text_width, text_height, rand.randint(1, 80))
+
+    random_angle = rand.randint(0-skewing_angle, skewing_angle)
+
+    with stage('rotate'):
+        rotated_img = rotate_array(txt_img, skewing_angle if not random_skew else random_angle)
+
+    new_text_height, new_text_width = rotated_img.shape
+
+    background = None
+
+    with stage('background'):
+        if _background_pool is not None:
+            background = _background_pool.get_array(background_type, new_text_height + 10, new_text_width + 10, rng)
+
+        if background is None:
+            if background_type == 0:
+                background = gaussian_noise(new_text_height + 10, new_text_width + 10, rng)
+            elif background_type == 1:
+                background = np.full((new_text_height + 10, new_text_width + 10), 255, np.uint8)
+            else:
+                background = create_quasicrystal_array(new_text_height + 10, new_text_width + 10, rng)
+
+    with stage('mask_paste'):
+        # Same mask as the PIL engine: everything but the white and the rotation padding
+        region = background[5:5 + new_text_height, 5:5 + new_text_width]
+        np.copyto(region, rotated_img, where=(rotated_img != 255) & (rotated_img != 0))
+
+    with stage('resize'):
+        new_width = float(text_width + 10) * (float(height) / float(text_height + 10))
+        final_image = resize_array(background, int(new_width), height)
+
+    with stage('blur'):
+        radius = blur if not random_blur else rand.randint(0, blur)
+        if radius > 0:
+            final_image = gaussian_blur_array(final_image, radius)
+
+    return final_image
+
+def resize_array(image, width, height):
+    """
+        Resize an uint8 array with PIL's antialiasing filter, like Image.resize(size, Image.ANTIALIAS).
+        No OpenCV filter matches it (INTER_AREA was up to 45 gray levels off) and a NumPy version
+        of the Lanczos passes is slower than PIL, so the array is handed to PIL instead.
+    """
+
+    return np.array(Image.fromarray(image).resize((width, height), Image.ANTIALIAS))
+
+def gaussian_blur_array(image, radius):
+    """
+        Blur an uint8 array like ImageFilter.GaussianBlur(radius): three box blurs with a
+        fractional radius, which cv2.GaussianBlur does not reproduce
+    """
+
+    return np.array(Image.fromarray(image).filter(ImageFilter.GaussianBlur(radius=radius)))
+
+def draw_text_array(text, font, width, height, fill):
+    """
+        Rasterize text with FreeType and draw it with the gray level fill on a white uint8
+        array of shape (height, width), like ImageDraw.text at (0, 0) does
+    """
+
+    coverage, (left, top) = font.getmask2(text, mode='L')
+    mask_width, mask_height = coverage.size
+    coverage = np.array(coverage, dtype=np.uint16).reshape(mask_height, mask_width)
+
+    # The mask may start left of or above the origin (overhanging glyphs), clip it to the image
+    image = np.full((height, width), 255, np.uint8)
+    x0, y0 = max(left, 0), max(top, 0)
+    x1, y1 = min(left + mask_width, width), min(top + mask_height, height)
+    if x1 > x0 and y1 > y0:
+        coverage = coverage[y0 - top:y1 - top, x0 - left:x1 - left]
+        image[y0:y1, x0:x1] = 255 - (coverage * (255 - fill) + 127) // 255
+    return image
+
+def rotate_array(image, angle):
+    """
+        Rotate an uint8 array counter clockwise by angle degrees, expanding it to hold the whole
+        rotated image and filling the corners with black, like PIL's Image.rotate(angle, expand=1)
+        with nearest neighbour resampling. The matrix is computed like PIL does and the pixels
+        are sampled with its 16.16 fixed point steps, so that the same pixels are picked.
+    """
+
+    angle = angle % 360
+    if angle % 90 == 0:
+        # PIL transposes right angles instead of resampling them
+        return np.ascontiguousarray(np.rot90(image, int(angle // 90)))
+
+    height, width = image.shape
+    theta = -math.radians(angle)
+    a, b = round(math.cos(theta), 15), round(math.sin(theta), 15)
+    d, e = round(-math.sin(theta), 15), round(math.cos(theta), 15)
+
+    # Output to input mapping around the center, then translated to the expanded image
+    center_x, center_y = width / 2.0, height / 2.0
+    c = a * -center_x + b * -center_y + 0.0 + center_x
+    f = d * -center_x + e * -center_y + 0.0 + center_y
+    xs, ys = [], []
+    for x, y in ((0, 0), (width, 0), (width, height), (0, height)):
+        xs.append(a * x + b * y + c)
+        ys.append(d * x + e * y + f)
+    new_width = math.ceil(max(xs)) - math.floor(min(xs))
+    new_height = math.ceil(max(ys)) - math.floor(min(ys))
+    x, y = -(new_width - width) / 2.0, -(new_height - height) / 2.0
+    c, f = a * x + b * y + c, d * x + e * y + f
+
+    # Steps and origin (at the center of the first pixel) in 16.16 fixed point
+    fix = lambda v: math.floor(v * 65536.0 + 0.5)
+    rows = np.arange(new_height, dtype=np.int64)[:, None]
+    columns = np.arange(new_width, dtype=np.int64)[None, :]
+    x_in = (fix(c + a * 0.5 + b * 0.5) + rows * fix(b) + columns * fix(a)) >> 16
+    y_in = (fix(f + d * 0.5 + e * 0.5) + rows * fix(e) + columns * fix(d)) >> 16
+
+    inside = (x_in >= 0) & (x_in < width) & (y_in >= 0) & (y_in < height)
+    rotated = np.zeros((new_height, new_width), np.uint8)
+    rotated[inside] = image[y_in[inside], x_in[inside]]
+    return rotated
+
+def sample_seed(seed, index, salt=''):
+    """
+        Derive the seed of one sample from the global seed and its index, so that a sample
+        does not depend on which worker creates it or on what was created before it
+    """
+
+    digest = hashlib.blake2b('{}/{}/{}'.format(seed, index, salt).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+def set_background_pool(size, refresh_rate=0, cache_dir=None, seed=None):
+    """
+        Build the background pool of the current process (size 0 disables it)
     """
 
-    # We create an all white image
-    image = np.ones((height, width)) * 255
+    global _background_pool
 
-    # We add gaussian noise
-    cv2.randn(image, 235, 10)
+    _background_pool = BackgroundPool(size, refresh_rate=refresh_rate, cache_dir=cache_dir, seed=seed) if size > 0 else None
+
+def gaussian_noise(height, width, rng=None):
+    """
+        Gaussian noise background (mean 235, deviation 10) as an uint8 view of the noise
+        buffer of the process, see NoiseBatch for how long it stays valid
+    """
+
+    global _noise_batch
+
+    if _noise_batch is None:
+        _noise_batch = NoiseBatch()
+    return _noise_batch.get(height, width, rng)
+
+def create_gaussian_noise_background(height, width, rng=None):
+    """
+        Create a background with Gaussian noise (to mimic paper)
+    """
 
-    return Image.fromarray(image).convert('L')
+    # Copy the noise out of the shared buffer, the image outlives it
+    return Image.fromarray(gaussian_noise(height, width, rng)).copy()
 
 def create_plain_white_background(height, width):
     """
@@ -72,27 +416,48 @@ def create_plain_white_background(height, width):
 
     return Image.new("L", (width, height), 255)
 
-def create_quasicrystal_background(height, width):
+def create_quasicrystal_background(height, width, rng=None):
     """
         Create a background with quasicrystal (https://en.wikipedia.org/wiki/Quasicrystal)
     """
 
-    image = Image.new("L", (width, height))
-    pixels = image.load()
-
-    frequency = random.random() * 30 + 20 # frequency
-    phase = random.random() * 2 * math.pi # phase
-    rotation_count = random.randint(10, 20) # of rotations
-
-    for kw in range(width):
-        y = float(kw) / (width - 1) * 4 * math.pi - 2 * math.pi
-        for kh in range(height):
-            x = float(kh) / (height - 1) * 4 * math.pi - 2 * math.pi
-            z = 0.0
-            for i in range(rotation_count):
-                r = math.hypot(x, y)
-                a = math.atan2(y, x) + i * math.pi * 2.0 / rotation_count
-                z += math.cos(r * math.sin(a) * frequency + phase)
-            c = int(255 - round(255 * z / rotation_count))
-            pixels[kw, kh] = c # grayscale
-    return image
+    return Image.fromarray(create_quasicrystal_array(height, width, rng), 'L')
+
+def create_quasicrystal_array(height, width, rng=None):
+    """
+        Same as create_quasicrystal_background, as an uint8 array
+    """
+
+    rand = rng if rng is not None else random
+
+    frequency = rand.random() * 30 + 20 # frequency
+    phase = rand.random() * 2 * math.pi # phase
+    rotation_count = rand.randint(10, 20) # of rotations
+
+    return quasicrystal(height, width, frequency, phase, rotation_count)
+
+def quasicrystal(height, width, frequency, phase, rotation_count):
+    """
+        Compute the quasicrystal pattern as an uint8 array of shape (height, width).
+        The whole (height, width, rotation) grid is evaluated at once with numpy,
+        the operations are kept in the same order as the original per pixel loop
+        so that the same parameters give the same pixels.
+    """
+
+    # x varies along the rows, y along the columns
+    x = np.arange(height, dtype=np.float64) / (height - 1) * 4 * math.pi - 2 * math.pi
+    y = np.arange(width, dtype=np.float64) / (width - 1) * 4 * math.pi - 2 * math.pi
+    x, y = np.meshgrid(x, y, indexing='ij')
+
+    r = np.hypot(x, y)[:, :, None]
+    a = np.arctan2(y, x)[:, :, None] + np.arange(rotation_count) * math.pi * 2.0 / rotation_count
+
+    waves = np.cos(r * np.sin(a) * frequency + phase)
+
+    # Accumulate the rotations one by one to keep the summation order of the loop
+    z = np.zeros((height, width))
+    for i in range(rotation_count):
+        z += waves[:, :, i]
+
+    c = 255 - np.round(255 * z / rotation_count)
+    return np.clip(c, 0, 255).astype(np.uint8)
@@ -0,0 +1,108 @@
+import numpy as np
+
+from PIL import Image
+from font_cache import get_font
+
+# One atlas per (path, size, index), local to the process like the font cache
+_atlases = {}
+
+class GlyphAtlas(object):
+    """
+        Keep the rasterized glyphs of one font in memory so that lines of text can be built
+        by copying bitmaps instead of asking FreeType to shape and draw every string again.
+        The pen moves like in the basic layout of ImageDraw: by the advances and the kerning of
+        the pairs, in 1/64 pixels. Ligatures and complex scripts are not shaped, which is fine
+        for the character level lexicons (digits, latin letters, hanzi) it is meant for.
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self.glyphs = {}
+        self.kerning = {}
+
+    def glyph(self, char):
+        """
+            Return the coverage bitmap (0 is empty, 255 is ink) of a character with the offset of
+            its top left corner from the pen position, its advance in 1/64 pixels and its line
+            height, rasterizing it the first time it is seen. The bitmap holds all the ink, also
+            past the advance.
+        """
+
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            # The advance, not the ink width getsize gives, which is off for italic and overhanging glyphs
+            advance = int(round(self.font.getlength(char) * 64))
+            height = self.font.getsize(char)[1]
+            mask, (left, top) = self.font.getmask2(char, mode='L')
+            bitmap = np.array(mask, dtype=np.uint8).reshape(mask.size[1], mask.size[0])
+            glyph = (bitmap, left, top, advance, height)
+            self.glyphs[char] = glyph
+        return glyph
+
+    def kern(self, previous, char):
+        """
+            Return the kerning between two characters in 1/64 pixels, what the pair is shorter
+            or longer than the two advances
+        """
+
+        pair = previous + char
+        kerning = self.kerning.get(pair)
+        if kerning is None:
+            kerning = int(round(self.font.getlength(pair) * 64)) - self.glyph(previous)[3] - self.glyph(char)[3]
+            self.kerning[pair] = kerning
+        return kerning
+
+    def render(self, text, fill):
+        """
+            Build the 'L' image of a line of text drawn with the gray level fill on white,
+            like ImageDraw.text would on a white image of font.getsize(text)
+        """
+
+        return Image.fromarray(self.render_array(text, fill), 'L')
+
+    def render_array(self, text, fill):
+        """
+            Same as render, as an uint8 array of shape (height, width)
+        """
+
+        text = text or ' '
+        glyphs = [self.glyph(char) for char in text]
+        # Pen positions in 1/64 pixels, rounded to whole pixels like ImageDraw
+        pens = [0]
+        for previous, char in zip(text, text[1:]):
+            pens.append(pens[-1] + self.glyph(previous)[3] + self.kern(previous, char))
+        xs = [(pen + 32) >> 6 for pen in pens]
+        advance = (pens[-1] + glyphs[-1][3] + 32) >> 6
+        ink_left = min(x + glyph[1] for x, glyph in zip(xs, glyphs))
+        ink_right = max(x + glyph[1] + glyph[0].shape[1] for x, glyph in zip(xs, glyphs))
+        # The size of font.getsize(text): ink left of the pen start widens the line on the right
+        width = max(max(advance, ink_right) - min(ink_left, 0), 1)
+        height = max(max(glyph[4] for glyph in glyphs), 1)
+        # Room for the ink left of the first pen position and right of the line
+        margin = max(-ink_left, 0)
+
+        coverage = np.zeros((height, margin + max(width, ink_right)), np.uint8)
+        for x, (bitmap, left, top, _, _) in zip(xs, glyphs):
+            # Rows above the top or below the bottom of the line are clipped like ImageDraw does
+            bitmap = bitmap[max(-top, 0):max(height - top, 0)]
+            h, w = bitmap.shape
+            y = max(top, 0)
+            # Glyphs may overhang their advance, keep the strongest coverage where they overlap
+            region = coverage[y:y + h, margin + x + left:margin + x + left + w]
+            np.maximum(region, bitmap, out=region)
+        coverage = coverage[:, margin:margin + width].astype(np.uint16)
+
+        line = 255 - (coverage * (255 - fill) + 127) // 255
+        return line.astype(np.uint8)
+
+def get_glyph_atlas(path, size=32, index=0):
+    """
+        Return the glyph atlas of a font, creating it on first use
+    """
+
+    key = (path, size, index)
+    atlas = _atlases.get(key)
+    if atlas is None:
+        atlas = GlyphAtlas(get_font(path, size, index))
+        _atlases[key] = atlas
+    return atlas
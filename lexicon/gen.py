@@ -1,9 +1,22 @@
 import os
+import re
 import datetime
 import random
+import itertools
+import numpy as np
 from pypinyin import pinyin, lazy_pinyin, Style  # pip install pypinyin
 
 
+# Number of lines built at once by the streaming generators
+CHUNK_LINES = 1 << 20
+
+# strftime directives the date generator builds with NumPy, and their width
+DATE_FIELDS = {'%Y': 4, '%y': 2, '%m': 2, '%d': 2}
+
+# ASCII digits of 0 to 9999, zero padded to 4 digits
+DIGIT_TABLE = np.array([list('{:04d}'.format(i).encode()) for i in range(10000)], dtype=np.uint8)
+
+
 # ----------------------------------------------------------------------------------------------------------------------
 def get_number():
     '''
@@ -104,19 +117,107 @@ def get_date_range(start, end, format='%Y-%m-%d'):
     :param format:
     :return:
     '''
-    start_date = datetime.date(*start)
-    end_date = datetime.date(*end)
-    # print(start_date, '-', end_date)
-    result = []
-    curr_date = start_date
-    # while curr_date != end_date:
-    #     result.append("%04d%02d%02d" % (curr_date.year, curr_date.month, curr_date.day))
-    #     curr_date += datetime.timedelta(1)
-    # result.append("%04d%02d%02d" % (curr_date.year, curr_date.month, curr_date.day))
-    while curr_date <= end_date:
-        result.append(curr_date.strftime(format))
-        curr_date += datetime.timedelta(1)
-    return result
+    return [line for chunk in iter_date_chunks(start, end, format) for line in chunk.decode().split('\n')[:-1]]
+
+
+def _digits(values, width):
+    '''
+    ASCII digits of non negative integers, zero padded to width
+    :param values: int64 array
+    :param width:
+    :return: uint8 array of shape (len(values), width)
+    '''
+    # Looked up 4 digits at a time, from the right
+    groups = []
+    while width > 0:
+        group_width = min(width, 4)
+        groups.insert(0, DIGIT_TABLE[values % 10 ** group_width, 4 - group_width:])
+        values = values // 10 ** group_width
+        width -= group_width
+    return np.concatenate(groups, axis=1) if len(groups) > 1 else groups[0]
+
+
+def _join_columns(columns, count):
+    '''
+    Bytes of count lines made of uint8 columns of shape (count, width), every line followed by a line break
+    :param columns:
+    :param count:
+    :return:
+    '''
+    columns = [np.broadcast_to(column, (count, column.shape[-1])) for column in columns]
+    return np.concatenate(columns + [np.full((count, 1), ord('\n'), dtype=np.uint8)], axis=1).tobytes()
+
+
+def iter_date_chunks(start, end, format='%Y-%m-%d', chunk_lines=CHUNK_LINES):
+    '''
+    Every day from start to end (included) formatted like strftime, as bytes of up to chunk_lines lines.
+    The days are a datetime64 range and formats made of %Y %y %m %d %% and text are built as digit
+    columns, other formats fall back to strftime.
+    :param start: (year, month, day)
+    :param end: (year, month, day)
+    :param format:
+    :param chunk_lines:
+    :return:
+    '''
+    first = np.datetime64(datetime.date(*start), 'D')
+    count = max(int((np.datetime64(datetime.date(*end), 'D') - first).astype(np.int64)) + 1, 0)
+
+    tokens = [token for token in re.split(r'(%.)', format) if token]
+    vectorized = all(not token.startswith('%') or token in DATE_FIELDS or token == '%%' for token in tokens)
+    # strftime does not pad the years before 1000
+    vectorized = vectorized and ('%Y' not in tokens or start[0] >= 1000)
+
+    for chunk_start in range(0, count, chunk_lines):
+        days = first + np.arange(chunk_start, min(chunk_start + chunk_lines, count))
+        if not vectorized:
+            yield ''.join(day.strftime(format) + '\n' for day in days.astype(object)).encode()
+            continue
+
+        months = days.astype('datetime64[M]')
+        fields = {
+            '%Y': months.astype('datetime64[Y]').astype(np.int64) + 1970,
+            '%m': months.astype(np.int64) % 12 + 1,
+            '%d': (days - months).astype(np.int64) + 1,
+        }
+        fields['%y'] = fields['%Y'] % 100
+        columns = []
+        for token in tokens:
+            if token in DATE_FIELDS:
+                columns.append(_digits(fields[token], DATE_FIELDS[token]))
+            else:
+                columns.append(np.frombuffer(('%' if token == '%%' else token).encode(), dtype=np.uint8)[None, :])
+        yield _join_columns(columns, len(days))
+
+
+def iter_id_chunks(letters, count, digits=10, chunk_lines=CHUNK_LINES, rng=None):
+    '''
+    count random IDs made of a letter and a number of digits digits not starting with 0, like
+    random.choice(letters) + str(random.randint(10 ** (digits - 1), 10 ** digits - 1)), drawn in bulk
+    with NumPy and returned as bytes of up to chunk_lines lines
+    :param letters: ASCII characters
+    :param count:
+    :param digits: at most 18
+    :param chunk_lines:
+    :param rng: numpy Generator
+    :return:
+    '''
+    rng = rng if rng is not None else np.random.default_rng()
+    table = np.frombuffer(''.join(letters).encode('ascii'), dtype=np.uint8)
+    for chunk_start in range(0, count, chunk_lines):
+        size = min(chunk_lines, count - chunk_start)
+        prefixes = table[rng.integers(0, len(table), size)][:, None]
+        numbers = rng.integers(10 ** (digits - 1), 10 ** digits, size)
+        yield _join_columns([prefixes, _digits(numbers, digits)], size)
+
+
+def iter_line_chunks(lines):
+    '''
+    A list of lines as a single chunk of bytes
+    :param lines:
+    :return:
+    '''
+    if lines:
+        yield ('\n'.join(lines) + '\n').encode()
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -125,6 +226,22 @@ def save_file(text, file='default', base='data'):
         f.write(text)
 
 
+def save_chunks(chunks, file='default', base='data'):
+    '''
+    Write chunks of lines (bytes, every line followed by a line break) as they are made, the file is
+    the same as the one of save_file with the lines joined
+    :param chunks:
+    :param file:
+    :param base:
+    :return:
+    '''
+    with open(os.path.join(base, file), 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+        if f.tell() > 0:
+            f.truncate(f.tell() - 1)
+
+
 def gen_ascii(file='ascii.txt'):
     ascii_str = '\n'.join(get_number() + get_alphabet() + get_special())
     # print(ascii_str)
@@ -162,25 +279,22 @@ def gen_word_document(file='word_document.txt'):
     save_file(words_str, file)
 
 
-def gen_word_sequence(file='word_sequence.txt'):
+def gen_word_sequence(file='word_sequence.txt', id_count=1000, hot_id_count=10000):
     years = [str(i).zfill(2) for i in range(1902, 2049 + 1)]
     dates = [str(i).zfill(2) for i in range(1, 31 + 1)]
     alphabet = get_alphabet(lowercase=False)
     alphabet_hot = ['H', 'O', 'P']
     # print(random.choice(alphabet), random.sample(alphabet, 5))
-    ids = [random.choice(alphabet) + str(random.randint(1000000000, 9999999999)) for i in range(0, 1000)]
-    hot_ids = [random.choice(alphabet_hot) + str(random.randint(1000000000, 9999999999)) for i in range(0, 10000)]
-    words_str = '\n'.join(years + dates + ids + hot_ids)
-    # print(words_str)
-    save_file(words_str, file)
+    save_chunks(itertools.chain(
+        iter_line_chunks(years + dates),
+        iter_id_chunks(alphabet, id_count),
+        iter_id_chunks(alphabet_hot, hot_id_count)
+    ), file)
 
 
-def gen_word_date(file='word_date.txt'):
+def gen_word_date(file='word_date.txt', start=(1902, 1, 1), end=(2049, 12, 31), formats=('%Y-%m-%d', '%Y.%m.%d')):
     # date_str = '\n'.join(get_date_range((1900, 1, 1), (2099, 12, 31)))
-    start = (1902, 1, 1)
-    end = (2049, 12, 31)
-    date_str = '\n'.join(get_date_range(start, end) + get_date_range(start, end, '%Y.%m.%d'))
-    save_file(date_str, file)
+    save_chunks(itertools.chain.from_iterable(iter_date_chunks(start, end, format) for format in formats), file)
 
 
 def main():
@@ -0,0 +1,65 @@
+import cv2
+import numpy as np
+
+class NoiseBatch(object):
+    """
+        Draw the Gaussian noise of many backgrounds at once into one reused uint8 buffer and
+        hand out views of it, instead of allocating a float64 image for every sample. The noise
+        is drawn as float32, clipped to [0, 255] and rounded into the buffer, which is cheaper
+        than letting OpenCV draw uint8 directly.
+
+        A view stays valid until the buffer wraps around, i.e. until about size more pixels of
+        noise have been requested: consume or copy it before creating many more backgrounds.
+    """
+
+    def __init__(self, size=1 << 20, mean=235, deviation=10):
+        """
+            size           : number of pixels drawn at once
+            mean/deviation : parameters of the noise
+        """
+
+        self.buffer = np.empty(size, np.uint8)
+        self.scratch = np.empty(size, np.float32)
+        self.mean = mean
+        self.deviation = deviation
+        self.position = 0
+        # Whether the pixels after position are noise that was not handed out yet
+        self.fresh = False
+
+    def _draw(self, out):
+        scratch = self.scratch[:len(out)] if len(out) <= len(self.scratch) else np.empty(len(out), np.float32)
+        cv2.randn(scratch, self.mean, self.deviation)
+        # Clip rather than take the absolute value, a negative draw is black and not bright
+        np.clip(scratch, 0, 255, out=scratch)
+        np.rint(scratch, out=scratch)
+        np.copyto(out, scratch, casting='unsafe')
+
+    def _reserve(self, count):
+        if self.position + count > len(self.buffer):
+            self.position = 0
+            self.fresh = False
+        view = self.buffer[self.position:self.position + count]
+        self.position += count
+        return view
+
+    def get(self, height, width, rng=None):
+        """
+            Return a (height, width) uint8 view of noise. When rng is given, the noise of this
+            background is drawn alone from a seed taken from rng, so that it does not depend on
+            the backgrounds created before it.
+        """
+
+        count = height * width
+        if rng is None and count <= len(self.buffer):
+            if not self.fresh or self.position + count > len(self.buffer):
+                # Draw the next batch of backgrounds in one call
+                self._draw(self.buffer)
+                self.position = 0
+                self.fresh = True
+            return self._reserve(count).reshape(height, width)
+
+        noise = self._reserve(count) if count <= len(self.buffer) else np.empty(count, np.uint8)
+        if rng is not None:
+            cv2.setRNGSeed(rng.randrange(2 ** 31))
+        self._draw(noise)
+        return noise.reshape(height, width)
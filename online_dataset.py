@@ -0,0 +1,227 @@
+import os
+import queue
+import random
+import time
+import cv2
+import numpy as np
+
+from multiprocessing import Event, Process, Queue, Value
+from corpus import Corpus
+from generator import BATCH_PARAMS, create_sample, create_sample_array, sample_seed, set_background_pool
+from dict_strings import DictStrings
+
+class OnlineDataset(object):
+    """
+        Generate samples on the fly for a training loop: worker processes render samples
+        continuously into a bounded prefetch queue and iterating over the dataset pulls
+        (image, label) pairs from it, nothing is written to disk.
+
+        Worker k of n renders the samples of indices k, k + n, k + 2n... With a seed, the
+        sample of an index is the same as the one run.py creates with that seed (text, font
+        and image), whichever worker renders it, but the samples arrive in completion order.
+    """
+
+    def __init__(self, lang_dict=None, input_file=None, length=1, allow_variable=False, height=32, params=None,
+                 workers=2, queue_depth=256, seed=None, count=None, background_pool=0):
+        """
+            lang_dict       : words to build the strings from (see run.load_dict)
+            input_file      : or a file whose lines are the strings, starting over at its end
+            length          : number of words per string from lang_dict
+            allow_variable  : pick the number of words between 1 and length
+            height          : height of the samples
+            params          : overrides of generator.BATCH_PARAMS (skew, blur, background, engine...)
+            workers         : number of worker processes
+            queue_depth     : number of samples rendered ahead of the consumer
+            seed            : when set, every sample only depends on the seed and its index
+            count           : number of samples to generate, None for an endless dataset
+            background_pool : number of pre-generated textures per background type in every worker
+        """
+
+        if (lang_dict is None) == (input_file is None):
+            raise ValueError('Exactly one of lang_dict and input_file must be given')
+
+        self.config = {
+            'lang_dict': lang_dict,
+            'input_file': input_file,
+            'length': length,
+            'allow_variable': allow_variable,
+            'height': height,
+            'params': dict(BATCH_PARAMS, **(params or {})),
+            'seed': seed,
+            'count': count,
+            'background_pool': background_pool,
+        }
+        self.worker_count = workers
+        self.queue_depth = queue_depth
+        self.count = count
+        self.processes = []
+        self.queue = None
+        self.stop_event = None
+        self.produced = None
+        self.consumed = 0
+        self.wait_seconds = 0.0
+        self.start_time = None
+
+    def start(self):
+        """
+            Start the workers, iterating over the dataset starts them when needed
+        """
+
+        if self.processes:
+            return
+        self.queue = Queue(maxsize=self.queue_depth)
+        self.stop_event = Event()
+        self.produced = Value('q', 0)
+        self.consumed = 0
+        self.wait_seconds = 0.0
+        self.start_time = time.perf_counter()
+        for k in range(self.worker_count):
+            process = Process(
+                target=_produce,
+                args=(k, self.worker_count, self.config, self.queue, self.stop_event, self.produced),
+                daemon=True,
+            )
+            process.start()
+            self.processes.append(process)
+
+    def close(self):
+        """
+            Stop the workers, the samples left in the queue are dropped
+        """
+
+        if not self.processes:
+            return
+        self.stop_event.set()
+        # Empty the queue so that workers blocked on a full queue see the stop event
+        for process in self.processes:
+            while process.is_alive():
+                try:
+                    self.queue.get(timeout=0.05)
+                except queue.Empty:
+                    pass
+            process.join()
+        self.queue.close()
+        self.processes = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        if self.count is None:
+            raise TypeError('An endless OnlineDataset has no length')
+        return self.count
+
+    def __iter__(self):
+        self.start()
+        while self.count is None or self.consumed < self.count:
+            yield self.get()
+        self.close()
+
+    def get(self):
+        """
+            Return the next (image, label) sample, waiting for the workers if the queue is empty
+        """
+
+        start = time.perf_counter()
+        while True:
+            try:
+                _, image, label = self.queue.get(timeout=1.0)
+                break
+            except queue.Empty:
+                if not any(process.is_alive() for process in self.processes):
+                    raise RuntimeError('The OnlineDataset workers exited')
+        self.wait_seconds += time.perf_counter() - start
+        self.consumed += 1
+        return image, label
+
+    def stats(self):
+        """
+            Return the producer and consumer rates in samples/s, the queue fill level and the
+            share of time the consumer spent waiting for samples. A consumer that waits a lot
+            needs more workers, a queue that stays full means the workers are ahead.
+        """
+
+        elapsed = max(time.perf_counter() - self.start_time, 1e-9) if self.start_time is not None else 1e-9
+        produced = self.produced.value if self.produced is not None else 0
+        try:
+            queued = self.queue.qsize() if self.queue is not None else 0
+        except NotImplementedError:
+            # Not available on macOS
+            queued = -1
+        return {
+            'workers': self.worker_count,
+            'produced': produced,
+            'consumed': self.consumed,
+            'producer_rate': produced / elapsed,
+            'consumer_rate': self.consumed / elapsed,
+            'queued': queued,
+            'queue_depth': self.queue_depth,
+            'wait_share': self.wait_seconds / elapsed,
+        }
+
+    def format_stats(self):
+        stats = self.stats()
+        return '{} workers: produced {} ({:.1f} samples/s), consumed {} ({:.1f} samples/s), queue {}/{}, waiting {:.0f}% of the time'.format(
+            stats['workers'],
+            stats['produced'],
+            stats['producer_rate'],
+            stats['consumed'],
+            stats['consumer_rate'],
+            stats['queued'],
+            stats['queue_depth'],
+            stats['wait_share'] * 100,
+        )
+
+def _produce(worker_index, worker_count, config, sample_queue, stop_event, produced):
+    """
+        Worker loop: render the samples of this worker's indices until the dataset is closed
+    """
+
+    params = config['params']
+    seed = config['seed']
+
+    if seed is None:
+        # Forked workers share the random state of the parent, draw a new one
+        random.seed()
+        cv2.setRNGSeed(random.randrange(2 ** 31))
+
+    fonts = sorted(os.listdir(params['font_dir']))
+    # Every worker maps the file and its cached line index, their pages are shared
+    lines = Corpus(config['input_file']) if config['input_file'] is not None else None
+    strings = DictStrings(config['lang_dict'], config['length'], config['allow_variable'], seed) if lines is None else None
+    render = create_sample_array if params['engine'] == 'numpy' else create_sample
+    set_background_pool(config['background_pool'], seed=seed)
+
+    index = worker_index
+    while not stop_event.is_set() and (config['count'] is None or index < config['count']):
+        if lines is not None:
+            text = lines[index % len(lines)]
+        else:
+            # The strings of run.py only depend on their index when seeded
+            text = strings.get(index)
+
+        if seed is not None:
+            font = fonts[random.Random(sample_seed(seed, index, 'font')).randrange(0, len(fonts))]
+            sample_seed_value = sample_seed(seed, index)
+        else:
+            font = fonts[random.randrange(0, len(fonts))]
+            sample_seed_value = None
+
+        image = render(text, font, config['height'], params['skewing_angle'], params['random_skew'], params['blur'],
+                       params['random_blur'], params['background_type'], font_dir=params['font_dir'],
+                       glyph_atlas=params['glyph_atlas'], seed=sample_seed_value)
+        item = (index, np.asarray(image, dtype=np.uint8), text)
+
+        while not stop_event.is_set():
+            try:
+                sample_queue.put(item, timeout=0.1)
+            except queue.Full:
+                continue
+            with produced.get_lock():
+                produced.value += 1
+            break
+        index += worker_count
@@ -0,0 +1,133 @@
+import json
+import os
+import time
+import numpy as np
+
+# Files of a packed store, in its directory
+IMAGES_FILE = 'images.bin'
+LABELS_FILE = 'labels.bin'
+INDEX_FILE = 'index.npy'
+META_FILE = 'meta.json'
+
+class PackedStoreWriter(object):
+    """
+        Write fixed height grayscale samples into a packed store: a directory holding every image
+        as raw uint8 rows concatenated in images.bin, the UTF-8 labels concatenated in labels.bin
+        and an int64 index.npy of (offset, width, label_offset) per sample. Reading a sample back
+        is a slice of a memory map, with no decoding.
+    """
+
+    def __init__(self, output_path, height):
+        """
+            output_path : directory of the store, created if needed
+            height      : height of every image
+        """
+
+        os.makedirs(output_path, exist_ok=True)
+        self.output_path = output_path
+        self.height = height
+        self.images = open(os.path.join(output_path, IMAGES_FILE), 'wb')
+        self.labels = open(os.path.join(output_path, LABELS_FILE), 'wb')
+        self.index = []
+        self.offset = 0
+        self.label_offset = 0
+        self.start_time = time.time()
+
+    def add(self, image, label):
+        """
+            Add an uint8 image of shape (height, width) and its label
+        """
+
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        if image.ndim != 2 or image.shape[0] != self.height:
+            raise ValueError('Expected a grayscale image of height {}, got shape {}'.format(self.height, image.shape))
+        self.add_raw(image.reshape(-1).data, label)
+
+    def add_raw(self, pixels, label):
+        """
+            Add an image given as its raw row major pixels (any bytes-like object of height * width bytes)
+        """
+
+        size = memoryview(pixels).nbytes
+        if size % self.height != 0:
+            raise ValueError('{} bytes is not a whole number of rows of height {}'.format(size, self.height))
+        label_bin = label.encode()
+        self.images.write(pixels)
+        self.labels.write(label_bin)
+        self.index.append((self.offset, size // self.height, self.label_offset))
+        self.offset += size
+        self.label_offset += len(label_bin)
+
+    def count(self):
+        return len(self.index)
+
+    def rate(self):
+        """
+            Number of samples written per second since the writer was opened
+        """
+
+        return self.count() / max(time.time() - self.start_time, 1e-9)
+
+    def summary(self):
+        return '{} samples ({:.1f} MiB of pixels) in {:.1f}s ({:.1f} samples/s)'.format(
+            self.count(), self.offset / 1024 / 1024, time.time() - self.start_time, self.rate()
+        )
+
+    def close(self):
+        """
+            Write the index and the metadata, returns the number of samples
+        """
+
+        self.images.close()
+        self.labels.close()
+        index = np.array(self.index, dtype=np.int64).reshape(-1, 3)
+        np.save(os.path.join(self.output_path, INDEX_FILE), index)
+        with open(os.path.join(self.output_path, META_FILE), 'w') as f:
+            json.dump({'height': self.height, 'count': len(index), 'pixels': self.offset, 'version': 1}, f)
+        return len(index)
+
+class PackedStore(object):
+    """
+        Random access reader of a packed store, images are views of a memory map of images.bin
+    """
+
+    def __init__(self, path):
+        with open(os.path.join(path, META_FILE), 'r') as f:
+            self.meta = json.load(f)
+        self.height = self.meta['height']
+        self.index = np.load(os.path.join(path, INDEX_FILE), mmap_mode='r')
+        self.images = self._memmap(os.path.join(path, IMAGES_FILE))
+        self.labels = self._memmap(os.path.join(path, LABELS_FILE))
+
+    @staticmethod
+    def _memmap(path):
+        # np.memmap cannot map an empty file
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, np.uint8)
+        return np.memmap(path, dtype=np.uint8, mode='r')
+
+    def __len__(self):
+        return len(self.index)
+
+    def image(self, i):
+        """
+            Return image i as a read only (height, width) uint8 view
+        """
+
+        offset, width, _ = self.index[i]
+        return self.images[offset:offset + self.height * width].reshape(self.height, width)
+
+    def label(self, i):
+        label_offset = self.index[i][2]
+        label_end = self.index[i + 1][2] if i + 1 < len(self.index) else len(self.labels)
+        return self.labels[label_offset:label_end].tobytes().decode()
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError('sample {} out of range'.format(i))
+        return self.image(i), self.label(i)
+
+    def widths(self):
+        return np.asarray(self.index[:, 1])
@@ -0,0 +1,56 @@
+import threading
+
+
+def bounded_imap_unordered(pool, func, iterable, chunksize, max_pending, start=None):
+    """
+        Like pool.imap_unordered, but never takes more than max_pending items from the iterable
+        ahead of the results that were consumed. Pool.imap_unordered alone hands the whole
+        iterable to its task queue as fast as it can, so a lazy iterable would still end up
+        fully materialized in the parent.
+
+        When start is given, the results are (index, ...) tuples yielded in index order from
+        start (see in_index_order). The results held back for the reordering stay in the window,
+        so a slow chunk stops the iterable instead of letting them pile up.
+    """
+
+    # A whole chunk must fit in the window or the pool would wait for it forever
+    max_pending = max(max_pending, chunksize)
+
+    pending = threading.Semaphore(max_pending)
+
+    def throttled():
+        for item in iterable:
+            pending.acquire()
+            yield item
+
+    results = pool.imap_unordered(func, throttled(), chunksize=chunksize)
+    if start is not None:
+        # The items are taken in index order, so the next index is always in the window
+        results = (result for _, result in in_index_order(((result[0], result) for result in results), start))
+
+    for result in results:
+        pending.release()
+        yield result
+
+
+def shard_range(count, shard_index, shard_count):
+    """
+        Return the [start, end) range of the indices created by one shard out of shard_count
+    """
+
+    return count * shard_index // shard_count, count * (shard_index + 1) // shard_count
+
+
+def in_index_order(results, start=0):
+    """
+        Reorder (index, value) results that complete in any order, holding back the early ones.
+        The first index is start.
+    """
+
+    pending = {}
+    next_index = start
+    for index, value in results:
+        pending[index] = value
+        while next_index in pending:
+            yield next_index, pending.pop(next_index)
+            next_index += 1
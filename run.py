@@ -1,13 +1,25 @@
 import argparse
 import os, errno
 import random
-import re
-import requests
+import shutil
 
-from bs4 import BeautifulSoup
 from PIL import Image, ImageFont
-from generator import create_and_save_sample
-from multiprocessing import Pool
+from timing import enable_timing, collect_timings, write_timings
+from font_cache import set_font_cache_size, print_font_cache_info
+from create_dataset import createDatasetFromSamples
+from shm_ring import SlotRing
+from tar_shards import TarShardWriter
+from checkpoint import Checkpoint, load_checkpoint
+from packed_store import PackedStoreWriter
+from wikipedia_source import WikipediaSource
+from corpus import Corpus
+from dict_strings import DictStrings
+from compiled_lexicon import load_lexicon
+from file_output import fan_out_dir, set_file_writer
+from pool_utils import bounded_imap_unordered, in_index_order, shard_range
+from generator import ENGINES, create_and_save_sample, create_and_encode_sample, sample_seed, set_background_pool, set_encoder
+from encoders import BACKENDS
+from multiprocessing import Pool, util
 
 def parse_arguments():
     """
@@ -30,6 +42,13 @@ def parse_arguments():
         help="When set, this argument uses a specified text file as source for the text",
         default=""
     )
+    parser.add_argument(
+        "-ir",
+        "--input_random",
+        action="store_true",
+        help="When set, the lines of the input file are picked at random instead of in order",
+        default=False
+    )
     parser.add_argument(
         "-l",
         "--language",
@@ -96,9 +115,43 @@ def parse_arguments():
         "--extension",
         type=str,
         nargs="?",
-        help="Define the extension to save the image with",
+        help="Define the extension to save the image with (jpg, png, webp or npy for the raw pixels)",
         default="jpg",
     )
+    parser.add_argument(
+        "-ch",
+        "--channels",
+        type=int,
+        nargs="?",
+        choices=[1, 3],
+        help="Define whether the images are saved as RGB (3) or grayscale (1)",
+        default=3,
+    )
+    parser.add_argument(
+        "-eb",
+        "--encoder_backend",
+        type=str,
+        nargs="?",
+        choices=BACKENDS,
+        help="Define which library encodes the images, by default PIL for the pil engine and OpenCV for the numpy one",
+        default=None,
+    )
+    parser.add_argument(
+        "-q",
+        "--quality",
+        type=int,
+        nargs="?",
+        help="Define the JPEG or WebP quality, 75 for JPEG by default",
+        default=None,
+    )
+    parser.add_argument(
+        "-pc",
+        "--png_compression",
+        type=int,
+        nargs="?",
+        help="Define the PNG compression level, from 0 (fastest) to 9 (smallest)",
+        default=None,
+    )
     parser.add_argument(
         "-k",
         "--skew_angle",
@@ -121,6 +174,30 @@ def parse_arguments():
         help="Use Wikipedia as the source text for the generation, using this paremeter ignores -r, -n, -s",
         default=False,
     )
+    parser.add_argument(
+        "-wc",
+        "--wikipedia_concurrency",
+        type=int,
+        nargs="?",
+        help="Define how many Wikipedia pages are fetched at the same time",
+        default=8,
+    )
+    parser.add_argument(
+        "-wd",
+        "--wikipedia_cache",
+        type=str,
+        nargs="?",
+        help="When set, the fetched Wikipedia pages are kept in this directory and used first by the next runs",
+        default="",
+    )
+    parser.add_argument(
+        "-wu",
+        "--wikipedia_url",
+        type=str,
+        nargs="?",
+        help="When set, the random pages are fetched from this server instead of https://{language}.wikipedia.org",
+        default="",
+    )
     parser.add_argument(
         "-bl",
         "--blur",
@@ -145,90 +222,455 @@ def parse_arguments():
         help="Define what kind of background to use. 0: Gaussian Noise, 1: Plain white, 2: Quasicrystal",
         default=0,
     )
+    parser.add_argument(
+        "-fc",
+        "--font_cache_size",
+        type=int,
+        nargs="?",
+        help="Define how many fonts each worker keeps loaded in its font cache",
+        default=64,
+    )
+    parser.add_argument(
+        "-fcs",
+        "--font_cache_stats",
+        action="store_true",
+        help="When set, every worker prints the hits and misses of its font cache when it exits",
+        default=False
+    )
+    parser.add_argument(
+        "-bp",
+        "--background_pool",
+        type=int,
+        nargs="?",
+        help="Define how many large textures per background type each worker pre-generates and crops backgrounds from. 0 creates a new background for every sample",
+        default=0,
+    )
+    parser.add_argument(
+        "-bpr",
+        "--background_pool_refresh",
+        type=int,
+        nargs="?",
+        help="Replace one pooled texture every N samples of a worker. 0 never replaces them, which --seed requires",
+        default=0,
+    )
+    parser.add_argument(
+        "-bpc",
+        "--background_pool_cache",
+        type=str,
+        nargs="?",
+        help="When set, pooled textures are loaded from (or saved to) this directory",
+        default=None,
+    )
+    parser.add_argument(
+        "-lm",
+        "--lmdb",
+        type=str,
+        nargs="?",
+        help="When set, the samples are written straight into a LMDB dataset at this path instead of image files",
+        default=""
+    )
+    parser.add_argument(
+        "-ta",
+        "--tar",
+        type=str,
+        nargs="?",
+        help="When set, the samples are written into sequential tar shards ({key}.jpg and {key}.txt pairs) in this directory instead of image files",
+        default=""
+    )
+    parser.add_argument(
+        "-tc",
+        "--tar_count",
+        type=int,
+        nargs="?",
+        help="Define how many samples a tar shard holds at most",
+        default=10000,
+    )
+    parser.add_argument(
+        "-tb",
+        "--tar_bytes",
+        type=int,
+        nargs="?",
+        help="When set, a new tar shard is also started once a shard reaches this many MiB",
+        default=0,
+    )
+    parser.add_argument(
+        "-pk",
+        "--packed",
+        type=str,
+        nargs="?",
+        help="When set, the samples are written as raw grayscale pixels into a packed memory mappable store at this path (see packed_store.py) instead of image files",
+        default=""
+    )
+    parser.add_argument(
+        "-st",
+        "--stream",
+        action="store_true",
+        help="When set, strings and sample parameters are created lazily as the workers consume them, keeping memory flat whatever --count is",
+        default=False
+    )
+    parser.add_argument(
+        "-cs",
+        "--chunk_size",
+        type=int,
+        nargs="?",
+        help="Define how many samples are sent to a worker at once in streaming mode",
+        default=64,
+    )
+    parser.add_argument(
+        "-fo",
+        "--fan_out",
+        type=int,
+        nargs="?",
+        help="When set, the images are spread over two levels of this many subdirectories picked from a hash of their index, files are named after the index and the labels go to image_list.txt / label_list.txt. 0 keeps a single directory",
+        default=0,
+    )
+    parser.add_argument(
+        "-wt",
+        "--writer_threads",
+        type=int,
+        nargs="?",
+        help="Define how many threads per worker write the image files, so that encoding and writing overlap. 0 writes them from the worker itself",
+        default=0,
+    )
+    parser.add_argument(
+        "-sm",
+        "--shared_memory",
+        type=int,
+        nargs="?",
+        help="When set with --lmdb, --tar or --packed, the workers write the encoded images into shared memory slots of this many KiB instead of sending them through a pipe. 0 disables it",
+        default=0,
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        type=int,
+        nargs="?",
+        help="When set, every sample (text, font, skew, blur, color and background) only depends on this seed and its index",
+        default=None,
+    )
+    parser.add_argument(
+        "-si",
+        "--shard_index",
+        type=int,
+        nargs="?",
+        help="Define which slice of the --count samples to create, between 0 and --shard_count - 1",
+        default=0,
+    )
+    parser.add_argument(
+        "-sc",
+        "--shard_count",
+        type=int,
+        nargs="?",
+        help="Define in how many slices the samples are split, to create them on several machines. Requires --seed",
+        default=1,
+    )
+    parser.add_argument(
+        "-ck",
+        "--checkpoint",
+        action="store_true",
+        help="When set, the finished samples are recorded in checkpoint.txt of the output directory as they complete, so that the run can be resumed",
+        default=False
+    )
+    parser.add_argument(
+        "-rs",
+        "--resume",
+        action="store_true",
+        help="Skip the samples recorded in the checkpoint of a previous run (with the same arguments) and go on with the others. Requires --seed",
+        default=False
+    )
+
+    parser.add_argument(
+        "-en",
+        "--engine",
+        type=str,
+        nargs="?",
+        choices=ENGINES,
+        help="Define how samples are composited. pil: PIL images, numpy: a single uint8 array handled by OpenCV (faster, slightly different resampling)",
+        default='pil',
+    )
+
+    parser.add_argument(
+        "-tm",
+        "--timing",
+        type=str,
+        nargs="?",
+        help="When set, the time spent in every stage of the sample creation is measured in the workers, printed as a table and saved as JSON to this path",
+        default=""
+    )
+    parser.add_argument(
+        "-tmm",
+        "--timing_memory",
+        action="store_true",
+        help="When set with --timing, the peak memory allocated by every stage is also measured with tracemalloc (which slows the stages down)",
+        default=False
+    )
+
+    args = parser.parse_args()
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard_index must be between 0 and --shard_count - 1")
+    if args.shard_count > 1 and args.seed is None:
+        parser.error("--shard_count requires --seed so that the shards match a single run")
+    if args.shard_count > 1 and args.use_wikipedia:
+        parser.error("Wikipedia sentences cannot be sharded, they are not reproducible")
+    if args.background_pool_refresh > 0 and args.seed is not None:
+        parser.error("--background_pool_refresh cannot be used with --seed, the refreshed textures depend on what each worker created before")
+    if sum(output != '' for output in (args.lmdb, args.tar, args.packed)) > 1:
+        parser.error("Only one of --lmdb, --tar and --packed can be used")
+    if args.shared_memory > 0 and not encoded_output(args):
+        parser.error("--shared_memory requires --lmdb, --tar or --packed")
+    if args.resume and args.seed is None:
+        parser.error("--resume requires --seed so that the remaining samples match the ones of the first run")
+    if (args.checkpoint or args.resume) and (encoded_output(args) or args.use_wikipedia):
+        parser.error("--checkpoint and --resume only work with image files from a dictionary or an input file")
+    if args.packed != '':
+        # The packed store holds the bare grayscale pixels
+        args.extension = 'raw'
+        args.channels = 1
+
+    return args
+
+# Shared memory ring the worker writes the encoded samples into, set by init_worker
+_slot_ring = None
+
+def encoded_output(args):
+    """
+        Whether the workers return encoded samples to a single writer instead of saving files
+    """
+
+    return args.lmdb != '' or args.tar != '' or args.packed != ''
+
+def init_worker(font_cache_size, font_cache_stats, background_pool, background_pool_refresh, background_pool_cache, seed,
+                timing_dir, writer_threads=0, encoder_args=(), ring_name=None, ring_slot_count=0, ring_slot_size=0,
+                timing_memory=False):
+    """
+        Initialize the state local to a pool worker
+    """
+
+    global _slot_ring
+
+    if ring_name is not None:
+        _slot_ring = SlotRing(ring_slot_count, ring_slot_size, ring_name)
+    if timing_dir is not None:
+        enable_timing(timing_dir, timing_memory)
+    set_font_cache_size(font_cache_size)
+    set_file_writer(writer_threads)
+    set_encoder(*encoder_args)
+    set_background_pool(background_pool, background_pool_refresh, background_pool_cache, seed)
+    if font_cache_stats:
+        # Run when the worker exits after the pool is closed
+        util.Finalize(None, print_font_cache_info, exitpriority=10)
+
+def encode_sample_from_args(sample_args):
+    """
+        Unpack the arguments of create_and_encode_sample (Pool.imap passes a single argument)
+    """
+
+    return create_and_encode_sample(*sample_args)
+
+def encode_sample_to_slot(slot_sample_args):
+    """
+        Encode a sample into the shared memory slot it was given and return (index, slot, length,
+        payload, label). The payload is None unless the image did not fit in the slot.
+    """
+
+    slot, sample_args = slot_sample_args
+    index, image_bin, label = create_and_encode_sample(*sample_args)
+    if _slot_ring.write(slot, image_bin):
+        return index, slot, len(image_bin), None, label
+    return index, slot, len(image_bin), image_bin, label
+
+def save_sample_from_args(sample_args):
+    """
+        Unpack the arguments of create_and_save_sample (Pool.imap passes a single argument)
+    """
+
+    create_and_save_sample(*sample_args)
+    return sample_args[0]
+
+def iter_sample_args(strings, fonts, args, encode, start=0, manifest=None, done=None):
+    """
+        Lazily yield the arguments of every sample, picking its font as it goes. With --fan_out,
+        the files are named after the sample index and manifest is the (image list, label list)
+        pair of files their paths and labels are written to. The samples whose index is in done
+        and whose file exists are skipped, they still go to the manifest.
+    """
+
+    for i, text in enumerate(strings, start):
+        if args.seed is not None:
+            font = fonts[random.Random(sample_seed(args.seed, i, 'font')).randrange(0, len(fonts))]
+            seed = sample_seed(args.seed, i)
+        else:
+            font = fonts[random.randrange(0, len(fonts))]
+            seed = None
+        if encode:
+            yield (i, text, font, args.format, args.extension, args.skew_angle, args.random_skew,
+                   args.blur, args.random_blur, args.background, 'fonts', False, seed, args.engine)
+        else:
+            file_name = None
+            if args.fan_out > 0:
+                file_name = '{}/{:09d}.{}'.format(fan_out_dir(i, args.fan_out), i, args.extension)
+                manifest[0].write(file_name + '\n')
+                manifest[1].write(text + '\n')
+            if done is not None and str(i) in done:
+                # The file may be missing if the run died while it was written in the background
+                path = os.path.join(args.output_dir, file_name or '{}_{}.{}'.format(text, str(i), args.extension))
+                if os.path.exists(path):
+                    continue
+            yield (i, text, font, args.output_dir, args.format, args.extension, args.skew_angle, args.random_skew,
+                   args.blur, args.random_blur, args.background, file_name, 'fonts', False, seed, args.engine)
+
+def stream_samples(pool, strings, fonts, args, start=0, manifest=None, checkpoint=None, done=None):
+    """
+        Feed the samples to the pool as they are created, never holding more than a few chunks
+        per worker in the parent, so its memory does not depend on --count
+    """
+
+    encode = encoded_output(args)
+    results = bounded_imap_unordered(
+        pool,
+        encode_sample_from_args if encode else save_sample_from_args,
+        iter_sample_args(strings, fonts, args, encode, start, manifest, done),
+        args.chunk_size,
+        args.chunk_size * args.thread_count * 4,
+        start if encode else None,
+    )
+
+    if encode:
+        # The results come in index order, as (index, image, label)
+        write_encoded_samples(args, results)
+    else:
+        for index in results:
+            if checkpoint is not None:
+                checkpoint.done(index)
+
+def ring_samples(pool, ring, strings, fonts, args, start=0):
+    """
+        Same as stream_samples into LMDB or tar shards, but the encoded images go through the shared memory
+        slots of ring: the pipe only carries small tuples and the writer reads the slots in place
+    """
+
+    results = pool.imap_unordered(
+        encode_sample_to_slot,
+        ring.with_slots(iter_sample_args(strings, fonts, args, True, start)),
+        chunksize=args.chunk_size,
+    )
+    ordered = in_index_order(
+        ((index, (slot, length, payload, label)) for index, slot, length, payload, label in results), start
+    )
+
+    def samples():
+        for index, (slot, length, payload, label) in ordered:
+            image = ring.view(slot, length) if payload is None else payload
+            yield index, image, label
+            # The writer has copied the image once it asks for the next sample
+            if payload is None:
+                image.release()
+            ring.release(slot)
+
+    write_encoded_samples(args, samples())
 
-    return parser.parse_args()
+def write_encoded_samples(args, samples):
+    """
+        Write (index, encoded image, label) samples coming in index order into the LMDB dataset,
+        the tar shards (keyed by index) or the packed store
+    """
+
+    if args.lmdb != '':
+        createDatasetFromSamples(args.lmdb, ((image, label) for _, image, label in samples))
+        return
+
+    if args.packed != '':
+        writer = PackedStoreWriter(args.packed, args.format)
+        for _, pixels, label in samples:
+            writer.add_raw(pixels, label)
+            if writer.count() % 1000 == 0:
+                print('Written %d (%.1f samples/s)' % (writer.count(), writer.rate()))
+        writer.close()
+        print('Created packed store with %s' % writer.summary())
+        return
+
+    prefix = 'shard-{}of{}'.format(args.shard_index, args.shard_count) if args.shard_count > 1 else 'shard'
+    writer = TarShardWriter(args.tar, prefix, args.tar_count, args.tar_bytes * 1024 * 1024 or None)
+    for index, image, label in samples:
+        writer.add('{:09d}'.format(index), image, args.extension, label)
+        if writer.count() % 1000 == 0:
+            print('Written %d (%.1f samples/s)' % (writer.count(), writer.rate()))
+    writer.close()
+    print('Created tar shards with %s' % writer.summary())
 
 def load_dict(lang):
     """
-        Read the dictionnary file and returns all words in it.
+        Read the dictionnary file and returns all words in it, through its compiled lexicon
+        (dicts/{lang}.lex, compiled again when the text file changes)
     """
 
-    lang_dict = []
-    with open(os.path.join('dicts', lang + '.txt'), 'r') as d:
-        lang_dict = d.readlines()
-    return lang_dict
+    return load_lexicon(os.path.join('dicts', lang + '.txt'))
 
 def load_fonts():
     """
         Load all fonts in the fonts directory
     """
 
-    return [font for font in os.listdir('fonts')]
+    # Sorted so that the font picked for a sample does not depend on the file system
+    return sorted(os.listdir('fonts'))
 
 def create_strings_from_file(filename, count):
     """
         Create all strings by reading lines in specified files
     """
 
-    strings = []
+    return list(iter_strings_from_file(filename, count))
 
-    with open(filename, 'r') as f:
-        lines = [l.strip()[0:200] for l in f.readlines()]
-        if len(lines) == 0:
-            raise Exception("No lines could be read in file")
-        while len(strings) < count:
-            if len(lines) > count - len(strings):
-                strings.extend(lines[0:count - len(strings)])
-            else:
-                strings.extend(lines)
+def iter_strings_from_file(filename, count, start=0, random_lines=False, seed=None):
+    """
+        Lazily yield the strings of indices start to count - 1 by reading lines in specified files,
+        starting over at the end of the file, or picking random lines. When a seed is given, the
+        random line of a string only depends on the seed and its index.
+    """
 
-    return strings
+    with Corpus(filename) as corpus:
+        if not random_lines:
+            for line in corpus.iter_lines(count, start):
+                yield line
+            return
+        for i in range(start, count):
+            yield corpus.sample(random.Random(sample_seed(seed, i, 'line')) if seed is not None else random)
 
 def create_strings_from_dict(length, allow_variable, count, lang_dict):
     """
         Create all strings by picking X random word in the dictionnary
     """
 
-    dict_len = len(lang_dict)
-    strings = []
-    for _ in range(0, count):
-        current_string = ""
-        for _ in range(0, random.randint(1, length) if allow_variable else length):
-            current_string += lang_dict[random.randrange(dict_len)][:-1]
-            current_string += ' '
-        strings.append(current_string[:-1])
-    return strings
+    return list(iter_strings_from_dict(length, allow_variable, count, lang_dict))
 
-def create_strings_from_wikipedia(minimum_length, count, lang):
+def iter_strings_from_dict(length, allow_variable, count, lang_dict, start=0, seed=None):
     """
-        Create all string by randomly picking Wikipedia articles and taking sentences from them.
+        Lazily yield the strings of indices start to count - 1, made of X random words of the dictionnary,
+        drawn a chunk at a time (see dict_strings.py). When a seed is given, each string only depends on
+        the seed and its index.
     """
-    sentences = []
 
-    while len(sentences) < count:
-        # We fetch a random page
-        page = requests.get('https://{}.wikipedia.org/wiki/Special:Random'.format(lang))
+    return DictStrings(lang_dict, length, allow_variable, seed).iter_strings(count, start)
 
-        soup = BeautifulSoup(page.text, 'html.parser')
-
-        for script in soup(["script", "style"]):
-            script.extract()
+def create_strings_from_wikipedia(minimum_length, count, lang):
+    """
+        Create all string by randomly picking Wikipedia articles and taking sentences from them.
+    """
 
-        # Only take a certain length
-        lines = list(filter(
-            lambda s:
-                len(s.split(' ')) > minimum_length
-                and not "Wikipedia" in s
-                and not "wikipedia" in s,
-            [
-                ' '.join(re.findall(r"[\w']+", s.strip()))[0:200] for s in soup.get_text().splitlines()
-            ]
-        ))
+    return list(iter_strings_from_wikipedia(minimum_length, count, lang))
 
-        # Remove the last lines that talks about contributing
-        sentences.extend(lines[0:max([1, len(lines) - 5])])
+def iter_strings_from_wikipedia(minimum_length, count, lang, concurrency=8, cache_dir=None, base_url=None):
+    """
+        Lazily yield count sentences of random Wikipedia articles, fetched concurrently as they are needed
+    """
 
-    return sentences[0:count]
+    sentences = WikipediaSource(lang, concurrency, cache_dir, base_url).sentences(minimum_length)
+    try:
+        for _ in range(count):
+            yield next(sentences)
+    finally:
+        sentences.close()
 
 def main():
     """
@@ -251,37 +693,99 @@ def main():
     # Create font (path) list
     fonts = load_fonts()
 
-    # Creating synthetic sentences (or word)
-    strings = []
+    # Every worker writes its stage timings there when it exits
+    timing_dir = args.timing + '.parts' if args.timing != '' else None
+
+    # Only the samples of this shard are created, they keep their index in the whole dataset
+    start, end = shard_range(args.count, args.shard_index, args.shard_count)
+
+    # Enough slots for a few chunks per worker, a whole chunk must fit or the pool would wait forever
+    ring = None
+    if args.shared_memory > 0:
+        ring = SlotRing(args.chunk_size * args.thread_count * 4, args.shared_memory * 1024)
+
+    p = Pool(
+        args.thread_count,
+        initializer=init_worker,
+        initargs=(
+            args.font_cache_size,
+            args.font_cache_stats,
+            args.background_pool,
+            args.background_pool_refresh,
+            args.background_pool_cache,
+            args.seed,
+            timing_dir,
+            args.writer_threads,
+            (args.channels, args.encoder_backend, args.quality, args.png_compression),
+            ring.name if ring is not None else None,
+            ring.slot_count if ring is not None else 0,
+            ring.slot_size if ring is not None else 0,
+            args.timing_memory,
+        )
+    )
 
+    # Creating synthetic sentences (or word) as they are needed
     if args.use_wikipedia:
-        strings = create_strings_from_wikipedia(args.length, args.count, args.language)
+        strings = iter_strings_from_wikipedia(args.length, args.count, args.language, args.wikipedia_concurrency,
+                                              args.wikipedia_cache or None, args.wikipedia_url or None)
     elif args.input_file != '':
-        strings = create_strings_from_file(args.input_file, args.count)
+        strings = iter_strings_from_file(args.input_file, end, start, args.input_random, args.seed)
     else:
-        strings = create_strings_from_dict(args.length, args.random, args.count, lang_dict)
-
-
-    string_count = len(strings)
-
-    p = Pool(args.thread_count)
-    p.starmap(
-        create_and_save_sample,
-        zip(
-            [i for i in range(0, string_count)],
-            strings,
-            [fonts[random.randrange(0, len(fonts))] for _ in range(0, string_count)],
-            [args.output_dir] * string_count,
-            [args.format] * string_count,
-            [args.extension] * string_count,
-            [args.skew_angle] * string_count,
-            [args.random_skew] * string_count,
-            [args.blur] * string_count,
-            [args.random_blur] * string_count,
-            [args.background] * string_count,
+        strings = iter_strings_from_dict(args.length, args.random, end, lang_dict, start, args.seed)
+
+    suffix = '_{}of{}'.format(args.shard_index, args.shard_count) if args.shard_count > 1 else ''
+
+    # The indices of the finished samples are appended to the checkpoint as they complete
+    checkpoint = None
+    done = None
+    if args.checkpoint or args.resume:
+        checkpoint_path = os.path.join(args.output_dir, 'checkpoint' + suffix + '.txt')
+        if args.resume:
+            done = load_checkpoint(checkpoint_path)
+            print('Resuming, {} samples were finished'.format(len(done)))
+        checkpoint = Checkpoint(checkpoint_path, args.resume)
+
+    # With --fan_out the labels are not in the file names, they go to manifests like the ones of run2.py
+    manifest = None
+    if args.fan_out > 0 and not encoded_output(args):
+        manifest = (
+            open(os.path.join(args.output_dir, 'image_list' + suffix + '.txt'), 'w'),
+            open(os.path.join(args.output_dir, 'label_list' + suffix + '.txt'), 'w'),
         )
-    )
-    p.terminate()
+
+    if ring is not None:
+        ring_samples(p, ring, strings, fonts, args, start)
+    elif args.stream:
+        stream_samples(p, strings, fonts, args, start, manifest, checkpoint, done)
+    elif encoded_output(args):
+        # Workers return the encoded images and a single writer streams them into LMDB, tar shards or the packed store
+        samples = list(iter_sample_args(strings, fonts, args, True, start))
+        results = p.imap(encode_sample_from_args, samples, chunksize=64)
+        write_encoded_samples(args, results)
+    else:
+        samples = list(iter_sample_args(strings, fonts, args, False, start, manifest, done))
+        if checkpoint is not None:
+            for index in p.imap_unordered(save_sample_from_args, samples, chunksize=args.chunk_size):
+                checkpoint.done(index)
+        else:
+            p.map(save_sample_from_args, samples)
+
+    p.close()
+    p.join()
+
+    if ring is not None:
+        ring.close()
+
+    if manifest is not None:
+        for manifest_file in manifest:
+            manifest_file.close()
+
+    if checkpoint is not None:
+        checkpoint.close()
+
+    if timing_dir is not None:
+        print(write_timings(collect_timings(timing_dir), args.timing))
+        shutil.rmtree(timing_dir)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 import argparse
 import sys, os, errno
 import random
+import shutil
 # import re
 # import requests
 import cv2
@@ -8,106 +9,18 @@ import math
 import numpy as np
 
 # from bs4 import BeautifulSoup
-from multiprocessing import Pool
-from PIL import Image, ImageFont, ImageDraw, ImageFilter
-from create_dataset import createDataset
-
-# ----------------------------------------------------------------------------------------------------------------------
-def create_and_save_sample(index, text, font, out_dir, height, extension, skewing_angle, random_skew, blur, random_blur,
-                           background_type, file_name=None):
-    image_font = ImageFont.truetype(font=os.path.join('fonts_zh', font), size=32)
-    text_width, text_height = image_font.getsize(text)
-
-    txt_img = Image.new('L', (text_width, text_height), 255)
-
-    txt_draw = ImageDraw.Draw(txt_img)
-
-    txt_draw.text((0, 0), text, fill=random.randint(1, 80), font=image_font)
-
-    random_angle = random.randint(0 - skewing_angle, skewing_angle)
-
-    rotated_img = txt_img.rotate(skewing_angle if not random_skew else random_angle, expand=1)
-
-    new_text_width, new_text_height = rotated_img.size
-
-    # We create our background a bit bigger than the text
-    background = None
-
-    if background_type == 0:
-        background = create_gaussian_noise_background(new_text_height + 10, new_text_width + 10)
-    elif background_type == 1:
-        background = create_plain_white_background(new_text_height + 10, new_text_width + 10)
-    else:
-        background = create_quasicrystal_background(new_text_height + 10, new_text_width + 10)
-
-    mask = rotated_img.point(lambda x: 0 if x == 255 or x == 0 else 255, '1')
-
-    background.paste(rotated_img, (5, 5), mask=mask)
-
-    # Create the name for our image
-    image_name = file_name if file_name else '{}_{}.{}'.format(text, str(index), extension)
-
-    # Resizing the image to desired format
-    new_width = float(text_width + 10) * (float(height) / float(text_height + 10))
-    image_on_background = background.resize((int(new_width), height), Image.ANTIALIAS)
-
-    final_image = image_on_background.filter(
-        ImageFilter.GaussianBlur(
-            radius=(blur if not random_blur else random.randint(0, blur))
-        )
-    )
-
-    # Save the image
-    final_image.convert('RGB').save(os.path.join(out_dir, image_name))
-    # print(os.path.join(out_dir, image_name))
-
-
-def create_gaussian_noise_background(height, width):
-    """
-        Create a background with Gaussian noise (to mimic paper)
-    """
-
-    # We create an all white image
-    image = np.ones((height, width)) * 255
-
-    # We add gaussian noise
-    cv2.randn(image, 235, 10)
-
-    return Image.fromarray(image).convert('L')
-
-
-def create_plain_white_background(height, width):
-    """
-        Create a plain white background
-    """
-
-    return Image.new("L", (width, height), 255)
-
-
-def create_quasicrystal_background(height, width):
-    """
-        Create a background with quasicrystal (https://en.wikipedia.org/wiki/Quasicrystal)
-    """
-
-    image = Image.new("L", (width, height))
-    pixels = image.load()
-
-    frequency = random.random() * 30 + 20  # frequency
-    phase = random.random() * 2 * math.pi  # phase
-    rotation_count = random.randint(10, 20)  # of rotations
-
-    for kw in range(width):
-        y = float(kw) / (width - 1) * 4 * math.pi - 2 * math.pi
-        for kh in range(height):
-            x = float(kh) / (height - 1) * 4 * math.pi - 2 * math.pi
-            z = 0.0
-            for i in range(rotation_count):
-                r = math.hypot(x, y)
-                a = math.atan2(y, x) + i * math.pi * 2.0 / rotation_count
-                z += math.cos(r * math.sin(a) * frequency + phase)
-            c = int(255 - round(255 * z / rotation_count))
-            pixels[kw, kh] = c  # grayscale
-    return image
+from multiprocessing import Pool, util
+from create_dataset import createDataset, LmdbWriter
+from tar_shards import TarShardWriter
+from packed_store import PackedStoreWriter
+from file_output import fan_out_dir, set_file_writer, close_file_writer
+from checkpoint import Checkpoint, load_checkpoint
+from compiled_lexicon import load_lexicon
+from timing import enable_timing, flush_timing, collect_timings, write_timings
+from font_cache import print_font_cache_info
+from pool_utils import in_index_order, shard_range
+from generator import ENGINES, create_and_save_sample, create_and_encode_sample, sample_seed, set_background_pool, set_encoder
+from encoders import BACKENDS
 
 
 # ----------------------------------------------------------------------------------------------------------------------
@@ -198,9 +111,43 @@ def parse_arguments():
         "--extension",
         type=str,
         nargs="?",
-        help="Define the extension to save the image with",
+        help="Define the extension to save the image with (jpg, png, webp or npy for the raw pixels)",
         default="jpg",
     )
+    parser.add_argument(
+        "-ch",
+        "--channels",
+        type=int,
+        nargs="?",
+        choices=[1, 3],
+        help="Define whether the images are saved as RGB (3) or grayscale (1)",
+        default=3,
+    )
+    parser.add_argument(
+        "-eb",
+        "--encoder_backend",
+        type=str,
+        nargs="?",
+        choices=BACKENDS,
+        help="Define which library encodes the images, by default PIL for the pil engine and OpenCV for the numpy one",
+        default=None,
+    )
+    parser.add_argument(
+        "-q",
+        "--quality",
+        type=int,
+        nargs="?",
+        help="Define the JPEG or WebP quality, 75 for JPEG by default",
+        default=None,
+    )
+    parser.add_argument(
+        "-pc",
+        "--png_compression",
+        type=int,
+        nargs="?",
+        help="Define the PNG compression level, from 0 (fastest) to 9 (smallest)",
+        default=None,
+    )
     parser.add_argument(
         "-k",
         "--skew_angle",
@@ -247,8 +194,245 @@ def parse_arguments():
         help="Define what kind of background to use. 0: Gaussian Noise, 1: Plain white, 2: Quasicrystal",
         default=0,
     )
+    parser.add_argument(
+        "-ga",
+        "--glyph_atlas",
+        action="store_true",
+        help="When set, lines are built from cached glyph bitmaps instead of drawing every string with FreeType (no kerning)",
+        default=False
+    )
+    parser.add_argument(
+        "-bp",
+        "--background_pool",
+        type=int,
+        nargs="?",
+        help="Define how many large textures per background type are pre-generated to crop backgrounds from. 0 creates a new background for every sample",
+        default=0,
+    )
+    parser.add_argument(
+        "-bpr",
+        "--background_pool_refresh",
+        type=int,
+        nargs="?",
+        help="Replace one pooled texture every N samples. 0 never replaces them, which --seed requires",
+        default=0,
+    )
+    parser.add_argument(
+        "-bpc",
+        "--background_pool_cache",
+        type=str,
+        nargs="?",
+        help="When set, pooled textures are loaded from (or saved to) this directory",
+        default=None,
+    )
+    parser.add_argument(
+        "-lm",
+        "--lmdb",
+        type=str,
+        nargs="?",
+        help="When set, the samples of all tasks are written straight into a LMDB dataset at this path instead of image files and lists",
+        default=""
+    )
+    parser.add_argument(
+        "-ta",
+        "--tar",
+        type=str,
+        nargs="?",
+        help="When set, the samples of all tasks are written into sequential tar shards ({task}/{name}.jpg and .txt pairs) in this directory instead of image files and lists",
+        default=""
+    )
+    parser.add_argument(
+        "-tc",
+        "--tar_count",
+        type=int,
+        nargs="?",
+        help="Define how many samples a tar shard holds at most",
+        default=10000,
+    )
+    parser.add_argument(
+        "-tb",
+        "--tar_bytes",
+        type=int,
+        nargs="?",
+        help="When set, a new tar shard is also started once a shard reaches this many MiB",
+        default=0,
+    )
+    parser.add_argument(
+        "-pk",
+        "--packed",
+        type=str,
+        nargs="?",
+        help="When set, the samples of all tasks are written as raw grayscale pixels into a packed memory mappable store at this path (see packed_store.py) instead of image files and lists",
+        default=""
+    )
+    parser.add_argument(
+        "-cs",
+        "--chunk_size",
+        type=int,
+        nargs="?",
+        help="Define how many samples are sent to a worker at once when --thread_count is above 1",
+        default=64,
+    )
+    parser.add_argument(
+        "-fcs",
+        "--font_cache_stats",
+        action="store_true",
+        help="When set, the hits and misses of the font cache of every worker are printed when it exits",
+        default=False
+    )
+    parser.add_argument(
+        "-sd",
+        "--seed",
+        type=int,
+        nargs="?",
+        help="When set, the task plan and every sample only depend on this seed (and the sample index)",
+        default=None,
+    )
+    parser.add_argument(
+        "-si",
+        "--shard_index",
+        type=int,
+        nargs="?",
+        help="Define which slice of every task to create, between 0 and --shard_count - 1",
+        default=0,
+    )
+    parser.add_argument(
+        "-sc",
+        "--shard_count",
+        type=int,
+        nargs="?",
+        help="Define in how many slices every task is split, to create them on several machines. Requires --seed",
+        default=1,
+    )
+
+    parser.add_argument(
+        "-en",
+        "--engine",
+        type=str,
+        nargs="?",
+        choices=ENGINES,
+        help="Define how samples are composited. pil: PIL images, numpy: a single uint8 array handled by OpenCV (faster, slightly different resampling)",
+        default='pil',
+    )
+    parser.add_argument(
+        "-fo",
+        "--fan_out",
+        type=int,
+        nargs="?",
+        help="When set, the images are spread over two levels of this many subdirectories picked from a hash of their index, the manifests hold the paths. 0 keeps a single directory",
+        default=0,
+    )
+    parser.add_argument(
+        "-wt",
+        "--writer_threads",
+        type=int,
+        nargs="?",
+        help="Define how many threads per worker write the image files, so that encoding and writing overlap. 0 writes them from the worker itself",
+        default=0,
+    )
+    parser.add_argument(
+        "-ck",
+        "--checkpoint",
+        action="store_true",
+        help="When set, the finished samples are recorded in out2/checkpoint.txt as they complete, so that the run can be resumed",
+        default=False
+    )
+    parser.add_argument(
+        "-rs",
+        "--resume",
+        action="store_true",
+        help="Skip the samples recorded in the checkpoint of a previous run (with the same arguments) and go on with the others. Requires --seed",
+        default=False
+    )
+
+    parser.add_argument(
+        "-tm",
+        "--timing",
+        type=str,
+        nargs="?",
+        help="When set, the time spent in every stage of the sample creation is measured, added to the log and saved as JSON to this path",
+        default=""
+    )
+    parser.add_argument(
+        "-tmm",
+        "--timing_memory",
+        action="store_true",
+        help="When set with --timing, the peak memory allocated by every stage is also measured with tracemalloc (which slows the stages down)",
+        default=False
+    )
+
+    args = parser.parse_args()
+
+    if not 0 <= args.shard_index < args.shard_count:
+        parser.error("--shard_index must be between 0 and --shard_count - 1")
+    if args.shard_count > 1 and args.seed is None:
+        parser.error("--shard_count requires --seed so that the shards match a single run")
+    if args.background_pool_refresh > 0 and args.seed is not None:
+        parser.error("--background_pool_refresh cannot be used with --seed, the refreshed textures depend on what each worker created before")
+    if sum(output != '' for output in (args.lmdb, args.tar, args.packed)) > 1:
+        parser.error("Only one of --lmdb, --tar and --packed can be used")
+    if args.resume and args.seed is None:
+        parser.error("--resume requires --seed so that the plan and the remaining samples match the ones of the first run")
+    if (args.checkpoint or args.resume) and (args.lmdb != '' or args.tar != '' or args.packed != ''):
+        parser.error("--checkpoint and --resume only work with image files")
+    if args.packed != '':
+        # The packed store holds the bare grayscale pixels
+        args.extension = 'raw'
+        args.channels = 1
 
-    return parser.parse_args()
+    return args
+
+
+# Parameters shared by all the units rendered by a worker, set by init_worker
+_worker_params = {}
+
+
+def init_worker(height, extension, random_skew, random_blur, glyph_atlas, engine, encode,
+                background_pool, background_pool_refresh, background_pool_cache, font_cache_stats, seed, timing_dir,
+                writer_threads, encoder_args, timing_memory=False):
+    """
+        Initialize the state local to a worker (or to the main process when running single threaded)
+    """
+
+    if timing_dir is not None:
+        enable_timing(timing_dir, timing_memory)
+
+    _worker_params.update(
+        height=height,
+        extension=extension,
+        random_skew=random_skew,
+        random_blur=random_blur,
+        glyph_atlas=glyph_atlas,
+        engine=engine,
+        encode=encode,
+    )
+    set_background_pool(background_pool, background_pool_refresh, background_pool_cache, seed)
+    set_file_writer(writer_threads)
+    set_encoder(*encoder_args)
+    if font_cache_stats:
+        # Run when the worker exits after the pool is closed (or when the main process exits)
+        util.Finalize(None, print_font_cache_info, exitpriority=10)
+
+
+def render_unit(unit):
+    """
+        Render one unit of a task grid, returns its index and its encoded image when encoding in memory
+    """
+
+    index, d_index, text, font_name, out_dir, file_name, skew_val, blur_val, bg_val, seed = unit
+    params = _worker_params
+
+    if params['encode']:
+        _, image_bin, _ = create_and_encode_sample(d_index, text, font_name, params['height'], params['extension'],
+                                                   skew_val, params['random_skew'], blur_val, params['random_blur'], bg_val,
+                                                   font_dir='fonts_zh', glyph_atlas=params['glyph_atlas'], seed=seed,
+                                                   engine=params['engine'])
+        return index, image_bin
+
+    create_and_save_sample(d_index, text, font_name, out_dir, params['height'], params['extension'],
+                           skew_val, params['random_skew'], blur_val, params['random_blur'], bg_val, file_name,
+                           font_dir='fonts_zh', glyph_atlas=params['glyph_atlas'], seed=seed, engine=params['engine'])
+    return index, None
 
 
 def load_dict(name):
@@ -257,10 +441,8 @@ def load_dict(name):
         http://www.cnblogs.com/zhangray/p/7118972.html
     """
 
-    dict = []
-    with open(os.path.join('lexicon', 'data', name + '.txt'), 'r') as d:
-        dict = d.read().splitlines() #d.readlines()
-    return dict
+    # The compiled lexicon (lexicon/data/{name}.lex) is memory mapped, it is compiled again when the text file changes
+    return load_lexicon(os.path.join('lexicon', 'data', name + '.txt'))
 
 
 def load_fonts():
@@ -268,7 +450,8 @@ def load_fonts():
         Load all fonts in the fonts directory
     """
 
-    return [font for font in os.listdir('fonts_zh')]
+    # Sorted so that the font picked for a sample does not depend on the file system
+    return sorted(os.listdir('fonts_zh'))
 
 
 # def create_strings_from_file(filename, count):
@@ -459,15 +642,62 @@ def main():
         }
     ][3:4]
     print(tasks)
-    return
 
     base_dir = 'out2'
     log_file = open(os.path.join(base_dir, 'log.txt'), 'w')
 
-    height = args.format
     extension = args.extension
-    random_skew = args.random_skew
-    random_blur = args.random_blur
+
+    # Every worker writes its stage timings there when it exits
+    timing_dir = args.timing + '.parts' if args.timing != '' else None
+
+    # Spread the units of every task over a pool of workers, or render them here with a single thread
+    worker_args = (
+        args.format,
+        args.extension,
+        args.random_skew,
+        args.random_blur,
+        args.glyph_atlas,
+        args.engine,
+        args.lmdb != '' or args.tar != '' or args.packed != '',
+        args.background_pool,
+        args.background_pool_refresh,
+        args.background_pool_cache,
+        args.font_cache_stats,
+        args.seed,
+        timing_dir,
+        args.writer_threads,
+        (args.channels, args.encoder_backend, args.quality, args.png_compression),
+        args.timing_memory,
+    )
+    if args.thread_count > 1:
+        pool = Pool(args.thread_count, initializer=init_worker, initargs=worker_args)
+    else:
+        pool = None
+        init_worker(*worker_args)
+
+    # Stream every task into one LMDB dataset or one set of tar shards instead of image files and manifests
+    lmdb_writer = LmdbWriter(args.lmdb) if args.lmdb != '' else None
+    tar_writer = None
+    if args.tar != '':
+        tar_prefix = 'shard-{}of{}'.format(args.shard_index, args.shard_count) if args.shard_count > 1 else 'shard'
+        tar_writer = TarShardWriter(args.tar, tar_prefix, args.tar_count, args.tar_bytes * 1024 * 1024 or None)
+    packed_writer = PackedStoreWriter(args.packed, args.format) if args.packed != '' else None
+    encode = lmdb_writer is not None or tar_writer is not None or packed_writer is not None
+
+    # With a seed the plan is the same on every machine, so each shard can render its own slice of it
+    plan_random = random.Random(args.seed) if args.seed is not None else random
+    shard_suffix = '_{}of{}'.format(args.shard_index, args.shard_count) if args.shard_count > 1 else ''
+
+    # The finished units of every task are appended to the checkpoint as {task}/{index}
+    checkpoint = None
+    done = set()
+    if args.checkpoint or args.resume:
+        checkpoint_path = os.path.join(base_dir, 'checkpoint' + shard_suffix + '.txt')
+        if args.resume:
+            done = load_checkpoint(checkpoint_path)
+            print('Resuming, {} samples were finished'.format(len(done)))
+        checkpoint = Checkpoint(checkpoint_path, args.resume)
 
     task_total = 0
     for task in tasks:
@@ -478,7 +708,7 @@ def main():
         dict_strs_len = len(dict_strs)
         dict_strs_len_bak = dict_strs_len
         if task['choice']:
-            dict_strs = random.sample(dict_strs, task['choice'])
+            dict_strs = plan_random.sample(dict_strs, task['choice'])
             dict_strs_len = len(dict_strs)
         font_sels = fonts if task['font'] == 'All' else []
         font_random = len(font_sels) == 0
@@ -496,49 +726,99 @@ def main():
         print(*log_info, file=log_file)
         # create directory
         out_dir = os.path.join(base_dir, dict_abbr)
-        try:
-            os.makedirs(out_dir)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-        # file log
-        image_list_file = open(os.path.join(base_dir, 'image_list_' + dict_abbr + '.txt'), 'w')
-        label_list_file = open(os.path.join(base_dir, 'label_list_' + dict_abbr + '.txt'), 'w')
-        image_list = []
-        label_list = []
-
-        dict_total = 0
+        if not encode:
+            try:
+                os.makedirs(out_dir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        # Plan the whole grid up front, the random choices are drawn in the same order as before
+        units = []
         for d_index in range(dict_strs_len):
             dict_str = dict_strs[d_index]
-            if font_random: font_sels = [random.choice(fonts)]
+            if font_random: font_sels = [plan_random.choice(fonts)]
             for font_name in font_sels:
                 font_abbr = font_map[font_name]
-                if skew_random: skew_sels = [random.choice(skews)]
+                if skew_random: skew_sels = [plan_random.choice(skews)]
                 for skew_val in skew_sels:
-                    if blur_random: blur_sels = [random.choice(blurs)]
+                    if blur_random: blur_sels = [plan_random.choice(blurs)]
                     for blur_val in blur_sels:
-                        if bg_random: bg_sels = [random.choice(bgs)]
+                        if bg_random: bg_sels = [plan_random.choice(bgs)]
                         for bg_val in bg_sels:
                             file_name = str(d_index) + '_' + str(font_abbr) + '_' + str(skew_val) + '_' + str(blur_val) + '_' + str(bg_val) + '.' + extension
-
-                            create_and_save_sample(d_index, dict_str, font_name, out_dir, height, extension,
-                                                   skew_val, random_skew, blur_val, random_blur, bg_val, file_name)
-
-                            # print(dict_abbr + '/' + file_name, file=image_list_file)
-                            # print(dict_str, file=label_list_file)
-                            image_list.append(dict_abbr + '/' + file_name)
-                            label_list.append(dict_str)
-                            dict_total += 1
+                            if args.fan_out > 0:
+                                file_name = fan_out_dir(len(units), args.fan_out) + '/' + file_name
+                            seed = sample_seed(args.seed, len(units), dict) if args.seed is not None else None
+                            units.append((len(units), d_index, dict_str, font_name, out_dir, file_name, skew_val, blur_val, bg_val, seed))
+
+        # Only keep the slice of this shard
+        start, end = shard_range(len(units), args.shard_index, args.shard_count)
+        units = units[start:end]
+
+        # The lists below still cover every unit, only the rendering of the finished ones is skipped
+        todo = units
+        if done:
+            # A file may be missing if the run died while it was written in the background
+            todo = [unit for unit in units
+                    if dict_abbr + '/' + str(unit[0]) not in done or not os.path.exists(os.path.join(out_dir, unit[5]))]
+
+        # Render the units across the pool, they complete in any order
+        if pool is not None:
+            results = pool.imap_unordered(render_unit, todo, chunksize=args.chunk_size)
+        else:
+            results = map(render_unit, todo)
+
+        if lmdb_writer is not None:
+            for index, image_bin in in_index_order(results, start):
+                lmdb_writer.add(image_bin, units[index - start][2])
+        elif tar_writer is not None:
+            for index, image_bin in in_index_order(results, start):
+                unit = units[index - start]
+                key = dict_abbr + '/' + os.path.splitext(os.path.basename(unit[5]))[0]
+                tar_writer.add(key, image_bin, extension, unit[2])
+        elif packed_writer is not None:
+            for index, pixels in in_index_order(results, start):
+                packed_writer.add_raw(pixels, units[index - start][2])
+        else:
+            for index, _ in results:
+                if checkpoint is not None:
+                    checkpoint.done(dict_abbr + '/' + str(index))
+
+        # The lists follow the plan, so they are in index order whatever the completion order was
+        image_list = [dict_abbr + '/' + unit[5] for unit in units]
+        label_list = [unit[2] for unit in units]
+        dict_total = len(units)
 
         task_total += dict_total
         print('total:', dict_total)
         print('total:', dict_total, file=log_file)
-        image_list_file.write('\n'.join(image_list))
-        # image_list_file.flush()
-        image_list_file.close()
-        label_list_file.write('\n'.join(label_list))
-        # label_list_file.flush()
-        label_list_file.close()
+        if not encode:
+            # file log
+            with open(os.path.join(base_dir, 'image_list_' + dict_abbr + shard_suffix + '.txt'), 'w') as image_list_file:
+                image_list_file.write('\n'.join(image_list))
+            with open(os.path.join(base_dir, 'label_list_' + dict_abbr + shard_suffix + '.txt'), 'w') as label_list_file:
+                label_list_file.write('\n'.join(label_list))
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    else:
+        close_file_writer()
+        flush_timing()
+
+    if timing_dir is not None:
+        print(write_timings(collect_timings(timing_dir), args.timing), file=log_file)
+        print('timings:', args.timing)
+        shutil.rmtree(timing_dir)
+
+    if checkpoint is not None:
+        checkpoint.close()
+    if lmdb_writer is not None:
+        print('lmdb:', args.lmdb, lmdb_writer.close())
+    if tar_writer is not None:
+        print('tar:', args.tar, tar_writer.close())
+    if packed_writer is not None:
+        print('packed:', args.packed, packed_writer.close())
 
     print('total-all:', task_total)
     print('total-all:', task_total, file=log_file)
@@ -0,0 +1,77 @@
+import queue
+
+from multiprocessing import shared_memory
+
+class SlotRing(object):
+    """
+        A ring of fixed size slots in one shared memory block, used to hand encoded samples from
+        pool workers to the writer without pickling them through a pipe: the workers write into
+        the slot they were given and only send (slot, length, label) back.
+
+        The process that creates the ring owns the free slots: it takes one for every task it
+        submits (with_slots) and gives it back once the writer is done with it (release), so the
+        tasks in flight are bounded by the number of slots. Workers attach to the ring by name.
+    """
+
+    def __init__(self, slot_count, slot_size, name=None):
+        """
+            slot_count : number of slots
+            slot_size  : size of a slot in bytes, larger payloads go through the pipe
+            name       : name of an existing ring to attach to, a new ring is created when None
+        """
+
+        self.slot_count = slot_count
+        self.slot_size = slot_size
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=slot_count * slot_size)
+            self.free = queue.Queue()
+            for slot in range(slot_count):
+                self.free.put(slot)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.free = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def with_slots(self, iterable):
+        """
+            Lazily pair every item of iterable with a free slot, waiting for one to be released
+            when they are all in use
+        """
+
+        for item in iterable:
+            yield self.free.get(), item
+
+    def release(self, slot):
+        self.free.put(slot)
+
+    def write(self, slot, data):
+        """
+            Copy data into a slot, returns False when it does not fit
+        """
+
+        if len(data) > self.slot_size:
+            return False
+        offset = slot * self.slot_size
+        self.shm.buf[offset:offset + len(data)] = data
+        return True
+
+    def view(self, slot, length):
+        """
+            Return a memoryview of the first length bytes of a slot, release it before closing the ring
+        """
+
+        offset = slot * self.slot_size
+        return self.shm.buf[offset:offset + length]
+
+    def close(self):
+        """
+            Detach from the ring, the owner also frees the shared memory
+        """
+
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,113 @@
+import io
+import json
+import os
+import tarfile
+import time
+
+class TarShardWriter(object):
+    """
+        Write samples into sequential tar shards (WebDataset layout): every sample is a
+        {key}.{extension} image followed by its {key}.txt label. A new shard is started once the
+        current one holds max_count samples or max_bytes bytes, and the shard index file lists
+        every shard with its sample count, size and key range.
+
+        A shard is written as name.tar.tmp and renamed when it is complete, so readers only ever
+        see whole shards. Members have a fixed mtime so that a seeded run gives the same shards.
+    """
+
+    def __init__(self, output_dir, prefix='shard', max_count=10000, max_bytes=None):
+        """
+            output_dir : directory of the shards and of the index file
+            prefix     : shards are named {prefix}-000000.tar, the index {prefix}-index.json
+            max_count  : maximum number of samples per shard
+            max_bytes  : (optional) also start a new shard once a shard reaches this many bytes
+        """
+
+        self.output_dir = output_dir
+        self.prefix = prefix
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.shards = []
+        self.tar = None
+        self.shard = None
+        self.total = 0
+        self.start_time = time.time()
+        os.makedirs(output_dir, exist_ok=True)
+
+    def _path(self, number):
+        return os.path.join(self.output_dir, '{}-{:06d}.tar'.format(self.prefix, number))
+
+    def _open_shard(self):
+        path = self._path(len(self.shards))
+        self.tar = tarfile.open(path + '.tmp', 'w')
+        self.shard = {'name': os.path.basename(path), 'count': 0, 'bytes': 0, 'first_key': None, 'last_key': None}
+
+    def _close_shard(self):
+        self.tar.close()
+        path = self._path(len(self.shards))
+        self.shard['bytes'] = os.path.getsize(path + '.tmp')
+        os.replace(path + '.tmp', path)
+        self.shards.append(self.shard)
+        self.tar = None
+        self.shard = None
+        self._write_index()
+
+    def _add_member(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = 0
+        info.mode = 0o644
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def add(self, key, image_bin, extension, label):
+        """
+            Add one encoded image and its label under key (which must not contain a dot)
+        """
+
+        if self.tar is None:
+            self._open_shard()
+
+        self._add_member('{}.{}'.format(key, extension), image_bin)
+        self._add_member('{}.txt'.format(key), label.encode())
+
+        shard = self.shard
+        if shard['first_key'] is None:
+            shard['first_key'] = key
+        shard['last_key'] = key
+        shard['count'] += 1
+        self.total += 1
+
+        if shard['count'] >= self.max_count or (self.max_bytes and self.tar.offset >= self.max_bytes):
+            self._close_shard()
+
+    def _write_index(self):
+        path = os.path.join(self.output_dir, '{}-index.json'.format(self.prefix))
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'samples': sum(shard['count'] for shard in self.shards), 'shards': self.shards}, f, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def count(self):
+        return self.total
+
+    def rate(self):
+        """
+            Number of samples written per second since the writer was opened
+        """
+
+        return self.total / max(time.time() - self.start_time, 1e-9)
+
+    def summary(self):
+        return '{} samples in {} shards in {:.1f}s ({:.1f} samples/s)'.format(
+            self.total, len(self.shards), time.time() - self.start_time, self.rate()
+        )
+
+    def close(self):
+        """
+            Complete the last shard and write the final index, returns the number of samples
+        """
+
+        if self.tar is not None:
+            self._close_shard()
+        else:
+            self._write_index()
+        return self.total
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+# The modules are scripts at the root of the repository, not an installed package
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+@pytest.fixture
+def run_generator():
+    """
+        Run run.py from the root of the repository (it reads fonts/ and dicts/ from there)
+    """
+
+    def run(*args):
+        subprocess.run([sys.executable, 'run.py'] + [str(arg) for arg in args], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL)
+    return run
+
+@pytest.fixture
+def run_task_grid(tmp_path):
+    """
+        Run the main task of run2.py in a scratch directory holding its word_pinyin_upper lexicon
+        (the words given) and the Chinese fonts, returns the path of its out2 directory
+    """
+
+    os.symlink(os.path.join(ROOT, 'fonts_zh'), str(tmp_path / 'fonts_zh'))
+    os.makedirs(str(tmp_path / 'lexicon' / 'data'))
+    os.makedirs(str(tmp_path / 'out2'))
+
+    def run(words, *args):
+        with open(str(tmp_path / 'lexicon' / 'data' / 'word_pinyin_upper.txt'), 'w') as f:
+            f.write('\n'.join(words) + '\n')
+        subprocess.run([sys.executable, os.path.join(ROOT, 'run2.py')] + [str(arg) for arg in args], cwd=str(tmp_path),
+                       input=b'1\n', check=True, stdout=subprocess.DEVNULL)
+        return str(tmp_path / 'out2')
+    return run
@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+
+from background_pool import BackgroundPool
+
+def test_crops():
+    pool = BackgroundPool(size=2, height=20, width=100)
+    for background_type in (0, 2):
+        crop = pool.get(background_type, 10, 30)
+        assert crop.mode == 'L'
+        assert crop.size == (30, 10)
+        textures = pool.textures[background_type]
+        assert any(
+            np.array_equal(window, np.asarray(crop))
+            for texture in textures
+            for flipped in (texture, texture[:, ::-1], texture[::-1, :], texture[::-1, ::-1])
+            for window in (flipped[top:top + 10, left:left + 30] for top in range(11) for left in range(71))
+        )
+
+def test_what_is_not_pooled():
+    pool = BackgroundPool(size=1, height=20, width=100)
+    assert pool.get(1, 10, 30) is None
+    assert pool.get(0, 21, 30) is None
+    assert pool.get(2, 10, 101) is None
+
+def test_refresh():
+    pool = BackgroundPool(size=1, height=8, width=16, refresh_rate=2)
+    texture = pool.textures[0][0]
+    pool.get(0, 4, 4)
+    assert pool.textures[0][0] is texture
+    pool.get(0, 4, 4)
+    assert pool.textures[0][0] is not texture
+
+def test_cached_textures(tmp_path):
+    first = BackgroundPool(size=2, height=8, width=16, cache_dir=str(tmp_path))
+    assert len([name for name in os.listdir(str(tmp_path)) if name.endswith('.npy')]) == 4
+    second = BackgroundPool(size=2, height=8, width=16, cache_dir=str(tmp_path))
+    for background_type in (0, 2):
+        for a, b in zip(first.textures[background_type], second.textures[background_type]):
+            assert np.array_equal(a, b)
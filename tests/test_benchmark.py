@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.mark.parametrize('args', [
+    ['online', '-c', '20', '-w', '1', '-q', '8'],
+    ['strings', '-c', '1000', '-w', '2'],
+])
+def test_dictionary_subcommands_run_with_the_default_language(args):
+    # Only some dictionaries ship in dicts/, the default must be one of them
+    subprocess.run([sys.executable, 'benchmark.py'] + args, cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
@@ -0,0 +1,73 @@
+import os
+import shutil
+
+import pytest
+
+from checkpoint import Checkpoint, load_checkpoint
+
+def test_missing_checkpoint_is_empty(tmp_path):
+    assert load_checkpoint(str(tmp_path / 'missing')) == set()
+
+def test_keys_are_recorded(tmp_path):
+    path = str(tmp_path / 'checkpoint')
+    checkpoint = Checkpoint(path, flush_count=2)
+    for key in [3, 1, 2]:
+        checkpoint.done(key)
+    checkpoint.close()
+    assert load_checkpoint(path) == {'1', '2', '3'}
+
+def test_torn_last_line_is_ignored(tmp_path):
+    path = tmp_path / 'checkpoint'
+    path.write_text('1\n2\n3')
+    assert load_checkpoint(str(path)) == {'1', '2'}
+
+def test_resume_cuts_the_torn_last_line(tmp_path):
+    path = tmp_path / 'checkpoint'
+    path.write_text('1\n3')
+    checkpoint = Checkpoint(str(path), resume=True)
+    checkpoint.done(20)
+    checkpoint.close()
+    assert path.read_text() == '1\n20\n'
+    assert load_checkpoint(str(path)) == {'1', '20'}
+
+def test_resume_keeps_complete_lines(tmp_path):
+    path = tmp_path / 'checkpoint'
+    path.write_text('1\n2\n')
+    checkpoint = Checkpoint(str(path), resume=True)
+    checkpoint.done(3)
+    checkpoint.close()
+    assert load_checkpoint(str(path)) == {'1', '2', '3'}
+
+def test_new_run_starts_over(tmp_path):
+    path = tmp_path / 'checkpoint'
+    path.write_text('1\n2\n')
+    Checkpoint(str(path)).close()
+    assert load_checkpoint(str(path)) == set()
+
+def read_files(directory):
+    files = {}
+    for name in os.listdir(directory):
+        if name.endswith('.jpg'):
+            with open(os.path.join(directory, name), 'rb') as f:
+                files[name] = f.read()
+    return files
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_resumed_run_finishes_the_first_one(tmp_path, run_generator, stream):
+    options = ['-l', 'fr', '-c', 10, '-sd', 6, '-t', 2] + (['-st'] if stream else [])
+    run_generator(tmp_path / 'full', *(options + ['-ck']))
+    full = read_files(str(tmp_path / 'full'))
+    assert load_checkpoint(str(tmp_path / 'full' / 'checkpoint.txt')) == set(str(i) for i in range(10))
+
+    # A run that died after the samples 0 to 3 and 7
+    os.makedirs(str(tmp_path / 'part'))
+    finished = [name for name in full if int(name.rsplit('_', 1)[1].split('.')[0]) in (0, 1, 2, 3, 7)]
+    for name in finished:
+        shutil.copy(str(tmp_path / 'full' / name), str(tmp_path / 'part' / name))
+    (tmp_path / 'part' / 'checkpoint.txt').write_text('0\n1\n2\n3\n7\n')
+    before = dict((name, os.path.getmtime(str(tmp_path / 'part' / name))) for name in finished)
+
+    run_generator(tmp_path / 'part', *(options + ['-rs']))
+    assert read_files(str(tmp_path / 'part')) == full
+    assert all(os.path.getmtime(str(tmp_path / 'part' / name)) == before[name] for name in finished)
+    assert load_checkpoint(str(tmp_path / 'part' / 'checkpoint.txt')) == set(str(i) for i in range(10))
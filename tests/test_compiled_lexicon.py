@@ -0,0 +1,85 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+
+from compiled_lexicon import Lexicon, compile_lexicon, is_stale, lexicon_path, load_lexicon
+
+WORDS = ['le', 'chat', 'été', '', 'noir']
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / 'words.txt'
+    path.write_text('\n'.join(WORDS) + '\n', encoding='utf-8')
+    return str(path)
+
+def test_compile_and_load(source):
+    assert is_stale(source)
+    lexicon = load_lexicon(source)
+    assert lexicon.path == lexicon_path(source) == source[:-len('.txt')] + '.lex'
+    assert not is_stale(source)
+    assert len(lexicon) == len(WORDS)
+    assert list(lexicon) == WORDS
+    assert lexicon[-1] == 'noir'
+    assert lexicon[1:3] == ['chat', 'été']
+    with pytest.raises(IndexError):
+        lexicon[len(WORDS)]
+
+def test_words_with_other_line_separators(tmp_path):
+    path = tmp_path / 'words.txt'
+    path.write_text('a\x1cb\nc\u2028d\ne\x85f', encoding='utf-8')
+    assert list(load_lexicon(str(path))) == ['a\x1cb', 'c\u2028d', 'e\x85f']
+
+def test_recompiled_when_the_source_changes(source):
+    load_lexicon(source)
+    with open(source, 'a', encoding='utf-8') as f:
+        f.write('de plus\n')
+    assert is_stale(source)
+    assert load_lexicon(source)[-1] == 'de plus'
+
+def test_join_rows(source):
+    lexicon = load_lexicon(source)
+    indices = np.array([[0, 1, 4], [2, 2, 3], [4, 0, 1]])
+    assert lexicon.join_rows(indices) == ['le chat noir', 'été été ', 'noir le chat']
+    assert lexicon.join_rows(indices, np.array([1, 2, 3])) == ['le', 'été été', 'noir le chat']
+
+def test_weights(tmp_path):
+    path = tmp_path / 'weighted.txt'
+    path.write_text('rare\t0\ncommon\t3\nplain\n')
+    lexicon = load_lexicon(str(path), weighted=True)
+    assert list(lexicon) == ['rare', 'common', 'plain']
+    assert lexicon.weights.tolist() == [0.0, 3.0, 1.0]
+    assert not is_stale(str(path), weighted=True)
+    assert is_stale(str(path), weighted=False)
+
+    drawn = lexicon.draw(np.random.default_rng(0), 1000)
+    assert 0 not in drawn
+    assert set(drawn.tolist()) == {1, 2}
+
+def test_pickled_as_a_path(source):
+    lexicon = load_lexicon(source)
+    assert list(pickle.loads(pickle.dumps(lexicon))) == WORDS
+
+def test_compiled_lexicon_without_its_source(source):
+    path = compile_lexicon(source)
+    os.remove(source)
+    assert list(load_lexicon(source)) == WORDS
+    assert list(Lexicon(path)) == WORDS
+
+def test_not_a_lexicon(tmp_path):
+    path = tmp_path / 'words.lex'
+    path.write_bytes(b'not a lexicon')
+    with pytest.raises(ValueError):
+        Lexicon(str(path))
+
+@pytest.mark.parametrize('allow_variable', [False, True])
+def test_same_strings_as_the_word_list(source, allow_variable):
+    from dict_strings import DictStrings
+
+    words = ['word{}'.format(i) for i in range(30)]
+    with open(source, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(words) + '\n')
+    from_lexicon = DictStrings(load_lexicon(source), 3, allow_variable, seed=2, chunk_size=16)
+    from_list = DictStrings([word + '\n' for word in words], 3, allow_variable, seed=2, chunk_size=16)
+    assert list(from_lexicon.iter_strings(40)) == list(from_list.iter_strings(40))
@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import pytest
+
+import corpus
+from corpus import Corpus, build_line_index, index_path
+
+@pytest.mark.parametrize('data', [b'a\nbb\nccc\n', b'a\nbb\nccc', b'\n\nx\n', b'single'])
+def test_line_index(data):
+    offsets = build_line_index(data, len(data))
+    lines = [data[offsets[i]:offsets[i + 1]] for i in range(len(offsets) - 1)]
+    assert [line.rstrip(b'\n') for line in lines] == data.splitlines()
+    assert b''.join(lines) == data
+
+def test_line_index_across_chunks(monkeypatch):
+    monkeypatch.setattr(corpus, '_CHUNK_SIZE', 4)
+    data = b'one\ntwo\nthree\n\nfour'
+    offsets = build_line_index(data, len(data))
+    assert offsets.tolist() == [0, 4, 8, 14, 15, len(data)]
+
+def test_lines_are_read(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_bytes('first\n  second \nthird é\n'.encode())
+    with Corpus(str(path), max_length=5) as lines:
+        assert len(lines) == 3
+        assert [lines[i] for i in range(3)] == ['first', 'secon', 'third']
+        assert lines[-1] == 'third'
+        assert list(lines.iter_lines(5, start=1, block=2)) == ['secon', 'third', 'first', 'secon']
+        with pytest.raises(IndexError):
+            lines[3]
+
+def test_index_is_cached_and_rebuilt(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_text('a\nb\n')
+    with Corpus(str(path)) as lines:
+        assert len(lines) == 2
+    assert os.path.exists(index_path(str(path)))
+    assert np.load(index_path(str(path))).tolist() == [0, 2, 4]
+
+    path.write_text('a\nb\nc\n')
+    with Corpus(str(path)) as lines:
+        assert len(lines) == 3
+        assert lines[2] == 'c'
+
+@pytest.mark.parametrize('text', ['', '\n', '\n \n\t\n'])
+def test_empty_file_is_rejected(tmp_path, text):
+    path = tmp_path / 'empty.txt'
+    path.write_text(text)
+    with pytest.raises(Exception, match='No lines could be read'):
+        Corpus(str(path))
+
+def test_blank_lines_are_kept(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_text('\n\na\n')
+    with Corpus(str(path)) as lines:
+        assert [lines[i] for i in range(len(lines))] == ['', '', 'a']
+
+def test_run_reads_the_input_file(tmp_path, run_generator):
+    path = tmp_path / 'lines.txt'
+    path.write_text('alpha\nbeta\ngamma\n')
+    run_generator(tmp_path / 'out', '-l', 'fr', '-i', path, '-c', 7, '-t', 2)
+    names = sorted(os.listdir(str(tmp_path / 'out')), key=lambda name: int(name.rsplit('_', 1)[1].split('.')[0]))
+    assert [name.rsplit('_', 1)[0] for name in names] == ['alpha', 'beta', 'gamma'] * 2 + ['alpha']
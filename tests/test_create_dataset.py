@@ -0,0 +1,61 @@
+import cv2
+import lmdb
+import numpy as np
+import pytest
+
+from create_dataset import LmdbWriter, checkImageIsValid, createDataset, readImageSize
+
+def encode(extension, height=12, width=34):
+    image = np.random.default_rng(0).integers(0, 256, size=(height, width), dtype=np.uint8)
+    return cv2.imencode('.' + extension, image)[1].tobytes()
+
+@pytest.mark.parametrize('extension', ['jpg', 'png'])
+def test_size_is_read_from_the_header(extension):
+    assert readImageSize(encode(extension)) == (34, 12)
+
+def test_progressive_jpeg():
+    image = np.zeros((7, 9), np.uint8)
+    image_bin = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_PROGRESSIVE, 1])[1].tobytes()
+    assert readImageSize(image_bin) == (9, 7)
+
+def test_validity():
+    for extension in ('jpg', 'png', 'bmp'):
+        assert checkImageIsValid(encode(extension))
+        assert checkImageIsValid(encode(extension), fullDecode=True)
+    assert readImageSize(encode('bmp')) is None
+    assert not checkImageIsValid(None)
+    assert not checkImageIsValid(b'not an image')
+    assert not checkImageIsValid(encode('jpg')[:2] + b'\x00' * 10)
+
+def test_batches(tmp_path):
+    writer = LmdbWriter(str(tmp_path / 'lmdb'), batchSize=3, batchBytes=2000)
+    image_bin = encode('png')
+    for i in range(4):
+        writer.add(image_bin, str(i))
+    # The first three samples went out in one transaction, the fourth is pending
+    assert writer.cacheSamples == 1
+    writer.add(b'x' * 2000, 'large')
+    assert writer.cacheSamples == 0
+    assert writer.close() == 5
+
+    env = lmdb.open(str(tmp_path / 'lmdb'), readonly=True, lock=False)
+    with env.begin() as txn:
+        assert txn.get(b'num-samples') == b'5'
+        assert [txn.get(b'label-%09d' % i) for i in range(1, 6)] == [b'0', b'1', b'2', b'3', b'large']
+    env.close()
+
+def test_create_dataset_skips_invalid_images(tmp_path):
+    paths = []
+    for name, data in (('good.png', encode('png')), ('bad.png', b'broken')):
+        paths.append(str(tmp_path / name))
+        with open(paths[-1], 'wb') as f:
+            f.write(data)
+    paths.append(str(tmp_path / 'missing.png'))
+
+    createDataset(str(tmp_path / 'lmdb'), paths, ['good', 'bad', 'missing'], batchSize=1)
+    env = lmdb.open(str(tmp_path / 'lmdb'), readonly=True, lock=False)
+    with env.begin() as txn:
+        assert txn.get(b'num-samples') == b'1'
+        assert txn.get(b'label-000000001') == b'good'
+        assert txn.get(b'image-000000001') == encode('png')
+    env.close()
@@ -0,0 +1,35 @@
+import pytest
+
+from dict_strings import DictStrings
+
+WORDS = ['word{}\n'.format(i) for i in range(50)]
+
+def test_seeded_strings_only_depend_on_their_index():
+    strings = DictStrings(WORDS, 3, allow_variable=True, seed=4, chunk_size=16)
+    first = list(strings.iter_strings(40))
+    other = DictStrings(WORDS, 3, allow_variable=True, seed=4, chunk_size=16)
+    assert [other.get(i) for i in reversed(range(40))] == first[::-1]
+    assert list(other.iter_strings(40, start=21)) == first[21:]
+    assert list(DictStrings(WORDS, 3, allow_variable=True, seed=5, chunk_size=16).iter_strings(40)) != first
+
+def test_word_counts():
+    fixed = list(DictStrings(WORDS, 3, seed=0, chunk_size=16).iter_strings(40))
+    assert all(len(string.split(' ')) == 3 for string in fixed)
+    variable = list(DictStrings(WORDS, 3, allow_variable=True, seed=0, chunk_size=16).iter_strings(200))
+    assert {len(string.split(' ')) for string in variable} == {1, 2, 3}
+    assert all(word + '\n' in WORDS for string in variable for word in string.split(' '))
+
+def test_chunks_are_cut_to_the_range():
+    strings = DictStrings(WORDS, 2, seed=0, chunk_size=16)
+    assert [len(chunk) for chunk in strings.iter_chunks(40, start=10)] == [6, 16, 8]
+
+def test_unseeded_strings_are_dictionary_words():
+    strings = list(DictStrings(WORDS, 2, chunk_size=16).iter_strings(30))
+    assert len(strings) == 30
+    assert all(len(string.split(' ')) == 2 and all(word + '\n' in WORDS for word in string.split(' ')) for string in strings)
+
+def test_invalid_dictionaries():
+    with pytest.raises(Exception):
+        DictStrings([], 1)
+    with pytest.raises(ValueError):
+        DictStrings(WORDS, 0)
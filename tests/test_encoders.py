@@ -0,0 +1,80 @@
+import io
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from PIL import Image
+
+from encoders import Encoder
+
+def sample_array():
+    rng = np.random.RandomState(0)
+    return rng.randint(0, 256, (32, 80)).astype(np.uint8)
+
+def decode(data):
+    return np.asarray(Image.open(io.BytesIO(data)))
+
+@pytest.mark.parametrize('backend', ['pil', 'cv2'])
+def test_png_is_lossless(backend):
+    array = sample_array()
+    decoded = decode(Encoder(channels=1, backend=backend).encode(array, 'png'))
+    assert decoded.shape == (32, 80)
+    assert np.array_equal(decoded, array)
+
+@pytest.mark.parametrize('backend', ['pil', 'cv2'])
+def test_rgb_repeats_the_gray_channel(backend):
+    array = sample_array()
+    decoded = decode(Encoder(channels=3, backend=backend).encode(array, 'png'))
+    assert decoded.shape == (32, 80, 3)
+    for channel in range(3):
+        assert np.array_equal(decoded[:, :, channel], array)
+
+def test_npy_keeps_the_pixels():
+    array = sample_array()
+    assert np.array_equal(np.load(io.BytesIO(Encoder(channels=1).encode(array, 'npy'))), array)
+    rgb = np.load(io.BytesIO(Encoder(channels=3).encode(Image.fromarray(array), 'NPY')))
+    assert rgb.shape == (32, 80, 3)
+    assert np.array_equal(rgb[:, :, 2], array)
+
+def test_default_backend_follows_the_input():
+    array = sample_array()
+    encoder = Encoder()
+    assert encoder.encode(Image.fromarray(array), 'jpg') == Encoder(backend='pil').encode(array, 'jpg')
+    assert encoder.encode(array, 'jpg') == Encoder(backend='cv2').encode(array, 'jpg')
+
+def test_default_jpeg_quality_is_75():
+    array = sample_array()
+    for backend in ('pil', 'cv2'):
+        assert Encoder(backend=backend).encode(array, 'jpg') == Encoder(backend=backend, quality=75).encode(array, 'jpg')
+    # Same bytes as the original generator, which saved RGB images at quality 75
+    buffer = io.BytesIO()
+    Image.fromarray(array).convert('RGB').save(buffer, format='JPEG', quality=75)
+    assert Encoder(backend='pil').encode(array, 'jpg') == buffer.getvalue()
+    ok, expected = cv2.imencode('.jpg', cv2.cvtColor(array, cv2.COLOR_GRAY2BGR), [cv2.IMWRITE_JPEG_QUALITY, 75])
+    assert Encoder(backend='cv2').encode(array, 'jpg') == expected.tobytes()
+
+@pytest.mark.parametrize('backend', ['pil', 'cv2'])
+def test_quality_and_compression_change_the_size(backend):
+    array = np.tile(np.arange(80, dtype=np.uint8), (32, 1))
+    low = Encoder(backend=backend, quality=10).encode(array, 'jpg')
+    high = Encoder(backend=backend, quality=95).encode(array, 'jpg')
+    assert len(low) < len(high)
+    fast = Encoder(channels=1, backend=backend, png_compression=0).encode(array, 'png')
+    small = Encoder(channels=1, backend=backend, png_compression=9).encode(array, 'png')
+    assert len(small) < len(fast)
+    assert np.array_equal(decode(fast), decode(small))
+
+def test_invalid_options():
+    with pytest.raises(ValueError):
+        Encoder(channels=2)
+    with pytest.raises(ValueError):
+        Encoder(backend='libjpeg')
+
+def test_run_writes_grayscale_png(tmp_path, run_generator):
+    run_generator(tmp_path, '-l', 'fr', '-c', 6, '-t', 2, '-e', 'png', '-ch', 1, '-eb', 'cv2', '-pc', 1)
+    names = os.listdir(str(tmp_path))
+    assert len(names) == 6
+    for name in names:
+        assert Image.open(os.path.join(str(tmp_path), name)).mode == 'L'
@@ -0,0 +1,54 @@
+import os
+
+import numpy as np
+import pytest
+
+from PIL import Image, ImageDraw, ImageFilter
+from font_cache import get_font
+from generator import (
+    create_sample, create_sample_array, draw_text_array, gaussian_blur_array, resize_array, rotate_array, sample_seed
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FONT_DIR = os.path.join(ROOT, 'fonts')
+
+def pil_text(font, text, fill):
+    image = Image.new('L', font.getsize(text), 255)
+    ImageDraw.Draw(image).text((0, 0), text, fill=fill, font=font)
+    return image
+
+def test_text_is_drawn_like_image_draw():
+    for name in ('Roboto-Regular.ttf', 'Roboto-Italic.ttf', 'Pacifico.ttf'):
+        font = get_font(os.path.join(FONT_DIR, name))
+        width, height = font.getsize('Hello 42')
+        expected = np.asarray(pil_text(font, 'Hello 42', 30))
+        assert np.array_equal(draw_text_array('Hello 42', font, width, height, 30), expected)
+
+def test_rotation_matches_pil():
+    image = pil_text(get_font(os.path.join(FONT_DIR, 'Roboto-Regular.ttf')), 'Hello 42', 30)
+    for angle in list(range(-15, 16)) + [2.5, -7.3, 45, 90, 180, -90, 270, 359]:
+        rotated = rotate_array(np.asarray(image), angle)
+        expected = np.asarray(image.rotate(angle, expand=1))
+        assert rotated.shape == expected.shape
+        assert np.array_equal(rotated, expected)
+
+def test_resize_and_blur_match_pil():
+    image = pil_text(get_font(os.path.join(FONT_DIR, 'Roboto-Regular.ttf')), 'Hello 42', 30)
+    width, height = image.size
+    for new_width in (width // 3, width - 1, width * 2):
+        expected = np.asarray(image.resize((new_width, 32), Image.ANTIALIAS))
+        assert np.array_equal(resize_array(np.asarray(image), new_width, 32), expected)
+    for radius in (0.5, 1, 2.3):
+        expected = np.asarray(image.filter(ImageFilter.GaussianBlur(radius=radius)))
+        assert np.array_equal(gaussian_blur_array(np.asarray(image), radius), expected)
+
+@pytest.mark.parametrize('background_type', [0, 1, 2])
+def test_samples_match_the_pil_engine(background_type):
+    fonts = sorted(os.listdir(FONT_DIR))
+    for i in range(10):
+        args = ('Lorem ipsum {}'.format(i), fonts[i * 7 % len(fonts)], 32, 10, True, 2, True, background_type)
+        seed = sample_seed(0, i)
+        expected = np.asarray(create_sample(*args, font_dir=FONT_DIR, seed=seed))
+        array = create_sample_array(*args, font_dir=FONT_DIR, seed=seed)
+        assert array.dtype == np.uint8
+        assert np.array_equal(array, expected)
@@ -0,0 +1,46 @@
+import os
+from collections import Counter
+
+import pytest
+
+from file_output import FileWriter, fan_out_dir
+
+def test_fan_out_dir():
+    assert fan_out_dir(12, 256) == fan_out_dir(12, 256)
+    assert len(fan_out_dir(12, 256).split('/')) == 2
+    assert all(len(part) == 2 for part in fan_out_dir(12, 256).split('/'))
+    assert all(len(part) == 1 for part in fan_out_dir(12, 16, depth=3).split('/'))
+    counts = Counter(fan_out_dir(i, 4, depth=1) for i in range(4000))
+    assert sorted(counts) == ['0', '1', '2', '3']
+    assert min(counts.values()) > 800
+
+@pytest.mark.parametrize('threads', [0, 3])
+def test_files_are_written(tmp_path, threads):
+    writer = FileWriter(threads)
+    for i in range(20):
+        writer.write(os.path.join(str(tmp_path), fan_out_dir(i, 4), '{}.bin'.format(i)), bytes([i]) * i)
+    writer.flush()
+    for i in range(20):
+        with open(os.path.join(str(tmp_path), fan_out_dir(i, 4), '{}.bin'.format(i)), 'rb') as f:
+            assert f.read() == bytes([i]) * i
+    names = [name for _, _, files in os.walk(str(tmp_path)) for name in files]
+    assert sorted(names) == sorted('{}.bin'.format(i) for i in range(20))
+    writer.close()
+
+def test_background_errors_are_raised(tmp_path):
+    (tmp_path / 'file').write_text('')
+    writer = FileWriter(2)
+    writer.write(str(tmp_path / 'file' / 'sub' / 'a.bin'), b'a')
+    with pytest.raises(OSError):
+        writer.flush()
+    writer.close()
+
+def test_run_with_fan_out(tmp_path, run_generator):
+    run_generator(tmp_path, '-l', 'fr', '-c', 20, '-t', 2, '-fo', 4, '-wt', 2)
+    with open(str(tmp_path / 'image_list.txt')) as f:
+        images = f.read().splitlines()
+    with open(str(tmp_path / 'label_list.txt')) as f:
+        labels = f.read().splitlines()
+    assert len(images) == len(labels) == 20
+    assert images == ['{}/{:09d}.jpg'.format(fan_out_dir(i, 4), i) for i in range(20)]
+    assert all(os.path.isfile(str(tmp_path / image)) for image in images)
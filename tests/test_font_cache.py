@@ -0,0 +1,37 @@
+import os
+
+import pytest
+
+import font_cache
+from font_cache import clear_font_cache, font_cache_info, get_font, set_font_cache_size
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+@pytest.fixture
+def fonts():
+    clear_font_cache()
+    yield [os.path.join(FONT_DIR, name) for name in sorted(os.listdir(FONT_DIR))[:3]]
+    set_font_cache_size(64)
+    clear_font_cache()
+
+def test_fonts_are_opened_once(fonts):
+    font = get_font(fonts[0])
+    assert get_font(fonts[0]) is font
+    assert get_font(fonts[0], size=20) is not font
+    info = font_cache_info()
+    assert (info['hits'], info['misses'], info['size']) == (1, 2, 2)
+
+def test_least_recently_used_font_is_dropped(fonts):
+    set_font_cache_size(2)
+    first = get_font(fonts[0])
+    get_font(fonts[1])
+    get_font(fonts[0])
+    get_font(fonts[2])
+    assert list(font_cache._fonts) == [(fonts[0], 32, 0), (fonts[2], 32, 0)]
+    assert get_font(fonts[0]) is first
+
+def test_shrinking_the_cache(fonts):
+    for path in fonts:
+        get_font(path)
+    set_font_cache_size(1)
+    assert list(font_cache._fonts) == [(fonts[2], 32, 0)]
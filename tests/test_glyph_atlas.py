@@ -0,0 +1,50 @@
+import os
+
+import numpy as np
+import pytest
+
+from PIL import Image, ImageDraw
+from font_cache import get_font
+from glyph_atlas import get_glyph_atlas
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def draw(font, text, fill):
+    image = Image.new('L', font.getsize(text), 255)
+    ImageDraw.Draw(image).text((0, 0), text, fill=fill, font=font)
+    return np.asarray(image)
+
+@pytest.mark.parametrize('path, text', [
+    ('fonts/Roboto-Regular.ttf', '0123456789'),
+    ('fonts/Roboto-Regular.ttf', 'HELLO 42'),
+    ('fonts_zh/KaiTi_GB2312.ttf', '汉字 123'),
+])
+def test_same_pixels_as_image_draw(path, text):
+    path = os.path.join(ROOT, path)
+    for fill in (0, 40, 80):
+        line = np.asarray(get_glyph_atlas(path).render(text, fill))
+        assert np.array_equal(line, draw(get_font(path), text, fill))
+
+def test_glyphs_are_rasterized_once():
+    atlas = get_glyph_atlas(os.path.join(ROOT, 'fonts/Roboto-Regular.ttf'))
+    assert get_glyph_atlas(os.path.join(ROOT, 'fonts/Roboto-Regular.ttf')) is atlas
+    atlas.render('aab', 0)
+    bitmap = atlas.glyphs['a']
+    atlas.render('ba', 0)
+    assert atlas.glyphs['a'] is bitmap
+
+ITALIC_FONTS = sorted(name for name in os.listdir(os.path.join(ROOT, 'fonts')) if 'It' in name or 'Oblique' in name)
+
+@pytest.mark.parametrize('name', ITALIC_FONTS)
+def test_italic_fonts_match_image_draw(name):
+    # Italic glyphs overhang their advance, which getsize(char) would count in the advance
+    path = os.path.join(ROOT, 'fonts', name)
+    for text in ('0123456789', 'fjord 0147', 'AVfly Wave'):
+        line = get_glyph_atlas(path).render_array(text, 30)
+        assert np.array_equal(line, draw(get_font(path), text, 30))
+
+def test_pairs_are_kerned():
+    path = os.path.join(ROOT, 'fonts/AllerDisplay.ttf')
+    atlas = get_glyph_atlas(path)
+    assert atlas.kern('A', 'V') < 0
+    assert np.array_equal(atlas.render_array('AVAV', 0), draw(get_font(path), 'AVAV', 0))
@@ -0,0 +1,70 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pypinyin')
+
+# gen.py is a script of the lexicon directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lexicon'))
+import gen
+
+def reference_dates(start, end, format):
+    day = datetime.date(*start)
+    dates = []
+    while day <= datetime.date(*end):
+        dates.append(day.strftime(format))
+        day += datetime.timedelta(1)
+    return dates
+
+@pytest.mark.parametrize('format', ['%Y-%m-%d', '%Y.%m.%d', '%y%m%d', '%d/%m/%Y %%', 'day %d of %B %Y'])
+@pytest.mark.parametrize('start,end', [((1902, 1, 1), (1905, 3, 1)), ((1999, 12, 25), (2000, 3, 2)), ((2020, 2, 28), (2020, 2, 28))])
+def test_dates_match_strftime(format, start, end):
+    assert gen.get_date_range(start, end, format) == reference_dates(start, end, format)
+
+def test_date_chunks():
+    chunks = list(gen.iter_date_chunks((2000, 1, 1), (2000, 1, 10), '%Y%m%d', chunk_lines=4))
+    assert [chunk.count(b'\n') for chunk in chunks] == [4, 4, 2]
+    assert b''.join(chunks).decode().split('\n')[:-1] == reference_dates((2000, 1, 1), (2000, 1, 10), '%Y%m%d')
+    assert list(gen.iter_date_chunks((2000, 1, 2), (2000, 1, 1))) == []
+
+def test_years_before_1000_fall_back_to_strftime():
+    assert gen.get_date_range((999, 12, 30), (1000, 1, 1), '%Y-%m-%d') == reference_dates((999, 12, 30), (1000, 1, 1), '%Y-%m-%d')
+
+def test_ids():
+    chunks = list(gen.iter_id_chunks(['H', 'O', 'P'], 10, digits=10, chunk_lines=3, rng=np.random.default_rng(0)))
+    assert [chunk.count(b'\n') for chunk in chunks] == [3, 3, 3, 1]
+    ids = b''.join(chunks).decode().split('\n')[:-1]
+    assert len(ids) == 10
+    for line in ids:
+        assert len(line) == 11 and line[0] in 'HOP' and line[1] != '0' and line[1:].isdigit()
+    again = list(gen.iter_id_chunks(['H', 'O', 'P'], 10, digits=10, chunk_lines=3, rng=np.random.default_rng(0)))
+    assert again == chunks
+
+def test_digits_of_large_numbers():
+    values = np.array([10 ** 17, 123456789012345678, 999999999999999999], dtype=np.int64)
+    assert [bytes(row).decode() for row in gen._digits(values, 18)] == ['{:018d}'.format(int(v)) for v in values]
+
+def test_chunks_are_saved_like_joined_lines(tmp_path):
+    lines = ['a', 'bb', 'ccc']
+    gen.save_chunks(gen.iter_line_chunks(lines), 'chunks.txt', str(tmp_path))
+    gen.save_file('\n'.join(lines), 'text.txt', str(tmp_path))
+    assert (tmp_path / 'chunks.txt').read_bytes() == (tmp_path / 'text.txt').read_bytes()
+    gen.save_chunks(gen.iter_line_chunks([]), 'empty.txt', str(tmp_path))
+    assert (tmp_path / 'empty.txt').read_bytes() == b''
+
+def test_word_files(tmp_path, monkeypatch):
+    monkeypatch.chdir(str(tmp_path))
+    os.makedirs('data')
+    gen.gen_word_date('dates.txt', (2001, 1, 1), (2001, 12, 31))
+    with open(os.path.join('data', 'dates.txt')) as f:
+        dates = f.read().split('\n')
+    assert dates == reference_dates((2001, 1, 1), (2001, 12, 31), '%Y-%m-%d') + reference_dates((2001, 1, 1), (2001, 12, 31), '%Y.%m.%d')
+
+    gen.gen_word_sequence('sequence.txt', id_count=5, hot_id_count=7)
+    with open(os.path.join('data', 'sequence.txt')) as f:
+        words = f.read().split('\n')
+    assert len(words) == 148 + 31 + 5 + 7
+    assert words[:2] == ['1902', '1903'] and all(word[0] in 'HOP' for word in words[-7:])
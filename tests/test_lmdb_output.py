@@ -0,0 +1,56 @@
+import os
+
+import cv2
+import lmdb
+import numpy as np
+
+from create_dataset import LmdbWriter, createDatasetFromSamples, checkImageIsValid
+from generator import create_sample, encode_sample
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def read_dataset(path):
+    env = lmdb.open(path, readonly=True, lock=False)
+    with env.begin() as txn:
+        count = int(txn.get(b'num-samples'))
+        samples = [
+            (txn.get(b'image-%09d' % i), txn.get(b'label-%09d' % i).decode())
+            for i in range(1, count + 1)
+        ]
+    env.close()
+    return samples
+
+def test_samples_are_read_back(tmp_path):
+    font = sorted(os.listdir(os.path.join(ROOT, 'fonts')))[0]
+    samples = []
+    for i, text in enumerate(['un', 'deux mots', 'été']):
+        image = create_sample(text, font, 32, 0, False, 0, False, 1, font_dir=os.path.join(ROOT, 'fonts'))
+        samples.append((encode_sample(image, 'jpg'), text))
+
+    createDatasetFromSamples(str(tmp_path / 'lmdb'), samples, checkValid=True)
+    read = read_dataset(str(tmp_path / 'lmdb'))
+    assert read == samples
+    for image_bin, _ in read:
+        assert checkImageIsValid(image_bin)
+        assert cv2.imdecode(np.frombuffer(image_bin, np.uint8), cv2.IMREAD_GRAYSCALE).shape[0] == 32
+
+def test_run_writes_a_dataset(tmp_path, run_generator):
+    run_generator(tmp_path / 'images', '-l', 'fr', '-c', 12, '-t', 2, '-lm', tmp_path / 'lmdb')
+    samples = read_dataset(str(tmp_path / 'lmdb'))
+    assert len(samples) == 12
+    assert all(checkImageIsValid(image_bin) and label for image_bin, label in samples)
+    assert not os.path.exists(str(tmp_path / 'images')) or os.listdir(str(tmp_path / 'images')) == []
+
+def test_streamed_run_writes_a_dataset(tmp_path, run_generator):
+    run_generator(tmp_path / 'images', '-l', 'fr', '-c', 25, '-t', 3, '-st', '-cs', 2, '-lm', tmp_path / 'lmdb')
+    samples = read_dataset(str(tmp_path / 'lmdb'))
+    assert len(samples) == 25
+    assert all(checkImageIsValid(image_bin) and label for image_bin, label in samples)
+
+def test_shared_memory_gives_the_same_dataset(tmp_path, run_generator):
+    args = ['-l', 'fr', '-c', 30, '-t', 3, '-sd', 2, '-cs', 2]
+    run_generator(tmp_path / 'images', *args + ['-st', '-lm', tmp_path / 'pipe'])
+    # 4 KiB slots are too small for some samples, they go through the pipe instead
+    for size in (64, 4):
+        run_generator(tmp_path / 'images', *args + ['-sm', size, '-lm', tmp_path / 'shm{}'.format(size)])
+        assert read_dataset(str(tmp_path / 'shm{}'.format(size))) == read_dataset(str(tmp_path / 'pipe'))
@@ -0,0 +1,40 @@
+import random
+
+import numpy as np
+
+from noise_batch import NoiseBatch
+
+def test_distribution():
+    noise = NoiseBatch(size=1 << 16).get(100, 300).astype(np.float64)
+    assert noise.shape == (100, 300)
+    assert abs(noise.mean() - 235) < 0.5
+    assert abs(noise.std() - 10) < 0.5
+
+def test_views_of_one_buffer():
+    noise_batch = NoiseBatch(size=1000)
+    first = noise_batch.get(10, 20)
+    second = noise_batch.get(10, 20)
+    assert first.base is not None and np.shares_memory(first, noise_batch.buffer)
+    assert not np.shares_memory(first, second)
+
+def test_larger_than_the_buffer():
+    noise_batch = NoiseBatch(size=100)
+    noise = noise_batch.get(20, 30)
+    assert noise.shape == (20, 30)
+    assert not np.shares_memory(noise, noise_batch.buffer)
+
+def test_seeded_noise():
+    a = NoiseBatch(size=1000)
+    b = NoiseBatch(size=1000)
+    b.get(5, 5)
+    assert np.array_equal(a.get(10, 20, random.Random(3)), b.get(10, 20, random.Random(3)))
+    assert not np.array_equal(a.get(10, 20, random.Random(3)), a.get(10, 20, random.Random(4)))
+
+def test_out_of_range_draws_are_clipped():
+    # Half the draws are negative and half above 255
+    noise_batch = NoiseBatch(size=1 << 16, mean=128, deviation=1000)
+    noise = noise_batch.get(100, 300).astype(np.float64)
+    assert abs((noise == 0).mean() - 0.45) < 0.02
+    assert abs((noise == 255).mean() - 0.45) < 0.02
+    dark = NoiseBatch(size=1000, mean=-50, deviation=1).get(10, 20)
+    assert not dark.any()
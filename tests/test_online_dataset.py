@@ -0,0 +1,45 @@
+import os
+
+import numpy as np
+import pytest
+
+from online_dataset import OnlineDataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PARAMS = {'font_dir': os.path.join(ROOT, 'fonts'), 'background_type': 1}
+WORDS = ['un\n', 'deux\n', 'trois\n', 'quatre\n']
+
+def collect(dataset):
+    with dataset:
+        return sorted((label, image.tobytes(), image.shape) for image, label in dataset)
+
+def test_seeded_samples_do_not_depend_on_the_workers():
+    single = collect(OnlineDataset(lang_dict=WORDS, length=2, params=PARAMS, workers=1, seed=3, count=12))
+    several = collect(OnlineDataset(lang_dict=WORDS, length=2, params=PARAMS, workers=3, seed=3, count=12))
+    assert len(single) == 12
+    assert single == several
+    assert all(len(label.split(' ')) == 2 for label, _, _ in single)
+    assert all(shape[0] == 32 for _, _, shape in single)
+
+def test_lines_of_a_file(tmp_path):
+    path = tmp_path / 'lines.txt'
+    path.write_text('first\nsecond\nthird\n')
+    dataset = OnlineDataset(input_file=str(path), params=PARAMS, workers=2, seed=0, count=5, height=20)
+    assert len(dataset) == 5
+    labels = [label for label, _, _ in collect(dataset)]
+    assert sorted(labels) == sorted(['first', 'second', 'third', 'first', 'second'])
+
+def test_endless_dataset_is_closed():
+    dataset = OnlineDataset(lang_dict=WORDS, params=PARAMS, workers=2, queue_depth=4)
+    with dataset:
+        images = [dataset.get()[0] for _ in range(10)]
+        stats = dataset.stats()
+    assert all(image.dtype == np.uint8 for image in images)
+    assert stats['consumed'] == 10 and stats['produced'] >= 10
+    assert not dataset.processes
+    with pytest.raises(TypeError):
+        len(dataset)
+
+def test_one_text_source():
+    with pytest.raises(ValueError):
+        OnlineDataset()
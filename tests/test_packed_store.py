@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+
+from packed_store import PackedStore, PackedStoreWriter
+
+def test_samples_are_read_back(tmp_path):
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 256, size=(8, width), dtype=np.uint8) for width in (3, 10, 1, 7)]
+    labels = ['a', '', 'çà et là', 'last']
+
+    writer = PackedStoreWriter(str(tmp_path), 8)
+    for image, label in zip(images, labels):
+        writer.add(image, label)
+    assert writer.close() == 4
+
+    store = PackedStore(str(tmp_path))
+    assert len(store) == 4
+    assert store.widths().tolist() == [3, 10, 1, 7]
+    for i, (image, label) in enumerate(zip(images, labels)):
+        read_image, read_label = store[i]
+        assert np.array_equal(read_image, image)
+        assert read_label == label
+    assert store[-1][1] == 'last'
+    with pytest.raises(IndexError):
+        store[4]
+
+def test_raw_pixels_are_rows(tmp_path):
+    writer = PackedStoreWriter(str(tmp_path), 2)
+    writer.add_raw(bytes(range(6)), 'raw')
+    writer.close()
+    assert PackedStore(str(tmp_path)).image(0).tolist() == [[0, 1, 2], [3, 4, 5]]
+
+def test_wrong_height_is_rejected(tmp_path):
+    writer = PackedStoreWriter(str(tmp_path), 8)
+    with pytest.raises(ValueError):
+        writer.add(np.zeros((4, 5), np.uint8), 'label')
+    with pytest.raises(ValueError):
+        writer.add_raw(b'\0' * 9, 'label')
+
+def test_empty_store(tmp_path):
+    PackedStoreWriter(str(tmp_path), 8).close()
+    assert len(PackedStore(str(tmp_path))) == 0
+
+def test_packed_dataset_from_image_files(tmp_path):
+    import cv2
+    from create_dataset import createPackedDataset
+
+    paths = []
+    for name, shape in (('a', (8, 5)), ('b', (16, 6)), ('c', (8, 3))):
+        paths.append(str(tmp_path / (name + '.png')))
+        cv2.imwrite(paths[-1], np.full(shape, 200, np.uint8))
+    paths.append(str(tmp_path / 'missing.png'))
+    labels = ['a', 'b', 'c', 'missing']
+
+    assert createPackedDataset(str(tmp_path / 'first'), paths, labels) == 2
+    store = PackedStore(str(tmp_path / 'first'))
+    assert [store.label(i) for i in range(len(store))] == ['a', 'c']
+
+    assert createPackedDataset(str(tmp_path / 'resized'), paths, labels, height=4) == 3
+    store = PackedStore(str(tmp_path / 'resized'))
+    assert store.widths().tolist() == [2, 2, 2]
+    assert store.image(1).tolist() == [[200, 200]] * 4
+
+def test_run_packs_the_seeded_pixels(tmp_path, run_generator):
+    run_generator(tmp_path / 'files', '-l', 'fr', '-c', 6, '-sd', 4, '-e', 'npy', '-ch', 1)
+    run_generator(tmp_path / 'out', '-l', 'fr', '-c', 6, '-sd', 4, '-t', 3, '-pk', tmp_path / 'packed')
+    files = {}
+    for name in os.listdir(str(tmp_path / 'files')):
+        text, index = name[:-len('.npy')].rsplit('_', 1)
+        files[int(index)] = (np.load(str(tmp_path / 'files' / name)), text)
+
+    store = PackedStore(str(tmp_path / 'packed'))
+    assert len(store) == 6
+    for i in range(6):
+        image, label = store[i]
+        assert np.array_equal(image, files[i][0])
+        assert label == files[i][1]
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from multiprocessing import Pool
+
+from pool_utils import bounded_imap_unordered, in_index_order
+
+def square(x):
+    return x, x * x
+
+def test_bounded_imap_unordered():
+    with Pool(2) as pool:
+        results = sorted(bounded_imap_unordered(pool, square, range(100), chunksize=3, max_pending=8))
+    assert results == [(x, x * x) for x in range(100)]
+
+def test_window_is_bounded():
+    taken = []
+    ahead = []
+
+    def items():
+        for x in range(1000):
+            taken.append(x)
+            yield x
+
+    with Pool(2) as pool:
+        results = bounded_imap_unordered(pool, square, items(), chunksize=2, max_pending=10)
+        for consumed, _ in enumerate(results, 1):
+            if consumed % 100 == 0:
+                # Give the task feeder thread of the pool time to run ahead if it could
+                time.sleep(0.05)
+                ahead.append(len(taken) - consumed)
+    # The window, plus the item taken from the iterable that waits for a free slot
+    assert max(ahead) <= 10 + 1
+
+def slow_first(x):
+    if x == 0:
+        time.sleep(0.5)
+    return x, x * x
+
+def test_reordered_results_stay_in_the_window():
+    taken = []
+    when_first = []
+
+    def items():
+        for x in range(200):
+            taken.append(x)
+            yield x
+
+    results = []
+    with Pool(2) as pool:
+        for result in bounded_imap_unordered(pool, slow_first, items(), chunksize=1, max_pending=16, start=0):
+            if not results:
+                when_first.append(len(taken))
+            results.append(result)
+    assert results == [(x, x * x) for x in range(200)]
+    # While index 0 was slow, the results after it were held back inside the window
+    assert when_first[0] <= 16 + 1
+
+def test_in_index_order():
+    results = [(2, 'c'), (0, 'a'), (3, 'd'), (1, 'b')]
+    assert list(in_index_order(results)) == [(0, 'a'), (1, 'b'), (2, 'c'), (3, 'd')]
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from benchmark import quasicrystal_reference
+from generator import create_quasicrystal_background, quasicrystal
+
+@pytest.mark.parametrize('height, width, frequency, phase, rotation_count', [
+    (2, 2, 20.0, 0.0, 10),
+    (12, 40, 35.0, 1.5, 15),
+    (31, 17, 49.9, 6.2, 20),
+])
+def test_same_pixels_as_the_loop(height, width, frequency, phase, rotation_count):
+    expected = quasicrystal_reference(height, width, frequency, phase, rotation_count)
+    assert np.array_equal(quasicrystal(height, width, frequency, phase, rotation_count), expected)
+
+def test_background():
+    background = create_quasicrystal_background(10, 30)
+    assert background.mode == 'L'
+    assert background.size == (30, 10)
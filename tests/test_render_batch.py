@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+
+from generator import create_sample_array, render_batch, sample_seed
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+def test_padded_batch():
+    fonts = sorted(os.listdir(FONT_DIR))[:3]
+    texts = ['a', 'longer text', 'mid']
+    params = {'font_dir': FONT_DIR, 'seed': 4, 'start': 10, 'pad_value': 7, 'background_type': 1}
+    images, widths, labels = render_batch(texts, fonts, 32, params)
+
+    assert labels == texts
+    assert images.dtype == np.uint8
+    assert images.shape == (3, 32, widths.max())
+    for i, (image, width) in enumerate(zip(images, widths)):
+        sample = create_sample_array(texts[i], fonts[i], 32, 0, False, 0, False, 1, font_dir=FONT_DIR,
+                                     seed=sample_seed(4, 10 + i))
+        assert np.array_equal(image[:, :width], sample)
+        assert (image[:, width:] == 7).all()
+
+def test_buffer_is_reused():
+    font = sorted(os.listdir(FONT_DIR))[0]
+    first, _, _ = render_batch(['one', 'two'], font, 32, {'font_dir': FONT_DIR})
+    second, _, _ = render_batch(['three'], font, 32, {'font_dir': FONT_DIR})
+    assert np.shares_memory(first, second)
+
+def test_pil_engine():
+    font = sorted(os.listdir(FONT_DIR))[0]
+    images, widths, _ = render_batch(['pil'], font, 24, {'font_dir': FONT_DIR, 'engine': 'pil'})
+    assert images.shape == (1, 24, widths[0])
+
+def test_empty_batch():
+    images, widths, labels = render_batch([], 'unused.ttf', 32)
+    assert images.shape == (0, 32, 0)
+    assert len(widths) == 0 and labels == []
+
+def test_batch_padding_is_not_charged_to_a_sample(monkeypatch):
+    import timing
+
+    monkeypatch.setattr(timing, '_timer', None)
+    monkeypatch.setattr(timing, '_finalizer', None)
+    timing.enable_timing()
+    fonts = sorted(os.listdir(FONT_DIR))[:1]
+    render_batch(['a', 'bb', 'ccc'], fonts[0], 32, {'font_dir': FONT_DIR, 'seed': 1})
+    timer = timing._timer
+    # Nothing is left open for the next sample
+    assert timer.sample_seconds == 0.0
+
+    stages = timer.to_dict()['stages']
+    assert stages['batch']['count'] == 1
+    assert stages['total']['count'] == 3
+    sample_stages = sum(entry['seconds'] for name, entry in stages.items() if name not in ('total', 'batch'))
+    assert abs(stages['total']['seconds'] - sample_stages) < 1e-9
@@ -0,0 +1,11 @@
+import os
+
+def test_streamed_run_writes_every_file(tmp_path, run_generator):
+    run_generator(tmp_path, '-l', 'fr', '-c', 30, '-t', 3, '-st', '-cs', 4)
+    names = os.listdir(str(tmp_path))
+    assert len(names) == 30
+    assert sorted(int(name.rsplit('_', 1)[1].split('.')[0]) for name in names) == list(range(30))
+
+def test_numpy_engine_writes_every_file(tmp_path, run_generator):
+    run_generator(tmp_path, '-l', 'fr', '-c', 12, '-t', 2, '-en', 'numpy', '-b', 2)
+    assert len(os.listdir(str(tmp_path))) == 12
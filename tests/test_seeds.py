@@ -0,0 +1,111 @@
+import os
+import random
+import subprocess
+
+import numpy as np
+import pytest
+
+from generator import create_sample, sample_seed
+from pool_utils import shard_range
+
+FONT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'fonts')
+
+@pytest.mark.parametrize('count, shard_count', [(10, 1), (10, 3), (7, 7), (3, 5), (1000, 16)])
+def test_shards_cover_every_index_once(count, shard_count):
+    ranges = [shard_range(count, i, shard_count) for i in range(shard_count)]
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == count
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+    sizes = [end - start for start, end in ranges]
+    assert max(sizes) - min(sizes) <= 1
+
+def test_sample_seed():
+    assert sample_seed(1, 5) == sample_seed(1, 5)
+    assert sample_seed(1, 5, 'text') == sample_seed(1, 5, 'text')
+    seeds = {sample_seed(1, i) for i in range(1000)} | {sample_seed(2, i) for i in range(1000)}
+    assert len(seeds) == 2000
+    assert sample_seed(1, 5) != sample_seed(1, 5, 'text')
+
+@pytest.mark.parametrize('background_type', [0, 1, 2])
+def test_seeded_samples_do_not_depend_on_the_order(background_type):
+    font = sorted(os.listdir(FONT_DIR))[0]
+
+    def sample(i):
+        return np.asarray(create_sample('Lorem ipsum {}'.format(i), font, 32, 10, True, 1, True, background_type,
+                                        font_dir=FONT_DIR, seed=sample_seed(7, i)))
+
+    first = [sample(i) for i in range(3)]
+    # Draw from the global generators in between, seeded samples must not notice
+    random.random()
+    np.random.random()
+    assert all(np.array_equal(image, sample(i)) for i, image in reversed(list(enumerate(first))))
+
+def read_files(directory):
+    files = {}
+    for name in os.listdir(str(directory)):
+        if os.path.isdir(os.path.join(str(directory), name)):
+            continue
+        with open(os.path.join(str(directory), name), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+@pytest.mark.parametrize('background', [0, 1, 2])
+def test_runs_do_not_depend_on_the_workers(tmp_path, run_generator, background):
+    args = ['-l', 'fr', '-c', 24, '-sd', 3, '-b', background, '-k', 5, '-rk', '-bl', 1, '-rbl']
+    run_generator(tmp_path / 'single', '-t', 1, *args)
+    run_generator(tmp_path / 'pool', '-t', 3, *args)
+    run_generator(tmp_path / 'stream', '-t', 2, '-st', '-cs', 5, *args)
+    single = read_files(tmp_path / 'single')
+    assert len(single) == 24
+    assert read_files(tmp_path / 'pool') == single
+    assert read_files(tmp_path / 'stream') == single
+
+def test_background_pool_does_not_depend_on_the_workers(tmp_path, run_generator):
+    args = ['-l', 'fr', '-c', 24, '-sd', 3, '-b', 2, '-bp', 2]
+    run_generator(tmp_path / 'single', '-t', 1, *args)
+    run_generator(tmp_path / 'pool', '-t', 3, *args)
+    assert read_files(tmp_path / 'pool') == read_files(tmp_path / 'single')
+
+def test_seeded_background_pool_is_not_refreshed(tmp_path, run_generator):
+    from background_pool import BackgroundPool
+
+    # A refreshed texture would depend on the crops the worker made before
+    with pytest.raises(ValueError):
+        BackgroundPool(size=1, height=8, width=16, refresh_rate=2, seed=1)
+    with pytest.raises(subprocess.CalledProcessError):
+        run_generator(tmp_path, '-l', 'fr', '-c', 2, '-sd', 1, '-bp', 2, '-bpr', 10)
+    assert not os.listdir(str(tmp_path))
+
+def test_shards_make_up_the_whole_run(tmp_path, run_generator):
+    args = ['-l', 'fr', '-c', 20, '-sd', 5, '-t', 2]
+    run_generator(tmp_path / 'whole', *args)
+    shards = {}
+    for shard_index in range(3):
+        run_generator(tmp_path / 'shard{}'.format(shard_index), *args + ['-si', shard_index, '-sc', 3])
+        files = read_files(tmp_path / 'shard{}'.format(shard_index))
+        assert not set(files) & set(shards)
+        shards.update(files)
+    assert shards == read_files(tmp_path / 'whole')
+
+def test_task_grid_does_not_depend_on_the_workers(run_task_grid, tmp_path):
+    words = ['WORD{}'.format(i) for i in range(12)]
+    outputs = []
+    for thread_count in (1, 3):
+        out_dir = run_task_grid(words, '-t', thread_count, '-sd', 9)
+        outputs.append((read_files(os.path.join(out_dir, 'word_pyu')),
+                        read_files(out_dir)['image_list_word_pyu.txt']))
+        os.rename(out_dir, str(tmp_path / 'out2_{}'.format(thread_count)))
+        os.makedirs(out_dir)
+    assert outputs[0] == outputs[1]
+
+def test_task_grid_shards_concatenate(run_task_grid):
+    words = ['WORD{}'.format(i) for i in range(10)]
+    out_dir = run_task_grid(words, '-sd', 9)
+    whole = read_files(out_dir)
+    for shard_index in range(3):
+        run_task_grid(words, '-sd', 9, '-si', shard_index, '-sc', 3)
+    files = read_files(out_dir)
+    for kind in ('image', 'label'):
+        parts = [files['{}_list_word_pyu_{}of3.txt'.format(kind, k)].decode() for k in range(3)]
+        assert '\n'.join(parts).encode() == whole['{}_list_word_pyu.txt'.format(kind)]
@@ -0,0 +1,37 @@
+import threading
+
+from multiprocessing import Pool
+
+from shm_ring import SlotRing
+
+def write_into(args):
+    name, slot, data = args
+    ring = SlotRing(4, 16, name)
+    written = ring.write(slot, data)
+    ring.close()
+    return written
+
+def test_slots_are_shared_with_the_workers():
+    ring = SlotRing(4, 16)
+    try:
+        payloads = [b'zero', b'one', b'x' * 16, b'x' * 17]
+        with Pool(2) as pool:
+            written = pool.map(write_into, [(ring.name, slot, data) for slot, data in enumerate(payloads)])
+        assert written == [True, True, True, False]
+        for slot, data in enumerate(payloads[:3]):
+            view = ring.view(slot, len(data))
+            assert bytes(view) == data
+            view.release()
+    finally:
+        ring.close()
+
+def test_slots_bound_the_items_in_flight():
+    ring = SlotRing(2, 8)
+    try:
+        paired = ring.with_slots(range(3))
+        assert [next(paired), next(paired)] == [(0, 0), (1, 1)]
+        # Both slots are taken, the next item waits for one to be released
+        threading.Timer(0.05, ring.release, args=(1,)).start()
+        assert next(paired) == (1, 2)
+    finally:
+        ring.close()
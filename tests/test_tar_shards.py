@@ -0,0 +1,80 @@
+import json
+import os
+import tarfile
+
+from tar_shards import TarShardWriter
+
+def read_shard(path):
+    with tarfile.open(path) as tar:
+        return [(member.name, tar.extractfile(member).read()) for member in tar.getmembers()]
+
+def test_samples_are_read_back_in_order(tmp_path):
+    writer = TarShardWriter(str(tmp_path), max_count=2)
+    for i in range(5):
+        writer.add('{:09d}'.format(i), 'image {}'.format(i).encode(), 'jpg', 'label {}'.format(i))
+    assert writer.close() == 5
+
+    names = sorted(name for name in os.listdir(str(tmp_path)) if name.endswith('.tar'))
+    assert names == ['shard-000000.tar', 'shard-000001.tar', 'shard-000002.tar']
+    members = [member for name in names for member in read_shard(str(tmp_path / name))]
+    expected = []
+    for i in range(5):
+        expected.append(('{:09d}.jpg'.format(i), 'image {}'.format(i).encode()))
+        expected.append(('{:09d}.txt'.format(i), 'label {}'.format(i).encode()))
+    assert members == expected
+
+def test_index_lists_the_shards(tmp_path):
+    writer = TarShardWriter(str(tmp_path), prefix='train', max_count=3)
+    for i in range(4):
+        writer.add(str(i), b'x' * 10, 'png', 'é')
+    writer.close()
+
+    with open(str(tmp_path / 'train-index.json')) as f:
+        index = json.load(f)
+    assert index['samples'] == 4
+    assert [(shard['name'], shard['count'], shard['first_key'], shard['last_key']) for shard in index['shards']] == [
+        ('train-000000.tar', 3, '0', '2'),
+        ('train-000001.tar', 1, '3', '3'),
+    ]
+    for shard in index['shards']:
+        assert shard['bytes'] == os.path.getsize(str(tmp_path / shard['name']))
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+def test_max_bytes_starts_a_new_shard(tmp_path):
+    writer = TarShardWriter(str(tmp_path), max_count=100, max_bytes=4096)
+    for i in range(4):
+        writer.add(str(i), b'x' * 3000, 'jpg', 'label')
+    writer.close()
+    assert len([name for name in os.listdir(str(tmp_path)) if name.endswith('.tar')]) == 4
+
+def test_seeded_content_gives_the_same_shards(tmp_path):
+    for run in ('a', 'b'):
+        writer = TarShardWriter(str(tmp_path / run))
+        writer.add('0', b'image', 'jpg', 'label')
+        writer.close()
+    with open(str(tmp_path / 'a' / 'shard-000000.tar'), 'rb') as a, open(str(tmp_path / 'b' / 'shard-000000.tar'), 'rb') as b:
+        assert a.read() == b.read()
+
+def read_shards(directory):
+    names = sorted(name for name in os.listdir(directory) if name.endswith('.tar'))
+    return [member for name in names for member in read_shard(os.path.join(directory, name))]
+
+def test_run_writes_the_same_shards_with_every_pipeline(tmp_path, run_generator):
+    shards = []
+    for run, options in (('pipe', ['-t', 1]), ('slots', ['-t', 3, '-sm', 64])):
+        run_generator(tmp_path / 'out', '-l', 'fr', '-c', 7, '-sd', 5, '-ta', tmp_path / run, '-tc', 3, *options)
+        shards.append(read_shards(str(tmp_path / run)))
+    assert shards[0] == shards[1]
+    assert [name for name, _ in shards[0]][:2] == ['000000000.jpg', '000000000.txt']
+    assert len(shards[0]) == 14
+    assert len([name for name in os.listdir(str(tmp_path / 'pipe')) if name.endswith('.tar')]) == 3
+
+def test_task_grid_keys_samples_by_task(tmp_path, run_task_grid):
+    run_task_grid(['中文', '汉字'], '-sd', 2, '-ta', tmp_path / 'shards')
+    members = read_shards(str(tmp_path / 'shards'))
+    names = [name for name, _ in members]
+    assert names
+    assert all(name.startswith('word_pyu/') for name in names)
+    assert len([name for name in names if name.endswith('.txt')]) * 2 == len(names)
+    labels = set(data.decode('utf-8') for name, data in members if name.endswith('.txt'))
+    assert labels <= {'中文', '汉字'}
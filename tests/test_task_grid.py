@@ -0,0 +1,15 @@
+import os
+
+import pytest
+
+@pytest.mark.parametrize('thread_count', [1, 3])
+def test_manifests_follow_the_plan(run_task_grid, thread_count):
+    words = ['WORD{}'.format(i) for i in range(10)]
+    out_dir = run_task_grid(words, '-t', thread_count, '-cs', 2)
+
+    with open(os.path.join(out_dir, 'label_list_word_pyu.txt')) as f:
+        assert f.read().split('\n') == words
+    with open(os.path.join(out_dir, 'image_list_word_pyu.txt')) as f:
+        images = f.read().split('\n')
+    assert [image.split('/')[1].split('_')[0] for image in images] == [str(i) for i in range(10)]
+    assert sorted(os.listdir(os.path.join(out_dir, 'word_pyu'))) == sorted(image.split('/')[1] for image in images)
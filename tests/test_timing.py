@@ -0,0 +1,116 @@
+import json
+import os
+import time
+import tracemalloc
+
+import numpy as np
+import pytest
+
+import timing
+from timing import (BUCKETS_US, collect_timings, end_sample, enable_timing, flush_timing, format_timings, merge_timings, stage,
+                    write_timings)
+
+@pytest.fixture
+def timer(monkeypatch, tmp_path):
+    monkeypatch.setattr(timing, '_timer', None)
+    monkeypatch.setattr(timing, '_finalizer', None)
+    enable_timing(str(tmp_path / 'parts'))
+    yield timing._timer
+    timing._finalizer.cancel()
+
+@pytest.fixture(params=['reset_peak', 'clear_traces'])
+def memory_timer(monkeypatch, request):
+    if request.param == 'clear_traces':
+        # Python 3.8 has no tracemalloc.reset_peak
+        monkeypatch.delattr(tracemalloc, 'reset_peak', raising=False)
+    monkeypatch.setattr(timing, '_timer', None)
+    monkeypatch.setattr(timing, '_finalizer', None)
+    enable_timing(memory=True)
+    yield timing._timer
+    tracemalloc.stop()
+
+def test_disabled_stages_do_nothing(monkeypatch):
+    monkeypatch.setattr(timing, '_timer', None)
+    with stage('rotate'):
+        pass
+    end_sample(background=0)
+    assert not timing.timing_enabled()
+
+def test_stages_and_samples(timer):
+    for background in (0, 0, 2):
+        with stage('rotate'):
+            time.sleep(0.002)
+        with stage('blur'):
+            pass
+        end_sample(background=background, font='a.ttf')
+
+    stages = timer.to_dict()['stages']
+    assert stages['rotate']['count'] == stages['blur']['count'] == stages['total']['count'] == 3
+    assert stages['rotate']['seconds'] >= 0.006
+    assert stages['total']['seconds'] == pytest.approx(stages['rotate']['seconds'] + stages['blur']['seconds'])
+    assert sum(stages['rotate']['histogram']) == 3
+    groups = timer.to_dict()['groups']
+    assert (groups['background=0']['count'], groups['background=2']['count'], groups['font=a.ttf']['count']) == (2, 1, 3)
+
+def test_parts_are_merged(timer, tmp_path):
+    with stage('write'):
+        pass
+    end_sample()
+    flush_timing()
+    with open(str(tmp_path / 'parts' / 'other.txt'), 'w') as f:
+        f.write('not a part')
+
+    merged = collect_timings(str(tmp_path / 'parts'))
+    assert merged['stages']['write']['count'] == 1
+    twice = merge_timings([merged, merged])
+    assert twice['stages']['write']['count'] == 2
+    assert twice['stages']['write']['histogram'] == [2 * count for count in merged['stages']['write']['histogram']]
+
+    table = write_timings(twice, str(tmp_path / 'timing.json'))
+    assert 'write' in table and 'total' in table
+    with open(str(tmp_path / 'timing.json')) as f:
+        assert json.load(f)['buckets_us'] == BUCKETS_US
+
+def test_stage_memory_is_its_peak(memory_timer):
+    mib = 1024 * 1024
+    with stage('outer'):
+        kept = np.ones(2 * mib, np.uint8)
+        with stage('inner'):
+            # Freed before the stage ends, only the peak sees it
+            np.ones(4 * mib, np.uint8).sum()
+        with stage('small'):
+            pass
+    end_sample()
+    del kept
+
+    stages = memory_timer.to_dict()['stages']
+    assert 4 * mib <= stages['inner']['peak_bytes'] < 5 * mib
+    assert stages['small']['peak_bytes'] < mib
+    # The outer stage holds its own buffer and the peak of the inner one
+    assert 6 * mib <= stages['outer']['peak_bytes'] < 7 * mib
+    assert stages['total']['peak_bytes'] == 0
+    rows = dict((line.split()[0], line.split()[-1]) for line in format_timings(memory_timer.to_dict()).splitlines() if line)
+    assert float(rows['inner']) >= 4096 and rows['total'] == '-'
+
+def test_peak_is_only_shown_when_traced(timer):
+    with stage('rotate'):
+        np.ones(1024 * 1024, np.uint8)
+    end_sample()
+    assert timer.to_dict()['stages']['rotate']['peak_bytes'] == 0
+    rows = dict((line.split()[0], line.split()[-1]) for line in format_timings(timer.to_dict()).splitlines() if line)
+    assert rows['rotate'] == '-'
+    assert not tracemalloc.is_tracing()
+
+def test_run_writes_the_timings(tmp_path, run_generator):
+    run_generator(tmp_path / 'images', '-l', 'fr', '-c', 10, '-t', 2, '-tm', tmp_path / 'timing.json')
+    with open(str(tmp_path / 'timing.json')) as f:
+        timings = json.load(f)
+    assert timings['stages']['total']['count'] == 10
+    assert {'font_load', 'text_draw', 'background', 'resize', 'write'} <= set(timings['stages'])
+
+def test_run_traces_the_stage_memory(tmp_path, run_generator):
+    run_generator(tmp_path / 'images', '-l', 'fr', '-c', 6, '-t', 2, '-b', 0, '-tm', tmp_path / 'timing.json', '-tmm')
+    with open(str(tmp_path / 'timing.json')) as f:
+        stages = json.load(f)['stages']
+    # The gaussian noise background is a NumPy buffer
+    assert stages['background']['peak_bytes'] > 0
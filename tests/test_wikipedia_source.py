@@ -0,0 +1,153 @@
+import os
+import re
+import threading
+import time
+
+import pytest
+
+from bs4 import BeautifulSoup
+from http.server import ThreadingHTTPServer
+
+from benchmark import WikipediaStandIn, wikipedia_reference
+from run import iter_strings_from_wikipedia
+from wikipedia_source import WikipediaSource, extract_sentences, html_to_text
+
+PAGE = '\n'.join([
+    '<html><head><title>A page</title><style>p { color: red }</style></head><body>',
+    '<script type="text/javascript">var a = "<b>not text</b>";</script>',
+    '<p>Caf&eacute; &amp; th&eacute; <a href="/x">in a link</a>, then more words</p>',
+    '<!-- a comment -->',
+    '<p>Second line of the page</p><p>glued line</p>',
+    '</body></html>',
+])
+
+def soup_text(page):
+    soup = BeautifulSoup(page, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.extract()
+    return soup.get_text()
+
+def test_text_matches_beautiful_soup():
+    assert html_to_text(PAGE) == soup_text(PAGE)
+
+def test_sentences_drop_short_lines_and_the_footer():
+    lines = ['<p>Sentence {} has quite a few words</p>'.format(i) for i in range(10)]
+    page = '\n'.join(['<p>Short</p>', '<p>About Wikipedia and its many words</p>'] + lines)
+    assert extract_sentences(page, 3) == ['Sentence {} has quite a few words'.format(i) for i in range(5)]
+    assert extract_sentences('<p>Short</p>', 3) == []
+
+@pytest.fixture
+def serve():
+    """
+        Start a local server with a request handler, returns its URL
+    """
+
+    servers = []
+
+    def start(handler):
+        handler.latency = 0.0
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return 'http://127.0.0.1:{}'.format(server.server_address[1])
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def base_url(serve):
+    return serve(WikipediaStandIn)
+
+def test_same_sentences_as_the_original_source(base_url):
+    # Every stand-in article has the same sentences but its number
+    number = re.compile(r'Article \d+ ')
+    reference = wikipedia_reference(1, 50, base_url)
+    sentences = list(iter_strings_from_wikipedia(1, 50, 'en', 4, None, base_url))
+    assert len(sentences) == 50
+    assert sorted(number.sub('', s) for s in sentences) == sorted(number.sub('', s) for s in reference)
+
+def test_pages_are_cached_and_read_back_first(tmp_path, base_url):
+    cache_dir = str(tmp_path / 'cache')
+    fetched = list(iter_strings_from_wikipedia(1, 60, 'en', 4, cache_dir, base_url))
+    names = os.listdir(os.path.join(cache_dir, 'en'))
+    assert names and all(name.endswith('.html') for name in names)
+
+    source = WikipediaSource('en', 4, cache_dir, base_url)
+    cached = [sentence for page in source.cached_pages() for sentence in extract_sentences(page, 1)]
+    assert len(cached) >= len(fetched)
+    assert set(fetched) <= set(cached)
+    # The cached pages come first, in the same order every time
+    assert list(iter_strings_from_wikipedia(1, len(cached), 'en', 4, cache_dir, base_url)) == cached
+    assert len(os.listdir(os.path.join(cache_dir, 'en'))) == len(names)
+
+def test_a_page_is_handed_out_once(base_url):
+    pages = WikipediaSource('en', 4, base_url=base_url).pages()
+    titles = [re.search(r'<title>(.*?)</title>', next(pages)).group(1) for _ in range(20)]
+    pages.close()
+    assert len(set(titles)) == 20
+
+class FlakyStandIn(WikipediaStandIn):
+    """
+        Fail the first few random page requests like a rate limited Wikipedia
+    """
+
+    failures = 0
+
+    def do_GET(self):
+        if self.path.endswith('/Special:Random'):
+            with self.lock:
+                FlakyStandIn.failures -= 1
+                failing = FlakyStandIn.failures >= 0
+            if failing:
+                self.send_response(429)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        WikipediaStandIn.do_GET(self)
+
+class SameArticleStandIn(WikipediaStandIn):
+    def do_GET(self):
+        if self.path.endswith('/Special:Random'):
+            self.send_response(302)
+            self.send_header('Location', '/wiki/Article_1')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        WikipediaStandIn.do_GET(self)
+
+def test_failed_fetches_are_retried(serve, capsys):
+    FlakyStandIn.failures = 5
+    source = WikipediaSource('en', 2, base_url=serve(FlakyStandIn), backoff=0.01, max_errors=10)
+    pages = source.pages()
+    assert len([next(pages) for _ in range(3)]) == 3
+    pages.close()
+    assert capsys.readouterr().out.count('retrying') == 5
+
+def test_too_many_failures_in_a_row(serve):
+    FlakyStandIn.failures = 1000
+    source = WikipediaSource('en', 2, base_url=serve(FlakyStandIn), backoff=0.01, max_errors=4)
+    with pytest.raises(Exception, match='4 times in a row'):
+        next(source.pages())
+
+def test_closing_does_not_wait_for_the_retries(serve, capsys):
+    FlakyStandIn.failures = 1
+    source = WikipediaSource('en', 2, base_url=serve(FlakyStandIn), backoff=30)
+    pages = source.pages()
+    output = ''
+    for _ in range(20):
+        next(pages)
+        output += capsys.readouterr().out
+        if 'retrying' in output:
+            break
+    assert 'retrying in 30.0s' in output
+    start = time.time()
+    pages.close()
+    assert time.time() - start < 5
+
+def test_endless_duplicates(serve):
+    source = WikipediaSource('en', 2, base_url=serve(SameArticleStandIn), max_duplicates=5)
+    pages = source.pages()
+    next(pages)
+    with pytest.raises(Exception, match='already used'):
+        next(pages)
@@ -0,0 +1,251 @@
+import json
+import os
+import time
+import tracemalloc
+
+from contextlib import contextmanager
+from multiprocessing import util
+
+# Histogram bucket upper bounds in microseconds (1us to ~16s), the last bucket takes the rest
+BUCKETS_US = [2 ** i for i in range(25)]
+
+# Timer of the current process, None when timing is disabled
+_timer = None
+_finalizer = None
+
+
+class StageTimer(object):
+    """
+        Accumulate the wall time of the stages of every sample created by the current process.
+        With memory, the peak memory of every stage above what was allocated when it started is
+        also measured with tracemalloc, which sees the NumPy buffers (and the OpenCV outputs,
+        which are NumPy arrays) as well as the temporaries freed before the stage ends. Tracing
+        slows allocations down, so the times are only comparable between runs that trace or not.
+    """
+
+    def __init__(self, memory=False):
+        self.stages = {}
+        self.groups = {}
+        self.sample_seconds = 0.0
+        self.memory = memory
+        # [start bytes, peak bytes] of the stages currently open, outermost first
+        self.open_stages = []
+        # Bytes of the traces cleared by _reset_peak on Python 3.8, added back to the traced memory
+        self.cleared_bytes = 0
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _record(self, table, name, seconds, peak_bytes):
+        entry = table.get(name)
+        if entry is None:
+            entry = {'count': 0, 'seconds': 0.0, 'peak_bytes': 0, 'histogram': [0] * (len(BUCKETS_US) + 1)}
+            table[name] = entry
+        entry['count'] += 1
+        entry['seconds'] += seconds
+        entry['peak_bytes'] += peak_bytes
+        micro = seconds * 1e6
+        bucket = 0
+        while bucket < len(BUCKETS_US) and micro > BUCKETS_US[bucket]:
+            bucket += 1
+        entry['histogram'][bucket] += 1
+
+    def _traced_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+        return current + self.cleared_bytes, peak + self.cleared_bytes
+
+    def _reset_peak(self):
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+            return
+        # Python 3.8 has no reset_peak: forget the traces, what they held is kept aside. The
+        # blocks freed afterwards that were allocated before are not subtracted any more, so
+        # the peaks may come out a bit higher than with reset_peak.
+        current, _ = tracemalloc.get_traced_memory()
+        self.cleared_bytes += current
+        tracemalloc.clear_traces()
+
+    def _fold_peak(self):
+        """
+            Pass the peak traced since the last reset to every open stage, then reset it
+        """
+
+        _, peak = self._traced_memory()
+        for memory in self.open_stages:
+            memory[1] = max(memory[1], peak)
+        self._reset_peak()
+
+    @contextmanager
+    def stage(self, name, in_sample=True):
+        if self.memory:
+            # The stages may be nested, the peak of an outer stage is kept before it is reset
+            self._fold_peak()
+            current, _ = self._traced_memory()
+            self.open_stages.append([current, current])
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            if in_sample:
+                self.sample_seconds += seconds
+            peak_bytes = 0
+            if self.memory:
+                self._fold_peak()
+                stage_start, stage_peak = self.open_stages.pop()
+                peak_bytes = stage_peak - stage_start
+            self._record(self.stages, name, seconds, peak_bytes)
+
+    def end_sample(self, **tags):
+        """
+            Close the current sample, its total time is also recorded for every tag (e.g. background=2)
+        """
+
+        self._record(self.stages, 'total', self.sample_seconds, 0)
+        for key, value in sorted(tags.items()):
+            self._record(self.groups, '{}={}'.format(key, value), self.sample_seconds, 0)
+        self.sample_seconds = 0.0
+
+    def to_dict(self):
+        return {'stages': self.stages, 'groups': self.groups}
+
+
+@contextmanager
+def _no_stage():
+    yield
+
+
+def stage(name, in_sample=True):
+    """
+        Time a stage of the current sample: with stage('rotate'): ...
+        With in_sample=False, the stage is work shared by several samples (e.g. padding a batch),
+        it is recorded on its own and not added to the total of the current sample.
+    """
+
+    return _timer.stage(name, in_sample) if _timer is not None else _no_stage()
+
+
+def end_sample(**tags):
+    if _timer is not None:
+        _timer.end_sample(**tags)
+
+
+def timing_enabled():
+    return _timer is not None
+
+
+def enable_timing(parts_dir=None, memory=False):
+    """
+        Enable timing in the current process, and the peak memory of the stages with memory. When
+        parts_dir is set, the timings are written to parts_dir/timing-<pid>.json when the process
+        exits (or when flush_timing is called).
+    """
+
+    global _timer, _finalizer
+
+    _timer = StageTimer(memory)
+    if parts_dir is not None:
+        os.makedirs(parts_dir, exist_ok=True)
+        _finalizer = util.Finalize(None, _dump, args=(parts_dir,), exitpriority=10)
+
+
+def flush_timing():
+    """
+        Write the timings of the current process now instead of at exit
+    """
+
+    if _finalizer is not None:
+        _finalizer()
+
+
+def _dump(parts_dir):
+    with open(os.path.join(parts_dir, 'timing-{}.json'.format(os.getpid())), 'w') as f:
+        json.dump(_timer.to_dict(), f)
+
+
+def merge_timings(parts):
+    """
+        Sum the timings of several processes
+    """
+
+    merged = {'stages': {}, 'groups': {}}
+    for part in parts:
+        for table in ('stages', 'groups'):
+            for name, entry in part[table].items():
+                into = merged[table].get(name)
+                if into is None:
+                    merged[table][name] = {
+                        'count': entry['count'],
+                        'seconds': entry['seconds'],
+                        'peak_bytes': entry['peak_bytes'],
+                        'histogram': list(entry['histogram']),
+                    }
+                else:
+                    into['count'] += entry['count']
+                    into['seconds'] += entry['seconds']
+                    into['peak_bytes'] += entry['peak_bytes']
+                    into['histogram'] = [a + b for a, b in zip(into['histogram'], entry['histogram'])]
+    return merged
+
+
+def collect_timings(parts_dir):
+    """
+        Merge the timings written by the workers in parts_dir
+    """
+
+    parts = []
+    for name in sorted(os.listdir(parts_dir)):
+        if name.startswith('timing-') and name.endswith('.json'):
+            with open(os.path.join(parts_dir, name), 'r') as f:
+                parts.append(json.load(f))
+    return merge_timings(parts)
+
+
+def _percentile_ms(histogram, fraction):
+    """
+        Upper bound in milliseconds of the histogram bucket holding the given fraction of the samples
+    """
+
+    target = fraction * sum(histogram)
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return BUCKETS_US[min(bucket, len(BUCKETS_US) - 1)] / 1000.0
+    return 0.0
+
+
+def format_timings(timings):
+    """
+        Format the timings as a table, stages first then the sample totals per tag
+    """
+
+    total = timings['stages'].get('total', {}).get('seconds', 0.0) or 1e-9
+    # The peaks are all 0 when the memory was not traced
+    memory = any(entry['peak_bytes'] for entry in timings['stages'].values())
+    lines = ['{:<32} {:>9} {:>11} {:>10} {:>10} {:>7} {:>10}'.format(
+        'stage', 'count', 'total (s)', 'mean (ms)', 'p95 (ms)', 'share', 'peak (KiB)'
+    )]
+    for table in ('stages', 'groups'):
+        for name, entry in sorted(timings[table].items(), key=lambda item: -item[1]['seconds']):
+            count = max(entry['count'], 1)
+            lines.append('{:<32} {:>9} {:>11.3f} {:>10.3f} {:>10.3f} {:>6.1f}% {:>10}'.format(
+                name,
+                entry['count'],
+                entry['seconds'],
+                entry['seconds'] / count * 1000,
+                _percentile_ms(entry['histogram'], 0.95),
+                entry['seconds'] / total * 100,
+                '{:.1f}'.format(entry['peak_bytes'] / count / 1024) if memory and table == 'stages' and name != 'total' else '-',
+            ))
+        lines.append('')
+    return '\n'.join(lines)
+
+
+def write_timings(timings, path):
+    """
+        Write the timings as JSON, with the histogram bucket bounds, and return the table
+    """
+
+    with open(path, 'w') as f:
+        json.dump(dict(timings, buckets_us=BUCKETS_US), f, indent=2)
+    return format_timings(timings)
@@ -0,0 +1,172 @@
+import hashlib
+import html
+import os
+import re
+import threading
+import time
+import requests
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+
+# What html.parser would not hand to get_text: scripts, styles and comments
+_SKIPPED = re.compile(r'<(script|style)\b.*?</\1\s*>|<!--.*?-->', re.S | re.I)
+_TAG = re.compile(r'<[^>]*>')
+_WORD = re.compile(r"[\w']+")
+
+def html_to_text(page):
+    """
+        Return the text of an HTML page without its tags, scripts, styles and comments. The line
+        breaks of the source are kept like BeautifulSoup's get_text does, but with a few regular
+        expressions instead of building a parse tree in pure Python.
+    """
+
+    return html.unescape(_TAG.sub('', _SKIPPED.sub('', page)))
+
+def extract_sentences(page, minimum_length):
+    """
+        Return the lines of a Wikipedia page that have more than minimum_length words, without
+        the last ones that talk about contributing
+    """
+
+    lines = [' '.join(_WORD.findall(s.strip()))[0:200] for s in html_to_text(page).splitlines()]
+    lines = [
+        s for s in lines
+        if len(s.split(' ')) > minimum_length and not "Wikipedia" in s and not "wikipedia" in s
+    ]
+    return lines[0:max([1, len(lines) - 5])]
+
+class WikipediaSource(object):
+    """
+        Fetch random Wikipedia pages from a few threads, each keeping its HTTP connections alive
+        in its own session. Every page is saved as is in the cache directory, the pages of the
+        cache are handed out first on the next runs and new ones are only fetched once they are
+        used up.
+
+        A failed request (timeout, rate limit, server error...) is logged and retried after a
+        delay that doubles with every failure in a row, up to max_backoff seconds.
+    """
+
+    def __init__(self, lang='en', concurrency=8, cache_dir=None, base_url=None, timeout=30,
+                 backoff=1.0, max_backoff=60.0, max_errors=100, max_duplicates=1000):
+        """
+            lang           : language of the Wikipedia
+            concurrency    : number of pages fetched at the same time
+            cache_dir      : (optional) directory of the raw pages, one subdirectory per language
+            base_url       : (optional) server to fetch from instead of https://{lang}.wikipedia.org
+            timeout        : timeout of a request in seconds
+            backoff        : delay before retrying after a first failed request, in seconds
+            max_backoff    : longest delay between two retries
+            max_errors     : give up after this many failed requests in a row
+            max_duplicates : give up after this many pages in a row that were already handed out
+        """
+
+        self.random_url = (base_url or 'https://{}.wikipedia.org'.format(lang)).rstrip('/') + '/wiki/Special:Random'
+        self.concurrency = concurrency
+        self.cache_dir = os.path.join(cache_dir, lang) if cache_dir else None
+        self.timeout = timeout
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_errors = max_errors
+        self.max_duplicates = max_duplicates
+        self.stopped = threading.Event()
+        self.local = threading.local()
+        self.seen = set()
+        if self.cache_dir is not None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _session(self):
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', HTTPAdapter(pool_maxsize=1))
+            session.mount('https://', HTTPAdapter(pool_maxsize=1))
+            self.local.session = session
+        return session
+
+    def _fetch(self, delay=0):
+        """
+            Fetch a random page after waiting delay seconds, returns the key of its final URL and its text
+        """
+
+        if delay > 0 and self.stopped.wait(delay):
+            return None, None
+        page = self._session().get(self.random_url, timeout=self.timeout)
+        page.raise_for_status()
+        key = hashlib.blake2b(page.url.encode(), digest_size=16).hexdigest()
+        if self.cache_dir is not None:
+            path = os.path.join(self.cache_dir, key + '.html')
+            if not os.path.exists(path):
+                with open(path + '.tmp', 'w', encoding='utf-8') as f:
+                    f.write(page.text)
+                os.replace(path + '.tmp', path)
+        return key, page.text
+
+    def cached_pages(self):
+        """
+            Yield the pages of the cache, in the same order on every run
+        """
+
+        if self.cache_dir is None:
+            return
+        for name in sorted(os.listdir(self.cache_dir)):
+            if not name.endswith('.html'):
+                continue
+            self.seen.add(name[:-len('.html')])
+            with open(os.path.join(self.cache_dir, name), 'r', encoding='utf-8') as f:
+                yield f.read()
+
+    def fetched_pages(self):
+        """
+            Endlessly yield new random pages as they arrive, a page already handed out is skipped
+        """
+
+        errors = 0
+        duplicates = 0
+        self.stopped.clear()
+        with ThreadPoolExecutor(self.concurrency) as executor:
+            pending = set(executor.submit(self._fetch) for _ in range(self.concurrency))
+            try:
+                while True:
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        try:
+                            key, text = future.result()
+                        except requests.RequestException as e:
+                            errors += 1
+                            if errors >= self.max_errors:
+                                raise Exception("Could not fetch a Wikipedia page {} times in a row".format(errors)) from e
+                            delay = min(self.backoff * 2 ** (errors - 1), self.max_backoff)
+                            print('Could not fetch a Wikipedia page ({}), retrying in {:.1f}s'.format(e, delay))
+                            pending.add(executor.submit(self._fetch, delay))
+                            continue
+                        errors = 0
+                        pending.add(executor.submit(self._fetch))
+                        if key in self.seen:
+                            duplicates += 1
+                            if duplicates >= self.max_duplicates:
+                                raise Exception("The last {} Wikipedia pages were all already used".format(duplicates))
+                            continue
+                        duplicates = 0
+                        self.seen.add(key)
+                        yield text
+            finally:
+                # Only the requests already running are waited for, the ones waiting to be retried stop
+                self.stopped.set()
+                for future in pending:
+                    future.cancel()
+
+    def pages(self):
+        for page in self.cached_pages():
+            yield page
+        for page in self.fetched_pages():
+            yield page
+
+    def sentences(self, minimum_length):
+        """
+            Endlessly yield the sentences of the pages as they arrive
+        """
+
+        for page in self.pages():
+            for sentence in extract_sentences(page, minimum_length):
+                yield sentence